@@ -1,19 +1,39 @@
 import os
-import ssl
 import json
+import time
 import logging
 import asyncio
-import certifi
-import websockets
-import requests
+
+STARTED_AT = time.monotonic()  # before the slow imports, for the time to first frame
+
+from collections import Counter
+from html import escape
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
-from telegram.ext import Application, CommandHandler, ContextTypes
-from db import TokenConfig
-from telegram.error import Conflict
-from xrpl.clients import JsonRpcClient
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, ChatMemberHandler, ContextTypes
+from db import open_config
+from market import MarketCapProvider, PriceEngine
+from notifier import Notifier, Job, BIG_BUY_XRP
+from pipeline import Pipeline, Buy
+from stream import SubscriptionManager, StreamState, backfill
+from connection import ConnectionManager, RIPPLE_EPOCH
+from history import TradeHistory
+from deltas import transaction_changes, ledger_changes
+from metrics import Metrics, SamplingProfiler, METRICS_PORT
+from admins import AdminCache, ChatTitles
+from aggregate import Aggregator
+from fastmode import FastAlerts
+from routing import Router, decode_currency
+from rpc import JsonRpcClient
+from holders import Holdings
+from board import Boards, BOARD_SIZE, BOARD_MAX_SIZE, BOARD_INTERVAL
+from telegram.error import Conflict, BadRequest, TelegramError
+
+try:
+    from orjson import loads as json_loads  # Optional, much faster decoding
+except ImportError:
+    json_loads = json.loads
 
-client = JsonRpcClient("https://s.altnet.rippletest.net:51234")  # Use the appropriate URL for your network
 load_dotenv()
 
 # Logging setup
@@ -26,194 +46,792 @@ logger = logging.getLogger("BuyBot")
 # Bot Configuration
 TOKEN = os.getenv("TOKEN")
 XRPL_WS_URL = os.getenv('XRPL_WS_URL')
+XRPL_WS_URLS = [url.strip() for url in os.getenv('XRPL_WS_URLS', XRPL_WS_URL or '').split(',') if url.strip()]
+XRPL_HOT_STANDBY = os.getenv('XRPL_HOT_STANDBY', 'false').lower() == 'true'
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # Optional, e.g. a local Bot API server
 OWNER_ID = int(os.getenv('OWNER_ID'))
-
-config = TokenConfig()
+XRPL_RECORD_FILE = os.getenv('XRPL_RECORD_FILE')  # Optional, capture raw frames for replay.py
+ADMIN_STATUS_TIMEOUT = float(os.getenv('ADMIN_STATUS_TIMEOUT', '0.8'))
+MESSAGE_LIMIT = 4000  # Telegram allows 4096 characters, keep some margin
+# 'all' runs everything in one process; 'ingest' streams, classifies and handles
+# commands while 'worker' processes (one per SHARD_ID) send the notifications
+BOT_ROLE = os.getenv('BOT_ROLE', 'all')
+SHARD_ID = int(os.getenv('SHARD_ID', '0'))
+# Alert on proposed transactions and fix the message up on validation (single process only)
+FAST_MODE = os.getenv('FAST_MODE', 'false').lower() == 'true' and BOT_ROLE == 'all'
+# Optional webhook mode (needs python-telegram-bot[webhooks]); polling is used when unset
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')  # public base URL, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Commands plus the membership changes that keep the admin cache fresh
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_MEMBER, Update.MY_CHAT_MEMBER]
+
+config = open_config(read_only=BOT_ROLE == 'worker')
+router = Router(config)
+market_caps = {}
+market_cap_sources = Counter()
+prices = PriceEngine()
+notifier = Notifier()
+pipeline = Pipeline()
+subscriptions = SubscriptionManager(proposed=FAST_MODE)
+stream_state = StreamState()
+history = TradeHistory()
+aggregator = Aggregator()
+fast_alerts = FastAlerts()
+rpc = JsonRpcClient()
+holders = Holdings(rpc)
+boards = Boards()
+recorder = None
+if XRPL_RECORD_FILE:
+    from replay import FrameRecorder  # Only needed while capturing
+    recorder = FrameRecorder(XRPL_RECORD_FILE)
+connections = ConnectionManager(
+    XRPL_WS_URLS, recorder.wrap(pipeline.push) if recorder else pipeline.push,
+    hot_standby=XRPL_HOT_STANDBY, started_at=STARTED_AT
+)
+metrics = Metrics()
+profiler = SamplingProfiler()
+admins = AdminCache()
+chat_titles = ChatTitles()
+broker = shard_ring = None
+if BOT_ROLE != 'all':
+    from shard import ShardRing, open_broker  # Pulls in redis, only for sharded deployments
+    broker = open_broker()
+    shard_ring = ShardRing()
 ws_task = None
 
+def get_market_cap_provider(token):
+    """Get the HTTP market cap provider for an (issuer, currency) pair."""
+    provider = market_caps.get(token)
+    if provider is None:
+        provider = market_caps[token] = MarketCapProvider(*token)
+    return provider
+
+async def get_market_cap(token):
+    """Market cap in USD from ledger data, falling back to the token-activity API until it is known."""
+    market_cap = prices.market_cap_usd(token)
+    if market_cap is not None:
+        market_cap_sources["ledger"] += 1
+        return market_cap
+    market_cap_sources["api"] += 1
+    prices.track(token)
+    return await get_market_cap_provider(token).get()
+
+def current_market_cap(token):
+    """Market cap in USD for a notification, None until ledger data or the API knows it.
+
+    Notifications never wait on the token-activity API: a miss starts a lookup
+    in the background and the buys after it get its value.
+    """
+    market_cap = prices.market_cap_usd(token)
+    if market_cap is not None:
+        market_cap_sources["ledger"] += 1
+        return market_cap
+    market_cap_sources["api"] += 1
+    prices.track(token)
+    return get_market_cap_provider(token).peek()
+
+def market_cap_line(market_cap, decimals=3):
+    """The MC line of a message, left out while the market cap is unknown."""
+    return f"🧢 <b>MC:</b> ${market_cap:,.{decimals}f} USD\n" if market_cap is not None else ""
+
+def collect_metrics():
+    """Metric families for the /metrics endpoint, read from the live objects."""
+    stages = {"classify": pipeline.ingest, "dispatch": pipeline.dispatcher}
+    endpoints = connections.status()
+    yield ("buybot_frames_received_total", "counter", "Stream frames received",
+           [({}, pipeline.received)])
+    yield ("buybot_frames_dropped_total", "counter", "Frames or buys dropped by a full stage queue",
+           [({"stage": name}, stage.dropped) for name, stage in stages.items()])
+    yield ("buybot_frames_classified_total", "counter", "Stream frames classified",
+           [({}, pipeline.ingest.processed)])
+    yield ("buybot_buys_detected_total", "counter", "Buys of a monitored token above at least one threshold",
+           [({}, pipeline.buys)])
+    yield ("buybot_stage_queue_depth", "gauge", "Items waiting in a pipeline stage",
+           [({"stage": name}, stage.queue.qsize()) for name, stage in stages.items()])
+    yield ("buybot_stage_latency_seconds", "histogram", "Time from frame receipt to the end of a stage",
+           [({"stage": name}, stage.latency) for name, stage in stages.items()]
+           + [({"stage": "telegram"}, notifier.latency)])
+    yield ("buybot_notifications_total", "counter", "Telegram notifications by chat and outcome",
+           [({"chat_id": chat_id, "result": result}, count)
+            for result, counts in notifier.by_chat.items() for chat_id, count in counts.items()])
+    yield ("buybot_notifications_pending", "gauge", "Telegram messages waiting to be sent",
+           [({}, notifier.pending())])
+    yield ("buybot_xrpl_connected", "gauge", "Whether an endpoint carries a live subscription",
+           [({"url": endpoint["url"]}, int(endpoint["connected"])) for endpoint in endpoints])
+    yield ("buybot_xrpl_reconnects_total", "counter", "Connections made to an endpoint",
+           [({"url": endpoint["url"]}, endpoint["reconnects"]) for endpoint in endpoints])
+    yield ("buybot_xrpl_ledger_lag_seconds", "gauge", "Ledger close time to receipt",
+           [({"url": endpoint["url"]}, endpoint["ledger_lag"]) for endpoint in endpoints
+            if endpoint["ledger_lag"] is not None])
+    yield ("buybot_xrpl_ping_seconds", "gauge", "Websocket ping round-trip (EWMA)",
+           [({"url": endpoint["url"]}, endpoint["latency"]) for endpoint in endpoints
+            if endpoint["latency"] is not None])
+    if connections.first_frame_at is not None:
+        yield ("buybot_time_to_first_frame_seconds", "gauge", "Process start to the first XRPL frame",
+               [({}, connections.first_frame_at - STARTED_AT)])
+    yield ("buybot_board_edits_total", "counter", "Board refreshes by outcome",
+           [({"result": "edited"}, boards.edits), ({"result": "unchanged"}, boards.unchanged)])
+    yield ("buybot_holder_cache_total", "counter", "Wallet balance lookups by result",
+           [({"result": result}, count) for result, count in holders.cache.items()])
+    yield ("buybot_holder_cache_size", "gauge", "Wallet balances held in the cache",
+           [({}, len(holders))])
+    yield ("buybot_market_cap_lookups_total", "counter", "Market cap lookups by source",
+           [({"source": source}, count) for source, count in market_cap_sources.items()])
+    yield ("buybot_market_cap_api_cache_total", "counter", "Token-activity API cache lookups by result",
+           [({"result": result}, sum(provider.cache[result] for provider in market_caps.values()))
+            for result in ("hit", "stale", "miss")])
+
+def encode_currency(currency_code):
+    """Convert a ticker to the 40-char hex currency code used on the ledger."""
+    if len(currency_code) == 3:  # Standard currency code
+        return currency_code
+    if len(currency_code) == 40:  # Already hex
+        return currency_code.upper()
+    return currency_code.encode('utf-8').hex().upper().ljust(40, '0')
+
 async def error_handler(update, context):
     if isinstance(context.error, Conflict):
         logger.error("Conflict error: Make sure only one bot instance is running.")
     else:
         logger.error(f"Unhandled error: {context.error}")
 
-async def xrpl_stream(websocket):
-    """Stream transactions for the configured token."""
-    token_config = config.get_config()
-    
-    await websocket.send(json.dumps({
-        "command": "subscribe",
-        "accounts": [token_config['TOKEN_ISSUER']]
-    }))
-    logger.info(f"Subscribed to transactions for issuer: {token_config['TOKEN_ISSUER']}")
-
-    while True:
-        response = await websocket.recv()
-        await handle_transaction(response)
-
-async def maintain_websocket_connection():
-    """Maintain WebSocket connection with reconnection logic."""
-    while True:
-        try:
-            await start_ws_connection()
-        except Exception as e:
-            logger.error(f"Connection lost, reconnecting... Error: {e}")
-            await asyncio.sleep(5)  # Wait before reconnecting
+async def xrpl_stream(websocket, read, primary):
+    """Stream transactions for every monitored token over one subscription."""
+    await subscriptions.attach(websocket, config.get_issuers())
 
+    # Recover buys validated while we were disconnected (or down); a live standby has none
+    backfill_task = None
+    if primary and stream_state.last_ledger:
+        backfill_task = asyncio.create_task(
+            run_backfill(config.get_issuers(), stream_state.last_ledger + 1)
+        )
 
-async def handle_transaction(response):
-    """Process incoming transactions."""
-    token_config = config.get_config()
-    transaction = json.loads(response)
-    
+    try:
+        await read()
+    finally:
+        subscriptions.detach(websocket)
+        if backfill_task:
+            backfill_task.cancel()
+
+async def run_backfill(accounts, since_ledger):
+    """Feed missed transactions into the pipeline, logging any failure."""
+    try:
+        await backfill(connections.connect, accounts, since_ledger, pipeline.feed_batch)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Backfill error: {e}")
+
+
+def handle_transaction(response):
+    """Classify an incoming stream frame, returning a Buy or None."""
+    table = router.snapshot()
+    if isinstance(response, bytes):
+        response = response.decode('utf-8')
+    if '"ledgerClosed"' in response:
+        ledger_index = json_loads(response).get("ledger_index")
+        stream_state.ledger_closed(ledger_index)
+        aggregator.ledger_closed(ledger_index)
+        if ledger_index and fast_alerts:
+            for alert in fast_alerts.expire(ledger_index):
+                retract_alert(alert)
+        return None
+    if not table.is_candidate(response):
+        return None
+
+    return classify_transaction(json_loads(response), table.routes)
+
+def classify_ledger(transactions):
+    """Classify decoded validated transactions in one batch (a ledger or backfill page), returning the buys.
+
+    The balance changes of the whole batch come from ledger_changes() at once,
+    the rest is the same as for a single stream frame.
+    """
+    routes = router.snapshot().routes
+    batch = [
+        transaction for transaction in transactions
+        if transaction.get("transaction", {}).get("TransactionType") in ("Payment", "OfferCreate")
+        and "meta" in transaction
+    ]
+    changes = ledger_changes([(transaction["transaction"], transaction["meta"]) for transaction in batch])
+    buys = []
+    for transaction, change in zip(batch, changes):
+        try:
+            buy = classify_transaction(transaction, routes, change)
+        except Exception as e:
+            logger.error(f"Error processing transaction: {e}")
+            continue
+        if buy is not None:
+            buys.append(buy)
+    return buys
+
+def classify_transaction(transaction, routes, changes=None):
+    """Classify a decoded transaction frame; changes are its sender's balance changes if already known."""
     if "transaction" not in transaction:
-        return
+        return None
 
     tx = transaction["transaction"]
-    meta = transaction["meta"]
-    
     if tx.get("TransactionType") not in ["Payment", "OfferCreate"]:
-        return
+        return None
+
+    if not transaction.get("validated", True):
+        # Proposed frames (fast mode) have no metadata yet
+        return handle_proposed(transaction, tx, routes)
+    meta = transaction["meta"]
 
+    # Pool balances move with every trade, sells included
+    ledger_index = transaction.get("ledger_index")
+    prices.observe(meta, ledger_index)
+    holders.observe(meta, ledger_index)
+
+    # Reconnect backfills overlap the live stream, notify every tx hash once
+    if tx.get("hash") and not stream_state.mark_seen(tx["hash"]):
+        return None
+
+    buy = None
     try:
         if tx.get("TransactionType") == "Payment":
-            await handle_payment(tx, meta, token_config)
+            buy = handle_payment(tx, meta, routes, ledger_index, changes)
         elif tx.get("TransactionType") == "OfferCreate":
-            await handle_offer_create(tx, meta, token_config)
+            buy = handle_offer_create(tx, meta, routes, ledger_index, changes)
     except Exception as e:
         logger.error(f"Error processing transaction: {e}")
 
-async def handle_payment(tx, meta, token_config):
+    alert = fast_alerts.pop(tx.get("hash")) if fast_alerts else None
+    if alert is not None:
+        if buy is None:
+            # Failed, or not a buy above any threshold after all
+            retract_alert(alert)
+        else:
+            buy.alert = alert
+    return buy
+
+def handle_proposed(transaction, tx, routes):
+    """Estimate a buy from a proposed transaction so its alert can go out before validation."""
+    tx_hash = tx.get("hash")
+    if not tx_hash or transaction.get("engine_result") != "tesSUCCESS":
+        return None
+    if tx_hash in fast_alerts or stream_state.is_seen(tx_hash):
+        return None
+
+    # Requested amounts: the token bought and the most XRP the buyer allows to be spent
+    if tx["TransactionType"] == "OfferCreate":
+        xrp, amount = tx.get("TakerGets"), tx.get("TakerPays")
+    elif tx.get("Account") == tx.get("Destination"):
+        xrp, amount = tx.get("SendMax"), tx.get("Amount")
+    else:
+        return None
+    if not isinstance(xrp, str) or not isinstance(amount, dict):
+        return None
+    route = routes.get((amount.get("issuer"), amount.get("currency")))
+    if route is None:
+        return None
+
+    try:
+        xrp_spent = int(xrp) / 1000000
+        value = float(amount["value"])
+    except (KeyError, ValueError) as e:
+        logger.error(f"Error processing proposed transaction: {e}")
+        return None
+
+    # Aggregating groups only ever see validated totals
+    groups = [group for group in route.eligible(xrp_spent) if not group.settings.get('AGGREGATE_WINDOW')]
+    if not groups:
+        return None
+
+    current_ledger = stream_state.last_ledger + 1 if stream_state.last_ledger else None
+    alert, evicted = fast_alerts.add(tx_hash, tx.get("LastLedgerSequence"), current_ledger)
+    if evicted is not None:
+        retract_alert(evicted)
+    return Buy(
+        value, xrp_spent, tx, [group.chat_id for group in groups], (route.issuer, route.currency),
+        proposed=True, alert=alert
+    )
+
+def retract_alert(alert, chat_ids=None):
+    """Delete the messages posted for a transaction that failed or never validated (or only in chat_ids)."""
+    for chat_id in list(alert.messages if chat_ids is None else chat_ids):
+        message_id = alert.messages.pop(chat_id, None)
+        if message_id is None:
+            continue
+
+        async def delete(chat_id, message_id=message_id):
+            await notifier.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        notifier.submit(chat_id, Job(delete))
+
+def record_buy(tx, route, value, xrp_spent, ledger_index=None):
+    """Add a classified buy to the trade history, whatever the group thresholds."""
+    timestamp = tx["date"] + RIPPLE_EPOCH if tx.get("date") else time.time()
+    prices.observe_trade((route.issuer, route.currency), xrp_spent, value)
+    history.record(
+        # Stream frames carry the ledger index on the envelope, account_tx entries on the tx
+        tx.get("hash"), ledger_index or tx.get("ledger_index"), timestamp,
+        (route.issuer, route.currency), tx['Account'], xrp_spent, value
+    )
+
+def handle_payment(tx, meta, routes, ledger_index=None, changes=None):
     """Handle Payment type transactions."""
     if tx['Account'] != tx['Destination']:
-        return
+        return None
+    return classify_buy(tx, meta, routes, inclusive=False, ledger_index=ledger_index, changes=changes)
 
-    amount = tx.get("Amount", {})
-    if isinstance(amount, dict) and \
-       amount.get("currency") == token_config['TOKEN_CURRENCY'] and \
-       amount.get("issuer") == token_config['TOKEN_ISSUER']:
-        
-        try:
-            delivered_amount = float(meta.get('delivered_amount', {}).get('value', 0))
-            xrp_spent = float(tx.get("SendMax", "0")) / 1000000
-
-            # Send notifications to all configured groups
-            for chat_id in token_config["CHAT_IDS"]:
-                group_settings = config.get_group_settings(chat_id)
-                if xrp_spent > float(group_settings['THRESHOLD']):
-                    await send_notification(delivered_amount, xrp_spent, group_settings, tx, chat_id)
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error processing payment values: {e}")
-
-async def handle_offer_create(tx, meta, token_config):
+def handle_offer_create(tx, meta, routes, ledger_index=None, changes=None):
     """Handle OfferCreate type transactions."""
-    xrp_spent = 0.0
-    value = 0.0
-    
-    taker_pays = tx.get("TakerPays", {})
-    taker_gets = tx.get("TakerGets", {})
+    return classify_buy(tx, meta, routes, inclusive=True, ledger_index=ledger_index, changes=changes)
 
-    try:
-        if isinstance(taker_pays, str) and \
-           isinstance(taker_gets, dict) and \
-           taker_gets["currency"] == token_config['TOKEN_CURRENCY'] and \
-           taker_gets["issuer"] == token_config['TOKEN_ISSUER']:
-            
-            value = float(taker_gets["value"])
-            xrp_spent = float(taker_pays) / 1000000
-
-            # Check affected nodes for actual XRP movement
-            for node in meta.get("AffectedNodes", []):
-                modified_node = node.get("ModifiedNode", {})
-                if modified_node.get("LedgerEntryType") == "AccountRoot":
-                    final_balance = int(modified_node["FinalFields"].get("Balance", 0))
-                    previous_balance = int(modified_node["PreviousFields"].get("Balance", 0))
-                    xrp_diff = (final_balance - previous_balance) / 1000000
-                    if xrp_diff > 0:
-                        xrp_spent = xrp_diff
-                        break
-
-            # Send notifications to all configured groups
-            for chat_id in token_config["CHAT_IDS"]:
-                group_settings = config.get_group_settings(chat_id)
-                if xrp_spent >= float(group_settings['THRESHOLD']):
-                    await send_notification(value, xrp_spent, group_settings, tx, chat_id)
-                    
-    except (ValueError, TypeError) as e:
-        logger.error(f"Error processing offer create values: {e}")
-        
-async def send_notification(value, xrp_spent, group_settings, tx, chat_id):
-    """Send buy notification to a specific group."""
-    price = xrp_spent / value if value else 0
-    emoji_count = min(int(xrp_spent / 10), 50)
-    emojis = group_settings['EMOJI_ICON'] * emoji_count
-    market_cap = calculate_market_cap()
+def classify_buy(tx, meta, routes, inclusive, ledger_index=None, changes=None):
+    """Turn what the sender actually paid and received into a Buy of a monitored token.
 
-    # Convert currency code from hex to string if needed
-    currency_code = config.get_config()['TOKEN_CURRENCY']
+    Amounts come from the balance deltas in the metadata rather than from the
+    requested amounts, so partial fills, paths and AMM swaps are exact and
+    sells of a monitored token are never reported as buys.
+    """
     try:
-        if len(currency_code) == 40:  # Hex format
-            currency_code = bytes.fromhex(currency_code).decode('utf-8').strip('\x00')
-    except:
-        pass  # Keep original if conversion fails
+        xrp_delta, tokens = changes or transaction_changes(tx, meta)
+    except (KeyError, ValueError, TypeError) as e:
+        logger.error(f"Error processing balance changes: {e}")
+        return None
+
+    xrp_spent = -xrp_delta
+    if xrp_spent <= 0:
+        return None
+
+    for token, value in tokens.items():
+        route = routes.get(token)
+        if route is None or value <= 0:
+            continue
+
+        record_buy(tx, route, value, xrp_spent, ledger_index)
+
+        # Groups are sorted by threshold, so the eligible ones are a prefix; aggregating
+        # groups collect every buy as their threshold applies to the window total
+        groups = route.eligible(xrp_spent, inclusive=inclusive)
+        if groups or route.windowed:
+            return Buy(value, xrp_spent, tx, [group.chat_id for group in groups], token,
+                       holding=holders.holding(meta, tx['Account'], token, value))
+        return None
+    return None
+
+async def dispatch_buy(buy):
+    """Deliver a classified buy, or a summary of coalesced buys, to its groups."""
+    if buy.count > 1:
+        route = router.snapshot().routes.get(buy.token)
+        if route is None:
+            return
+        chat_ids = post_to_boards(buy, route, add_to_windows(buy, route, buy.chat_ids))
+        if broker is not None:
+            for chat_id in chat_ids:
+                publish_job(chat_id, buy)
+            return
+        notifier.fan_out(chat_ids, lambda chat_id: send_summary(buy, chat_id), buy)
+    else:
+        await notify_groups(buy)
 
-    # New message format
+async def send_summary(buy, chat_id):
+    """Send one summary message for several coalesced buys."""
+    currency_code = decode_currency(buy.token[1])
     message = (
-        f"🚀 <b>New ${currency_code} Buy!</b>\n\n"
-        f"{emojis}\n\n"
-        f"💸 <b>Spent:</b> {xrp_spent:.2f} XRP\n"
-        f"💳 <b>Bought:</b> {value:,.3f} (${currency_code})\n"
-        f"🧢 <b>MC:</b> ${market_cap:,.3f} USD\n"  # You'll need to implement market cap calculation
-        f"💰 <b>CA:</b> {config.get_config()['TOKEN_ISSUER']}\n"
-        f"👛 <b>Wallet:</b> {tx['Account']}\n\n"
+        f"🚀 <b>{buy.count} ${currency_code} Buys!</b>\n\n"
+        f"💸 <b>Total Spent:</b> {buy.xrp_spent:.2f} XRP\n"
+        f"💳 <b>Total Bought:</b> {buy.value:,.3f} (${currency_code})\n"
+    )
+
+    await notifier.bot.send_message(chat_id=chat_id, text=message, parse_mode="HTML")
+
+def add_to_windows(buy, route, chat_ids):
+    """Hand a buy to the aggregation windows of its token; returns the chats to notify right away.
+
+    Every aggregating group collects the buy, unless it is a single big buy
+    that meets the group's threshold on its own (chat_ids are the groups
+    whose threshold it met).
+    """
+    if not route.windowed or buy.proposed:
+        return chat_ids  # Windows only ever see validated buys
+    ledger_index = stream_state.last_ledger + 1 if stream_state.last_ledger else None
+    eligible = set(chat_ids)
+    collected = set()
+    for group in route.windowed:
+        if buy.count == 1 and buy.xrp_spent >= BIG_BUY_XRP and group.chat_id in eligible:
+            continue
+        aggregator.add(group, buy, ledger_index)
+        collected.add(group.chat_id)
+    return [chat_id for chat_id in chat_ids if chat_id not in collected]
+
+async def notify_groups(buy, windowed=True, wallets=1):
+    """Schedule a buy notification for all eligible groups.
+
+    Groups with an aggregation window collect the buy instead, unless it is a
+    big buy that meets their threshold on its own.
+    """
+    route = router.snapshot().routes.get(buy.token)
+    chat_ids = []
+    if route is not None:
+        chat_ids = add_to_windows(buy, route, buy.chat_ids) if windowed else buy.chat_ids
+        chat_ids = post_to_boards(buy, route, chat_ids)
+
+    alert = buy.alert
+    if alert is not None and not buy.proposed:
+        # Validated: alerts in groups no longer eligible go away, the others are edited below
+        retract_alert(alert, set(alert.messages) - set(chat_ids))
+    if not chat_ids:
+        return
+
+    market_cap = current_market_cap(buy.token)
+    holding = await buy_holding(buy)
+    merged_line = f"🧮 <b>Buys:</b> {buy.count} from {wallets} wallet(s)\n" if buy.count > 1 else ""
+    pending_line = "⏳ <i>Unconfirmed, waiting for validation</i>\n" if buy.proposed else ""
+
+    # Everything except the emoji line is identical for all groups, so render it once
+    body = (
+        f"{pending_line}"
+        f"💸 <b>Spent:</b> {buy.xrp_spent:.2f} XRP\n"
+        f"💳 <b>Bought:</b> {buy.value:,.3f} (${route.ticker})\n"
+        f"{market_cap_line(market_cap)}"
+        f"💰 <b>CA:</b> {route.issuer}\n"
+        f"{merged_line}"
+        f"👛 <b>Wallet:</b> {buy.tx['Account']}\n"
+        f"{holder_line(buy, route, holding)}\n"
         # f"📢 Paid Ad:\n"
         # f"👁 $3RDEYE Sees Beyond All Chains\n"
         # f"🔮 Awaken your 3rd Eye, unlock the truth\n"
         # f"👁 $3RDEYE aligns your mind, body, and soul\n"
         # f"🔴 X Marks the Vision\n"
         # f"TG | X | FL\n\n"
-        f"🤖 <b>in:</b> {len(config.get_config()['CHAT_IDS'])} TG group(s)"
+        f"{route.footer}"
     )
 
     keyboard = [
         [
-            InlineKeyboardButton("View Transaction", url=f"https://xrpscan.com/account/{tx['Account']}"),
-            InlineKeyboardButton("Chart", url=f"https://firstledger.net/token/{config.get_config()['TOKEN_ISSUER']}/{config.get_config()['TOKEN_CURRENCY']}")
+            InlineKeyboardButton("View Transaction", url=f"https://xrpscan.com/account/{buy.tx['Account']}"),
+            route.chart_button
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    bot = Bot(token=TOKEN)
+    volume_line = ""
+    if any(group.settings.get('SHOW_VOLUME') for group in map(route.by_chat.get, chat_ids) if group):
+        day = history.get_stats(buy.token).summary(86400)
+        volume_line = f"📊 <b>24h Volume:</b> {day['volume']:,.2f} XRP ({day['count']} buys)\n"
+
+    if broker is not None:
+        for chat_id in chat_ids:
+            group = route.by_chat.get(chat_id)
+            if group is not None:
+                publish_job(chat_id, buy, group.settings, render_caption(buy, route, group, body, volume_line), reply_markup)
+        return
+
+    async def send(chat_id):
+        group = route.by_chat.get(chat_id)
+        if group is None:
+            return
+        if alert is None:
+            await send_notification(buy, route, group, body, reply_markup, volume_line)
+        elif buy.proposed:
+            await send_alert(alert, buy, route, group, body, reply_markup, volume_line)
+        elif chat_id in alert.messages:
+            await edit_notification(alert.messages.pop(chat_id), buy, route, group, body, reply_markup, volume_line)
+        else:
+            await send_notification(buy, route, group, body, reply_markup, volume_line)
+
+    notifier.fan_out(chat_ids, send, buy)
+
+def post_to_boards(buy, route, chat_ids):
+    """Add a validated buy to the boards of board mode groups; returns the chats that get a message."""
+    rest = []
+    for chat_id in chat_ids:
+        group = route.by_chat.get(chat_id)
+        if group is not None and group.settings.get('BOARD'):
+            if not buy.proposed:  # Boards only list validated buys
+                boards.add(group, buy)
+        else:
+            rest.append(chat_id)
+    return rest
+
+async def render_board(board):
+    """Content of a group's board, or None once the group left board mode."""
+    chat_id = board.chat_id
+    token = config.get_group_token(chat_id)
+    route = router.snapshot().routes.get(token)
+    group = route.by_chat.get(chat_id) if route else None
+    if group is None or not group.settings.get('BOARD'):
+        return None
+
+    market_cap = current_market_cap(token)
+    hour = history.get_stats(token).summary(3600)
+    lines = [f"📋 <b>${route.ticker} Buy Board</b>\n"]
+    for at, xrp_spent, value, account, count in reversed(board.buys):
+        merged = f" ×{count}" if count > 1 else ""
+        lines.append(
+            f"{group.settings['EMOJI_ICON']} <b>{xrp_spent:,.2f} XRP</b> → {value:,.2f}{merged} "
+            f"<code>{short_account(account)}</code> {time.strftime('%H:%M', time.gmtime(at))}"
+        )
+    if not board.buys:
+        lines.append("<i>No buys yet</i>")
+    lines.append("")
+    lines.append(f"📊 <b>1h Volume:</b> {hour['volume']:,.2f} XRP ({hour['count']} buys)")
+    if market_cap is not None:
+        lines.append(market_cap_line(market_cap, 0).rstrip("\n"))
+    if hour['biggest_account']:
+        lines.append(f"🐳 <b>Biggest (1h):</b> {hour['biggest']:,.2f} XRP by <code>{short_account(hour['biggest_account'])}</code>")
+    lines.append("🕒 <i>Times in UTC</i>")
+    return "\n".join(lines)
+
+def short_account(account):
+    return f"{account[:5]}…{account[-4:]}" if account and len(account) > 12 else account or "?"
+
+def edit_board(chat_id, content):
+    """Queue an in-place edit of a group's board message."""
+    async def send(chat_id):
+        settings = config.get_group_settings(chat_id)
+        message_id = settings.get('BOARD_MESSAGE_ID')
+        if not settings.get('BOARD') or not message_id:
+            return
+        try:
+            if settings['BOARD'] == 'text':
+                await notifier.bot.edit_message_text(
+                    chat_id=chat_id, message_id=message_id, text=content,
+                    parse_mode="HTML", disable_web_page_preview=True
+                )
+            else:
+                await notifier.bot.edit_message_caption(
+                    chat_id=chat_id, message_id=message_id, caption=content, parse_mode="HTML"
+                )
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+            if "not found" not in str(e):
+                raise
+            # Deleted by someone, post a new one
+            logger.warning(f"Board message of group {chat_id} is gone, posting a new one")
+            await post_board(notifier.bot, chat_id, settings, content)
+
+    notifier.submit(chat_id, Job(send))
+
+async def post_board(bot, chat_id, settings, content, save=None):
+    """Send and pin a new board message for a group, remembering its id (saved along with `save`)."""
+    if settings['BOARD'] == 'text':
+        message = await bot.send_message(
+            chat_id=chat_id, text=content, parse_mode="HTML", disable_web_page_preview=True
+        )
+    else:
+        message = await send_media(bot, chat_id, settings, caption=content, parse_mode="HTML")
+    config.update_group_settings(chat_id, {**(save or {}), 'BOARD_MESSAGE_ID': message.message_id})
     try:
-        if group_settings['TYPE']:  # GIF
-            await bot.send_animation(
-                chat_id=chat_id,
-                animation=group_settings['MEDIA'],
-                caption=message,
-                parse_mode="HTML",
-                reply_markup=reply_markup
-            )
-        else:  # Photo
-            await bot.send_photo(
-                chat_id=chat_id,
-                photo=group_settings['MEDIA'],
-                caption=message,
-                parse_mode="HTML",
-                reply_markup=reply_markup
-            )
+        await bot.pin_chat_message(chat_id=chat_id, message_id=message.message_id, disable_notification=True)
     except Exception as e:
-        logger.error(f"Error sending notification to group {chat_id}: {e}")
+        logger.warning(f"Could not pin the board in group {chat_id}: {e}")
+        return message, False
+    return message, True
 
-async def start_ws_connection():
-    """Maintain WebSocket connection."""
-    while True:
+async def retire_board(bot, chat_id, message_id, delete=False):
+    """Unpin a board message that is no longer edited, deleting it when a new board replaces it."""
+    try:
+        await bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
+    except Exception as e:
+        logger.warning(f"Could not unpin the board in group {chat_id}: {e}")
+    if delete:
         try:
-            ssl_context = ssl.create_default_context(cafile=certifi.where())
-            async with websockets.connect(XRPL_WS_URL, ssl=ssl_context) as websocket:
-                await xrpl_stream(websocket)
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
         except Exception as e:
-            logger.error(f"WebSocket error: {e}")
-            await asyncio.sleep(5)
+            logger.warning(f"Could not delete the old board in group {chat_id}: {e}")
+
+async def buy_holding(buy):
+    """(balance, new holder) of the buying wallet, shared by every group of the buy.
+
+    Validated buys read it from their metadata; proposed ones have none yet and
+    wait at most HOLDER_BUDGET for the wallet's balance, going out without it
+    when the lookup is slower.
+    """
+    if buy.holding is not None or not buy.proposed or buy.count > 1:
+        return buy.holding
+    balance = await holders.get(buy.tx['Account'], buy.token)
+    if balance is None:
+        return None
+    return balance + buy.value, balance <= 0
+
+def holder_line(buy, route, holding):
+    if holding is None:
+        return ""
+    balance, new = holding
+    if new:
+        return "🆕 <b>New holder</b>\n"
+    price = prices.tokens.get(buy.token)
+    share = f" ({balance / price.supply:.2%} of supply)" if price and price.supply else ""
+    return f"🏦 <b>Holds:</b> {balance:,.3f} ${route.ticker}{share}\n"
+
+async def send_alert(alert, buy, route, group, body, reply_markup, volume_line):
+    """Post the alert of a proposed transaction, unless its validated result already arrived."""
+    if alert.settled:
+        return
+    message = await send_notification(buy, route, group, body, reply_markup, volume_line)
+    if alert.settled:
+        # Validation overtook the send, and already posted (or skipped) the final message
+        await notifier.bot.delete_message(chat_id=group.chat_id, message_id=message.message_id)
+    else:
+        alert.messages[group.chat_id] = message.message_id
+
+async def edit_notification(message_id, buy, route, group, body, reply_markup, volume_line):
+    """Replace the caption of a fast mode alert with the validated amounts."""
+    try:
+        await notifier.bot.edit_message_caption(
+            chat_id=group.chat_id,
+            message_id=message_id,
+            caption=render_caption(buy, route, group, body, volume_line),
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        )
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+def render_caption(buy, route, group, body, volume_line):
+    """Caption of a buy notification for one group."""
+    emoji_count = min(int(buy.xrp_spent / 10), 50)
+    emojis = group.settings['EMOJI_ICON'] * emoji_count
+    if group.settings.get('SHOW_VOLUME'):
+        body = volume_line + body
+    return f"{route.header}{emojis}\n\n{body}"
+
+async def send_notification(buy, route, group, body, reply_markup, volume_line):
+    """Send buy notification to a specific group."""
+    return await send_media(
+        notifier.bot,
+        group.chat_id,
+        group.settings,
+        caption=render_caption(buy, route, group, body, volume_line),
+        parse_mode="HTML",
+        reply_markup=reply_markup
+    )
+
+def publish_job(chat_id, buy, settings=None, caption=None, reply_markup=None):
+    """Hand one chat's notification to the worker owning its shard; no caption means a summary."""
+    broker.publish(shard_ring.shard(chat_id), {
+        "chat_id": chat_id,
+        "media": {"MEDIA": settings['MEDIA'], "TYPE": settings['TYPE']} if settings else None,
+        "caption": caption,
+        "reply_markup": reply_markup.to_dict() if reply_markup else None,
+        "buy": {
+            "value": buy.value,
+            "xrp_spent": buy.xrp_spent,
+            "account": buy.tx.get("Account"),
+            "token": list(buy.token),
+            "count": buy.count,
+            # Wall clock, so the worker can keep measuring latency from receipt
+            "received_at": time.time() - (time.monotonic() - buy.received_at),
+        },
+    })
+
+def submit_job(message):
+    """Queue a notification published by the ingest process."""
+    data = message["buy"]
+    buy = Buy(
+        data["value"], data["xrp_spent"], {"Account": data["account"]}, [message["chat_id"]], tuple(data["token"]),
+        received_at=time.monotonic() - (time.time() - data["received_at"]), count=data["count"]
+    )
+    if message["caption"] is None:
+        async def send(chat_id):
+            await send_summary(buy, chat_id)
+    else:
+        reply_markup = InlineKeyboardMarkup.de_json(message["reply_markup"], notifier.bot) if message["reply_markup"] else None
+
+        async def send(chat_id):
+            await send_media(
+                notifier.bot, chat_id, message["media"],
+                caption=message["caption"], parse_mode="HTML", reply_markup=reply_markup
+            )
+    notifier.submit(message["chat_id"], Job(send, buy))
+
+async def run_worker(shard):
+    """Send the notifications of one shard until stopped (BOT_ROLE=worker)."""
+    bot = Bot(TOKEN, base_url=TELEGRAM_API_URL) if TELEGRAM_API_URL else Bot(TOKEN)
+    async with bot:
+        notifier.attach(bot, send_summary)
+        metrics.register(collect_metrics)
+        logger.info(f"Notifier worker for shard {shard} of {shard_ring.shards} started")
+        try:
+            # The ingest process serves METRICS_PORT, each worker one of the ports after it
+            await metrics.start(port=int(METRICS_PORT) + shard + 1 if METRICS_PORT else None)
+            async for message in broker.consume(shard):
+                submit_job(message)
+        finally:
+            await notifier.drain()
+            await metrics.stop()
+            config.close()
+
+async def send_media(bot, chat_id, group_settings, **kwargs):
+    """Send the group's media, reusing Telegram's file_id once it is known."""
+    url = group_settings['MEDIA']
+    if group_settings['TYPE']:  # GIF
+        send, field = bot.send_animation, 'animation'
+    else:  # Photo
+        send, field = bot.send_photo, 'photo'
+
+    file_id = config.get_media_file_id(url)
+    if file_id:
+        try:
+            return await send(chat_id=chat_id, **{field: file_id}, **kwargs)
+        except BadRequest as e:
+            if "file" not in str(e).lower():
+                raise  # e.g. chat not found: the file_id is fine, keep it for the other groups
+            logger.warning(f"Cached file_id for {url} was rejected, falling back to URL: {e}")
+            config.drop_media_file_id(url)
+
+    message = await send(chat_id=chat_id, **{field: url}, **kwargs)
+    file_id = media_file_id(message)
+    if file_id:
+        config.set_media_file_id(url, file_id)
+    return message
+
+def media_file_id(message):
+    """Return the file_id of the media attached to a sent message."""
+    if message.animation:
+        return message.animation.file_id
+    if message.document:
+        return message.document.file_id
+    if message.photo:
+        return message.photo[-1].file_id
+    return None
+
+def start_stream():
+    """Start the XRPL stream supervisor unless it is already running."""
+    global ws_task
+    if not ws_task or ws_task.done():
+        ws_task = asyncio.create_task(connections.run(xrpl_stream))
+
+async def warm_caches(bot):
+    """Fill the market cap, media, admin and chat title caches after startup,
+    so the first buys and commands do not wait on cold lookups."""
+    started_at = time.monotonic()
+    chat_ids = list(config.get_config()["CHAT_IDS"])
+    results = await asyncio.gather(
+        *(get_market_cap(token) for token in list(config.get_token_index())),
+        *(admins.get(bot, chat_id) for chat_id in chat_ids),
+        chat_titles.get_many(bot, chat_ids),
+        warm_media(bot, chat_ids),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Cache warm-up step failed: {result}")
+    logger.info(f"Warmed caches for {len(chat_ids)} groups in {time.monotonic() - started_at:.2f}s")
+
+async def warm_media(bot, chat_ids):
+    """Upload group media that has no file_id yet to the owner's chat and delete it
+    again, so the first notification sends the file_id instead of the URL."""
+    pending = {}
+    for chat_id in chat_ids:
+        settings = config.get_group_settings(chat_id)
+        if settings.get('MEDIA') and not config.get_media_file_id(settings['MEDIA']):
+            pending.setdefault(settings['MEDIA'], settings)
+    for settings in pending.values():
+        try:
+            message = await send_media(bot, OWNER_ID, settings, disable_notification=True)
+            await bot.delete_message(chat_id=OWNER_ID, message_id=message.message_id)
+        except Exception as e:
+            logger.warning(f"Error preloading media {settings['MEDIA']}: {e}")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start monitoring in the current group."""
@@ -231,17 +849,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check if the group is already being monitored
-    if chat_id in config.get_config()["CHAT_IDS"]:
+    if config.has_group(chat_id):
         await update.message.reply_text("ℹ️ This group is already being monitored.")
         return
 
     # Add the group to monitoring list
     config.add_group(chat_id)
+    await subscriptions.sync(config.get_issuers())
     
     # Start WebSocket connection if not already running
-    global ws_task
-    if not ws_task or ws_task.done():
-        ws_task = asyncio.create_task(maintain_websocket_connection())
+    start_stream()
         
     await update.message.reply_text(
         "✅ Bot started successfully!\n\n"
@@ -255,23 +872,16 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    # Check admin status
-    try:
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        is_admin = chat_member.status in ['creator', 'administrator']
-    except Exception as e:
-        logger.error(f"Error checking admin status: {e}")
-        await update.message.reply_text("❌ Unable to verify admin status. Please try again.")
-        return
-
-    if not is_admin:
+    if not await is_group_admin(chat_id, user_id, context):
         await update.message.reply_text("❌ Only group administrators can stop the monitoring.")
         return
 
     try:
         # Remove the group from monitoring
-        if chat_id in config.get_config()["CHAT_IDS"]:
+        if config.has_group(chat_id):
             if config.remove_group(chat_id):
+                await subscriptions.sync(config.get_issuers())
+                boards.remove(chat_id)
                 logger.info(f"Group {chat_id} removed from monitoring.")
                 await update.message.reply_text("✅ Group removed from monitoring list.")
                 
@@ -299,25 +909,14 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Helper function to check admin status (can be used by other commands)
 async def is_group_admin(chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if a user is an admin in the group."""
-    try:
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-
-        if chat_member.status == 'creator':
-            return True
-            
-        # Check admin permissions
-        if hasattr(chat_member, 'can_change_info') or \
-           hasattr(chat_member, 'can_delete_messages') or \
-           hasattr(chat_member, 'can_restrict_members') or \
-           hasattr(chat_member, 'can_invite_users') or \
-           hasattr(chat_member, 'can_pin_messages') or \
-           hasattr(chat_member, 'can_promote_members'):
-            return True
-            
-        return False
-    except Exception as e:
-        logger.error(f"Error checking admin status: {e}")
-        return False
+    return await admins.is_admin(context.bot, chat_id, user_id)
+
+async def chat_member_updated(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Keep the admin and title caches in sync with membership changes."""
+    member = update.chat_member or update.my_chat_member
+    chat = update.effective_chat
+    chat_titles.remember(chat.id, chat.title)
+    admins.member_updated(chat.id, member.old_chat_member.status, member.new_chat_member.status)
 
 async def set_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set the minimum XRP threshold for notifications in the current group."""
@@ -338,7 +937,7 @@ async def set_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Threshold must be positive.")
             return
 
-        if chat_id not in config.get_config()["CHAT_IDS"]:
+        if not config.has_group(chat_id):
             await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
             return
 
@@ -368,16 +967,66 @@ async def set_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    if chat_id not in config.get_config()["CHAT_IDS"]:
+    if not config.has_group(chat_id):
         await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
         return
 
     group_settings = config.get_group_settings(chat_id)
+    old_url = group_settings['MEDIA']
     group_settings['MEDIA'] = url
     group_settings['TYPE'] = (media_type == 'gif')
     config.update_group_settings(chat_id, group_settings)
 
-    await update.message.reply_text(f"✅ Buy notification media updated for this group.")
+    # The URL may now point at different content, and the old one may be unused
+    config.drop_media_file_id(url)
+    if old_url != url and not any(
+        config.get_group_settings(cid)['MEDIA'] == old_url for cid in config.get_config()["CHAT_IDS"]
+    ):
+        config.drop_media_file_id(old_url)
+
+    # Warm the file_id cache with a preview so the first buy doesn't wait on the upload
+    try:
+        await send_media(
+            context.bot,
+            chat_id,
+            group_settings,
+            caption="✅ Buy notification media updated for this group."
+        )
+    except Exception as e:
+        logger.error(f"Error sending media preview to group {chat_id}: {e}")
+        await update.message.reply_text(
+            "⚠️ Media saved, but Telegram could not load it. Please check the URL and type."
+        )
+
+async def set_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Select the token monitored in the current group."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    if not await is_group_admin(chat_id, user_id, context):
+        await update.message.reply_text("❌ Only group administrators can change settings.")
+        return
+
+    if len(context.args) < 2:
+        await update.message.reply_text("❌ Please provide the token issuer and currency code.")
+        return
+
+    issuer = context.args[0]
+    currency = encode_currency(context.args[1])
+
+    if not issuer.startswith('r') or len(currency) not in (3, 40):
+        await update.message.reply_text("❌ Invalid issuer or currency code.")
+        return
+
+    if not config.has_group(chat_id):
+        await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
+        return
+
+    config.update_group_settings(chat_id, {"TOKEN_ISSUER": issuer, "TOKEN_CURRENCY": currency})
+    await subscriptions.sync(config.get_issuers())
+    boards.remove(chat_id)  # Its buys were of the old token
+
+    await update.message.reply_text(f"✅ This group now tracks buys of {decode_currency(currency)} ({issuer}).")
 
 async def set_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set emoji for buy notifications in the current group."""
@@ -388,7 +1037,7 @@ async def set_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
     emoji = context.args[0]
     chat_id = update.effective_chat.id
     
-    if chat_id not in config.get_config()["CHAT_IDS"]:
+    if not config.has_group(chat_id):
         await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
         return
 
@@ -398,78 +1047,186 @@ async def set_emoji(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text(f"✅ Buy notification emoji updated to {emoji} for this group.")
 
-def calculate_market_cap():
-    """
-    Calculate the market cap of the token using the token activity API.
-    """
-    url = "https://api.firstledger.net/api/token-activity"
-    payload = {
-        "issuer": "r93hE5FNShDdUqazHzNvwsCxL9mSqwyiru",
-        "currency": "52504C5300000000000000000000000000000000",
-        "user_xrp_address": ""
-    }
+async def set_aggregate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Configure the aggregation window of the current group."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    if not await is_group_admin(chat_id, user_id, context):
+        await update.message.reply_text("❌ Only group administrators can change settings.")
+        return
+
+    if not config.has_group(chat_id):
+        await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
+        return
+
+    usage = "❌ Usage: /aggregate [amount] [seconds/ledgers] [wallet/all], or /aggregate off"
+    if not context.args:
+        await update.message.reply_text(usage)
+        return
+
+    if context.args[0].lower() == 'off':
+        config.update_group_settings(chat_id, {'AGGREGATE_WINDOW': 0})
+        await update.message.reply_text("✅ Buy aggregation disabled for this group.")
+        return
 
     try:
-        # Fetch token activity data
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            data = response.json()
-
-            # Attempt to get market cap directly from the response
-            price_changes = data.get("Price_Changes", [])
-            if price_changes and "market_cap" in price_changes[0]:
-                market_cap = float(price_changes[0]["market_cap"])
-                return market_cap
-
-            # If market cap is not directly available, calculate it
-            circulating_supply = float(data.get("circulating_supply", 0))
-            price_per_token = float(data.get("price_usd", 0))
-
-            if circulating_supply and price_per_token:
-                market_cap = circulating_supply * price_per_token
-                return market_cap
-
-            logger.error("Missing circulating supply or price data in API response.")
-            return 0
-        else:
-            logger.error(f"Error fetching token activity: {response.status_code} - {response.text}")
-            return 0
-    except Exception as e:
-        logger.error(f"Error calculating market cap: {e}", exc_info=True)
-        return 0
+        window = int(context.args[0])
+        if window <= 0:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("❌ Please provide a positive whole number.")
+        return
+
+    unit = context.args[1].lower() if len(context.args) > 1 else 'seconds'
+    by = context.args[2].lower() if len(context.args) > 2 else 'wallet'
+    if unit not in ('seconds', 'ledgers') or by not in ('wallet', 'all'):
+        await update.message.reply_text(usage)
+        return
+
+    config.update_group_settings(chat_id, {'AGGREGATE_WINDOW': window, 'AGGREGATE_UNIT': unit, 'AGGREGATE_BY': by})
+
+    await update.message.reply_text(
+        f"✅ Buys {'per wallet' if by == 'wallet' else 'from all wallets'} are now merged over {window} {unit}. "
+        f"The threshold applies to the total; buys of {BIG_BUY_XRP:g}+ XRP are sent right away."
+    )
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show rolling trading stats for the group's token."""
+    chat_id = update.effective_chat.id
+
+    if not config.has_group(chat_id):
+        await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
+        return
+
+    token = config.get_group_token(chat_id)
+    currency_code = decode_currency(token[1])
+    rolling = history.get_stats(token)
+
+    lines = [f"<b>📊 ${currency_code} Stats</b>\n"]
+    for label, window in (("1h", 3600), ("24h", 86400)):
+        summary = rolling.summary(window)
+        lines.append(
+            f"\n<b>Last {label}:</b>\n"
+            f"💸 <b>Volume:</b> {summary['volume']:,.2f} XRP\n"
+            f"💳 <b>Bought:</b> {summary['tokens']:,.3f} ${currency_code}\n"
+            f"🛒 <b>Buys:</b> {summary['count']}\n"
+            f"👛 <b>Unique Buyers:</b> {summary['buyers']}\n"
+        )
+        if summary['biggest_account']:
+            lines.append(f"🐋 <b>Biggest Buy:</b> {summary['biggest']:,.2f} XRP by {summary['biggest_account']}\n")
+
+    await update.message.reply_text("".join(lines), parse_mode="HTML")
+
+async def set_volume_line(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Toggle the 24h volume line in buy notifications for the current group."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+
+    if not await is_group_admin(chat_id, user_id, context):
+        await update.message.reply_text("❌ Only group administrators can change settings.")
+        return
+
+    if not context.args or context.args[0].lower() not in ('on', 'off'):
+        await update.message.reply_text("❌ Please specify on or off.")
+        return
+
+    if not config.has_group(chat_id):
+        await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
+        return
+
+    show_volume = context.args[0].lower() == 'on'
+    config.update_group_settings(chat_id, {'SHOW_VOLUME': show_volume})
 
+    await update.message.reply_text(f"✅ Volume line {'enabled' if show_volume else 'disabled'} for this group.")
+
+async def set_board(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switch the current group to a pinned buy board edited in place, or back to one post per buy."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
 
+    if not await is_group_admin(chat_id, user_id, context):
+        await update.message.reply_text("❌ Only group administrators can change settings.")
+        return
+
+    if not config.has_group(chat_id):
+        await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
+        return
+
+    usage = f"❌ Usage: /board [on/text] [buys, up to {BOARD_MAX_SIZE}] [seconds between edits], or /board off"
+    mode = context.args[0].lower() if context.args else None
+    if mode not in ('on', 'text', 'off'):
+        await update.message.reply_text(usage)
+        return
+
+    previous = dict(config.get_group_settings(chat_id))  # as it was before this command
+    if mode == 'off':
+        config.update_group_settings(chat_id, {'BOARD': None, 'BOARD_MESSAGE_ID': None})
+        boards.remove(chat_id)
+        if previous.get('BOARD_MESSAGE_ID'):
+            await retire_board(context.bot, chat_id, previous['BOARD_MESSAGE_ID'])
+        await update.message.reply_text("✅ Board mode disabled, every buy is posted again.")
+        return
+
+    try:
+        size = int(context.args[1]) if len(context.args) > 1 else BOARD_SIZE
+        interval = float(context.args[2]) if len(context.args) > 2 else BOARD_INTERVAL
+        if not 1 <= size <= BOARD_MAX_SIZE or interval < 1:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+
+    board = {'BOARD': 'text' if mode == 'text' else 'media', 'BOARD_SIZE': size, 'BOARD_INTERVAL': interval}
+    old_message_id = previous.get('BOARD_MESSAGE_ID')
+    if old_message_id and previous.get('BOARD') == board['BOARD']:
+        # Same kind of message: keep the pinned board, the redraw below edits it
+        config.update_group_settings(chat_id, board)
+        pinned = True
+    else:
+        # A text board can't become a media one by editing, replace it (new one first, edits go there).
+        # Nothing is saved unless it was posted: a board without a message would swallow every buy
+        try:
+            _, pinned = await post_board(
+                context.bot, chat_id, {**previous, **board}, "📋 <i>Waiting for the next buy…</i>", save=board
+            )
+        except TelegramError as e:
+            logger.error(f"Could not post the board in group {chat_id}: {e}")
+            await update.message.reply_text(f"❌ Could not post the board message, nothing was changed: {e}")
+            return
+        if old_message_id:
+            await retire_board(context.bot, chat_id, old_message_id, delete=True)
+    boards.redraw(chat_id, config.get_group_settings(chat_id))
+
+    await update.message.reply_text(
+        f"✅ Board mode enabled: the last {size} buys are kept in one message, updated at most every {interval:g}s."
+        + ("" if pinned else "\n⚠️ Give the bot the right to pin messages so the board stays on top.")
+    )
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current status and settings for the group."""
     chat_id = update.effective_chat.id
     
-    if chat_id not in config.get_config()["CHAT_IDS"]:
+    if not config.has_group(chat_id):
         await update.message.reply_text("❌ This group is not being monitored. Use /start first.")
         return
 
     group_settings = config.get_group_settings(chat_id)
-    token_config = config.get_config()
+    token = config.get_group_token(chat_id)
 
-    # Convert currency code from hex to string if needed
-    currency_code = token_config['TOKEN_CURRENCY']
-    market_cap = calculate_market_cap()
-    try:
-        if len(currency_code) == 40:  # Hex format
-            currency_code = bytes.fromhex(currency_code).decode('utf-8').strip('\x00')
-    except:
-        pass  # Keep original if conversion fails
+    currency_code = decode_currency(token[1])
+    market_cap = await get_market_cap(token)
 
     status_message = (
         "<b>🤖 Bot Status</b>\n\n"
         f"🎯 <b>Token:</b> {currency_code}\n"
-        f"📝 <b>Issuer:</b> {token_config['TOKEN_ISSUER']}\n"
+        f"📝 <b>Issuer:</b> {token[0]}\n"
         f"💰 <b>Threshold:</b> {group_settings['THRESHOLD']} XRP\n"
         f"🧢 <b>MC:</b> ${market_cap:,.3f} USD\n"  # You'll need to implement market cap calculation
         f" <b>Emoji:</b> {group_settings['EMOJI_ICON']}\n"
         f"🖼️ <b>Media Type:</b> {'GIF' if group_settings['TYPE'] else 'Photo'}\n"
         f"🔗 <b>Media URL:</b> {group_settings['MEDIA']}\n"
-        f"📡 <b>WebSocket:</b> {'Connected' if ws_task and not ws_task.done() else 'Disconnected'}\n"
+        f"📡 <b>WebSocket:</b> {'Connected' if connections.live else 'Disconnected'}\n"
     )
 
     await update.message.reply_text(status_message, parse_mode="HTML")
@@ -481,34 +1238,86 @@ async def admin_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     token_config = config.get_config()
-    groups_info = ""
-    
-    for chat_id in token_config["CHAT_IDS"]:
+    chat_ids = list(token_config["CHAT_IDS"])
+    titles = await chat_titles.get_many(context.bot, chat_ids, timeout=ADMIN_STATUS_TIMEOUT)
+
+    groups_info = []
+    for chat_id in chat_ids:
         group_settings = config.get_group_settings(chat_id)
-        try:
-            chat = await context.bot.get_chat(chat_id)
-            group_name = chat.title
-        except:
-            group_name = f"Group {chat_id}"
-            
-        groups_info += (
-            f"\n<b>{group_name}</b>\n"
+        issuer, currency = config.get_group_token(chat_id)
+        groups_info.append(
+            f"\n<b>{escape(titles[chat_id])}</b>\n"
+            f"- Token: {decode_currency(currency)} ({issuer})\n"
             f"- Threshold: {group_settings['THRESHOLD']} XRP\n"
             f"- Emoji: {group_settings['EMOJI_ICON']}\n"
             f"- Media Type: {'GIF' if group_settings['TYPE'] else 'Photo'}\n"
         )
 
+    stages_info = "".join(
+        f"- {name}: depth {stage['depth']}, processed {stage['processed']}, "
+        f"dropped {stage['dropped']}, lag {stage['last_lag']:.3f}s (max {stage['max_lag']:.3f}s)\n"
+        for name, stage in pipeline.metrics().items()
+    )
+
+    endpoints_info = "".join(
+        f"- {endpoint['url']}: {'🟢' if endpoint['connected'] else '⚪️'} "
+        f"ping {endpoint['latency'] or 0:.3f}s, ledger lag {endpoint['ledger_lag'] or 0:.1f}s, "
+        f"errors {endpoint['error_rate']:.2f}, reconnects {endpoint['reconnects']}\n"
+        for endpoint in connections.status()
+    )
+
     status_message = (
         "<b>🤖 Bot Admin Status</b>\n\n"
         f"🎯 <b>Token:</b> {token_config['TOKEN_CURRENCY']}\n"
         f"📝 <b>Issuer:</b> {token_config['TOKEN_ISSUER']}\n"
+        f"🪙 <b>Monitored Tokens:</b> {len(config.get_token_index())}\n"
         f"👥 <b>Monitored Groups:</b> {len(token_config['CHAT_IDS'])}\n"
-        f"📡 <b>WebSocket:</b> {'Connected' if ws_task and not ws_task.done() else 'Disconnected'}\n\n"
+        f"📡 <b>WebSocket:</b> {f'Connected ({connections.live})' if connections.live else 'Disconnected'}\n"
+        f"⏱ <b>Event Loop Lag:</b> {metrics.loop_lag * 1000:.1f} ms\n\n"
+        "<b>XRPL Endpoints:</b>\n"
+        f"{endpoints_info}\n"
+        "<b>Pipeline:</b>\n"
+        f"{stages_info}"
+        f"- telegram: pending {notifier.pending()}, sent {notifier.sent}, "
+        f"failed {notifier.failed}, retried {notifier.retried}\n\n"
         "<b>Group Settings:</b>"
-        f"{groups_info}"
     )
 
-    await update.message.reply_text(status_message, parse_mode="HTML")
+    await reply_paged(update.message, [status_message] + groups_info)
+
+async def reply_paged(message, parts):
+    """Reply with the parts packed into as few messages as fit Telegram's length limit.
+
+    Pages go out through notifier.call(), so a flood wait halfway through
+    delays the remaining pages instead of losing them.
+    """
+    pages = [""]
+    for part in parts:
+        if pages[-1] and len(pages[-1]) + len(part) > MESSAGE_LIMIT:
+            pages.append("")
+        pages[-1] += part
+    for page in pages:
+        if page:
+            await notifier.call(lambda page=page: message.reply_text(page, parse_mode="HTML"))
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start or stop the sampling profiler (owner only)."""
+    if update.effective_user.id != OWNER_ID:
+        await update.message.reply_text("❌ Only the bot owner can use this command.")
+        return
+
+    action = context.args[0].lower() if context.args else ('stop' if profiler.running else 'start')
+    if action == 'start':
+        profiler.start()
+        await update.message.reply_text("✅ Profiler started. Use /profile stop to get the report.")
+    elif action == 'stop':
+        if not profiler.running:
+            await update.message.reply_text("❌ The profiler is not running.")
+            return
+        profiler.stop()
+        await update.message.reply_text(f"<pre>{escape(profiler.report())}</pre>", parse_mode="HTML")
+    else:
+        await update.message.reply_text("❌ Usage: /profile [start/stop]")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help message."""
@@ -521,25 +1330,90 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /threshold [amount] - Set minimum XRP amount for notifications
 /setmedia [url] [gif/photo] - Set notification media
 /setemoji [emoji] - Set notification emoji
+/settoken [issuer] [currency] - Set the token tracked in this group
+/volumeline [on/off] - Show the 24h volume in notifications
+/aggregate [amount] [seconds/ledgers] [wallet/all] - Merge split buys into one notification (or off)
+/board [on/text/off] [buys] [seconds] - Keep one pinned message with the latest buys instead of a post per buy
 
 <b>General Commands:</b>
 /status - Show current settings
+/stats - Show 1h/24h volume, buyers and biggest buy
 /help - Show this help message
 
 <b>Admin Commands:</b>
 /adminstatus - Show complete bot status (bot owner only)
+/profile [start/stop] - Sample where the bot spends its time (bot owner only)
 
 <b>Note:</b> 
 - Group admin permissions are required for management commands
 - All settings are group-specific
-- Each group can have different thresholds, media, and emojis
+- Each group can have different tokens, thresholds, media, and emojis
 """
     await update.message.reply_text(help_text, parse_mode="HTML")
 
-def main():
-    """Start the bot."""
-    # Create the Application
-    application = Application.builder().token(TOKEN).build()
+def start_pipeline(bot):
+    """Wire the classify -> dispatch -> notify path to a Bot (also used by replay.py)."""
+    notifier.attach(bot, send_summary)
+    pipeline.start(handle_transaction, dispatch_buy, classify_ledger)
+    aggregator.attach(lambda buy, wallets: notify_groups(buy, windowed=False, wallets=wallets))
+    boards.attach(render_board, edit_board)
+
+async def post_init(application: Application):
+    """Start background services once the event loop is running."""
+    start_pipeline(application.bot)
+    stream_state.start()
+    history.start()
+    prices.start(connections.connect, lambda: config.get_token_index().keys())
+    metrics.register(collect_metrics)
+    await metrics.start()
+    if broker is not None:
+        await broker.start()
+    if config.get_config()["CHAT_IDS"]:
+        start_stream()  # Resume monitoring without waiting for a /start
+        application.create_task(warm_caches(application.bot))
+
+async def post_stop(application: Application):
+    """Deliver what is already queued while the Bot can still send."""
+    global ws_task
+    if ws_task:
+        ws_task.cancel()
+        await asyncio.gather(ws_task, return_exceptions=True)
+        ws_task = None
+    # Queued buys are already marked as seen, so they would never be notified after a restart
+    await pipeline.drain()
+    await notifier.drain()
+
+async def post_shutdown(application: Application):
+    """Release background services on shutdown."""
+    if ws_task:
+        ws_task.cancel()
+    profiler.stop()
+    await metrics.stop()
+    if broker is not None:
+        await broker.close()
+    await pipeline.stop()
+    await stream_state.stop()
+    await history.stop()
+    await prices.stop()
+    await rpc.close()
+    if recorder:
+        recorder.close()
+    for provider in market_caps.values():
+        await provider.stop()
+    config.close()
+
+def build_application():
+    """The Application with every command handler, not started yet."""
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    application = builder.build()
     application.add_error_handler(error_handler)
 
     # Add command handlers
@@ -548,12 +1422,36 @@ def main():
     application.add_handler(CommandHandler("threshold", set_threshold))
     application.add_handler(CommandHandler("setmedia", set_media))
     application.add_handler(CommandHandler("setemoji", set_emoji))
+    application.add_handler(CommandHandler("settoken", set_token))
     application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("volumeline", set_volume_line))
+    application.add_handler(CommandHandler("aggregate", set_aggregate))
+    application.add_handler(CommandHandler("board", set_board))
     application.add_handler(CommandHandler("adminstatus", admin_status))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(ChatMemberHandler(chat_member_updated, ChatMemberHandler.ANY_CHAT_MEMBER))
     application.add_handler(CommandHandler("help", help_command))
+    return application
 
-    # Start the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+def main():
+    """Start the bot."""
+    if BOT_ROLE == 'worker':
+        asyncio.run(run_worker(SHARD_ID))
+        return
+
+    application = build_application()
+    if TELEGRAM_WEBHOOK_URL:
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
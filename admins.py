@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("BuyBot.Admins")
+
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', '600'))
+CHAT_TITLE_TTL = float(os.getenv('CHAT_TITLE_TTL', '3600'))
+CHAT_LOOKUP_CONCURRENCY = int(os.getenv('CHAT_LOOKUP_CONCURRENCY', '50'))
+ADMIN_STATUSES = ('creator', 'administrator')
+
+class AdminCache:
+    """Administrator ids per chat, loaded with one get_chat_administrators call.
+
+    Entries expire after the TTL and are dropped as soon as a ChatMemberUpdated
+    shows someone gaining or losing admin rights. Concurrent checks for the
+    same chat share one request.
+    """
+
+    def __init__(self, ttl=ADMIN_CACHE_TTL, concurrency=CHAT_LOOKUP_CONCURRENCY):
+        self.ttl = ttl
+        self._admins = {}    # chat_id -> (loaded_at, frozenset of user ids)
+        self._inflight = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def is_admin(self, bot, chat_id, user_id):
+        return user_id in await self.get(bot, chat_id)
+
+    async def get(self, bot, chat_id):
+        cached = self._admins.get(chat_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        task = self._inflight.get(chat_id)
+        if task is None or task.done():
+            task = self._inflight[chat_id] = asyncio.create_task(self._load(bot, chat_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, bot, chat_id):
+        try:
+            async with self._semaphore:
+                members = await bot.get_chat_administrators(chat_id)
+            admins = frozenset(member.user.id for member in members if member.status in ADMIN_STATUSES)
+            self._admins[chat_id] = (time.monotonic(), admins)
+            return admins
+        except Exception as e:
+            logger.error(f"Error loading administrators of {chat_id}: {e}")
+            cached = self._admins.get(chat_id)
+            return cached[1] if cached else frozenset()
+        finally:
+            self._inflight.pop(chat_id, None)
+
+    def invalidate(self, chat_id):
+        self._admins.pop(chat_id, None)
+
+    def member_updated(self, chat_id, old_status, new_status):
+        """Drop the cached admins of a chat when a member's admin status changed."""
+        if (old_status in ADMIN_STATUSES) != (new_status in ADMIN_STATUSES):
+            self.invalidate(chat_id)
+
+class ChatTitles:
+    """Cached chat titles, resolved concurrently with a deadline."""
+
+    def __init__(self, ttl=CHAT_TITLE_TTL, concurrency=CHAT_LOOKUP_CONCURRENCY):
+        self.ttl = ttl
+        self._titles = {}    # chat_id -> (resolved_at, title)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def remember(self, chat_id, title):
+        """Store a title seen on an incoming update, saving a get_chat later."""
+        if title:
+            self._titles[chat_id] = (time.monotonic(), title)
+
+    def cached(self, chat_id):
+        entry = self._titles.get(chat_id)
+        return entry[1] if entry else f"Group {chat_id}"
+
+    async def get(self, bot, chat_id):
+        entry = self._titles.get(chat_id)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        try:
+            async with self._semaphore:
+                chat = await bot.get_chat(chat_id)
+            self.remember(chat_id, chat.title)
+        except Exception as e:
+            logger.warning(f"Error resolving title of {chat_id}: {e}")
+        return self.cached(chat_id)
+
+    async def get_many(self, bot, chat_ids, timeout=None):
+        """Titles for many chats at once; lookups still running at the deadline
+        finish in the background and the last known title is used meanwhile."""
+        tasks = {chat_id: asyncio.ensure_future(self.get(bot, chat_id)) for chat_id in chat_ids}
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+        return {
+            chat_id: task.result() if task.done() else self.cached(chat_id)
+            for chat_id, task in tasks.items()
+        }
@@ -0,0 +1,92 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field, replace
+
+logger = logging.getLogger("BuyBot.Aggregate")
+
+LEDGER_SECONDS = float(os.getenv('LEDGER_SECONDS', '4'))  # fallback while no ledger close was seen
+
+@dataclass
+class Window:
+    """Buys of one group (and wallet) collected until the window closes."""
+    buy: object
+    threshold: float
+    wallets: set = field(default_factory=set)
+    biggest: float = 0.0
+    closes_at: int = None    # ledger index, for ledger windows
+    handle: object = None    # timer, for time windows
+
+class Aggregator:
+    """Per-group aggregation windows (GROUP_SETTINGS AGGREGATE_*).
+
+    Buys of a token are merged per wallet (AGGREGATE_BY 'wallet') or all
+    together ('all') for AGGREGATE_WINDOW seconds or ledgers
+    (AGGREGATE_UNIT). When the window closes the totals are checked against
+    the group threshold, so an order split into many small fills still
+    notifies once.
+    """
+
+    def __init__(self):
+        self.flush = None
+        self._windows = {}
+
+    def attach(self, flush):
+        """flush(buy, wallets) sends a closed window that met its threshold."""
+        self.flush = flush
+
+    def add(self, group, buy, ledger_index=None):
+        settings = group.settings
+        wallet = buy.tx.get('Account')
+        key = (group.chat_id, buy.token, wallet if settings.get('AGGREGATE_BY', 'wallet') == 'wallet' else None)
+
+        window = self._windows.get(key)
+        if window is not None:
+            window.buy.merge(buy)
+            window.buy.chat_ids = [group.chat_id]
+            if buy.xrp_spent > window.biggest:
+                # The notification shows the biggest buyer of the window
+                window.biggest = buy.xrp_spent
+                window.buy.tx = buy.tx
+                window.buy.holding = buy.holding
+            elif buy.holding and window.buy.holding and wallet == window.buy.tx.get('Account'):
+                # Same wallet as shown: newest balance, but it stays a new holder
+                window.buy.holding = (buy.holding[0], window.buy.holding[1])
+            window.wallets.add(wallet)
+            return
+
+        size = float(settings['AGGREGATE_WINDOW'])
+        window = self._windows[key] = Window(
+            # Windowed groups never get fast mode alerts, the window must not act on them
+            replace(buy, chat_ids=[group.chat_id], alert=None), group.threshold, {wallet}, buy.xrp_spent
+        )
+        if settings.get('AGGREGATE_UNIT', 'seconds') == 'ledgers' and ledger_index:
+            window.closes_at = ledger_index + int(size)
+        else:
+            seconds = size * LEDGER_SECONDS if settings.get('AGGREGATE_UNIT') == 'ledgers' else size
+            window.handle = asyncio.get_running_loop().call_later(seconds, self._close, key)
+
+    def ledger_closed(self, ledger_index):
+        """Close the ledger windows that ended with this ledger."""
+        if not ledger_index or not self._windows:
+            return
+        for key in [key for key, window in self._windows.items()
+                    if window.closes_at is not None and window.closes_at <= ledger_index]:
+            self._close(key)
+
+    def pending(self):
+        return len(self._windows)
+
+    def _close(self, key):
+        window = self._windows.pop(key, None)
+        if window is None:
+            return
+        if window.buy.xrp_spent < window.threshold:
+            return
+        task = asyncio.ensure_future(self.flush(window.buy, len(window.wallets)))
+        task.add_done_callback(self._log_error)
+
+    @staticmethod
+    def _log_error(task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error sending aggregated buys: {task.exception()}")
@@ -0,0 +1,99 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("BuyBot.Board")
+
+BOARD_SIZE = int(os.getenv('BOARD_SIZE', '10'))            # buys listed on a board
+BOARD_MAX_SIZE = 15                                        # captions are limited to 1024 characters
+BOARD_INTERVAL = float(os.getenv('BOARD_INTERVAL', '15'))  # minimum seconds between two edits
+
+class Board:
+    """One group's pinned board: the latest buys in a ring buffer plus edit state."""
+    __slots__ = ("chat_id", "buys", "interval", "rendered", "last_edit", "handle")
+
+    def __init__(self, chat_id, size, interval):
+        self.chat_id = chat_id
+        self.buys = deque(maxlen=size)  # (time, xrp_spent, value, account, count), oldest first
+        self.interval = interval
+        self.rendered = None            # content of the last edit
+        self.last_edit = 0.0
+        self.handle = None              # timer of the next edit
+
+class Boards:
+    """Board mode groups (GROUP_SETTINGS BOARD): one pinned message edited in place.
+
+    Buys only go into the group's ring buffer; at most one edit per
+    BOARD_INTERVAL is scheduled and it shows everything that arrived
+    meanwhile. An edit whose rendered content equals the last one is never
+    sent.
+    """
+
+    def __init__(self):
+        self.render = None
+        self.edit = None
+        self.edits = 0
+        self.unchanged = 0
+        self._boards = {}
+
+    def attach(self, render, edit):
+        """render(board) is a coroutine returning the content, edit(chat_id, content) sends it."""
+        self.render = render
+        self.edit = edit
+
+    def get(self, chat_id, settings):
+        size = min(int(settings.get('BOARD_SIZE') or BOARD_SIZE), BOARD_MAX_SIZE)
+        interval = float(settings.get('BOARD_INTERVAL') or BOARD_INTERVAL)
+        board = self._boards.get(chat_id)
+        if board is None:
+            board = self._boards[chat_id] = Board(chat_id, size, interval)
+        elif board.buys.maxlen != size:
+            board.buys = deque(board.buys, maxlen=size)
+        board.interval = interval
+        return board
+
+    def add(self, group, buy):
+        board = self.get(group.chat_id, group.settings)
+        board.buys.append((time.time(), buy.xrp_spent, buy.value, buy.tx.get('Account'), buy.count))
+        self._schedule(board)
+
+    def redraw(self, chat_id, settings):
+        """Schedule an edit even if the content looks unchanged, e.g. for a new board message."""
+        board = self.get(chat_id, settings)
+        board.rendered = None
+        self._schedule(board)
+
+    def remove(self, chat_id):
+        board = self._boards.pop(chat_id, None)
+        if board is not None and board.handle is not None:
+            board.handle.cancel()
+
+    def _schedule(self, board):
+        if board.handle is not None:
+            return  # The pending edit will include this buy
+        delay = max(board.last_edit + board.interval - time.monotonic(), 0.0)
+        board.handle = asyncio.get_running_loop().call_later(delay, self._flush, board)
+
+    def _flush(self, board):
+        board.handle = None
+        task = asyncio.ensure_future(self._refresh(board))
+        task.add_done_callback(self._log_error)
+
+    async def _refresh(self, board):
+        content = await self.render(board)
+        if content is None:
+            return
+        if content == board.rendered:
+            self.unchanged += 1
+            return
+        board.rendered = content
+        board.last_edit = time.monotonic()
+        self.edits += 1
+        self.edit(board.chat_id, content)
+
+    @staticmethod
+    def _log_error(task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error updating buy board: {task.exception()}")
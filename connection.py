@@ -0,0 +1,170 @@
+import os
+import ssl
+import json
+import time
+import random
+import asyncio
+import logging
+import certifi
+import websockets
+
+logger = logging.getLogger("BuyBot.Connection")
+
+STALL_TIMEOUT = float(os.getenv('XRPL_STALL_TIMEOUT', '15'))        # ledgers close every ~4s
+HEARTBEAT_INTERVAL = float(os.getenv('XRPL_HEARTBEAT_INTERVAL', '10'))
+BACKOFF_BASE = float(os.getenv('XRPL_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('XRPL_BACKOFF_MAX', '60'))
+RIPPLE_EPOCH = 946684800
+
+class Endpoint:
+    """Health bookkeeping for one XRPL websocket endpoint."""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None        # EWMA of ping round-trips, seconds
+        self.error_rate = 0.0      # EWMA of connection failures
+        self.ledger_lag = None     # seconds between ledger close and receipt
+        self.failures = 0          # consecutive failures, drives the backoff
+        self.in_use = False
+        self.reconnects = 0
+
+    def record_latency(self, rtt):
+        self.latency = rtt if self.latency is None else 0.8 * self.latency + 0.2 * rtt
+
+    def record_success(self):
+        self.failures = 0
+        self.error_rate *= 0.8
+
+    def record_error(self):
+        self.failures += 1
+        self.error_rate = 0.8 * self.error_rate + 0.2
+
+    def record_ledger(self, ledger_time):
+        self.ledger_lag = max(time.time() - (ledger_time + RIPPLE_EPOCH), 0.0)
+
+    def score(self):
+        """Lower is better: latency plus penalties for errors and stale ledgers."""
+        latency = self.latency if self.latency is not None else 0.5
+        lag = self.ledger_lag if self.ledger_lag is not None else 5.0
+        return latency + lag / 4 + self.error_rate * 10
+
+    def backoff(self):
+        """Full-jitter exponential backoff for the next reconnect."""
+        if not self.failures:
+            return 0
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** self.failures))
+
+class ConnectionManager:
+    """Keep the XRPL stream connected across a list of endpoints.
+
+    Endpoints are ranked by ping latency, ledger freshness and error rate. A
+    connection that stops delivering frames (ledger closes arrive every few
+    seconds) is treated as stalled and replaced. With hot_standby two
+    connections stay subscribed on different endpoints, both feed the sink and
+    the tx hash dedup drops the duplicates, so losing one costs no time.
+    """
+
+    def __init__(self, urls, sink, hot_standby=False, started_at=None):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.session = None
+        self.sink = sink
+        self.hot_standby = hot_standby and len(self.endpoints) > 1
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.live = 0
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.first_frame_at = None
+
+    def connect(self, url=None):
+        """Open a websocket to the given (or currently best) endpoint."""
+        if url is None:
+            url = min(self.endpoints, key=Endpoint.score).url
+        return websockets.connect(url, ssl=self.ssl_context if url.startswith('wss') else None)
+
+    async def run(self, session):
+        """Run session(websocket, read, primary) on one supervised connection, or two with hot standby."""
+        self.session = session
+        slots = 2 if self.hot_standby else 1
+        await asyncio.gather(*(self._supervise(slot) for slot in range(slots)))
+
+    def _pick(self):
+        candidates = [endpoint for endpoint in self.endpoints if not endpoint.in_use] or self.endpoints
+        return min(candidates, key=Endpoint.score)
+
+    async def _supervise(self, slot):
+        while True:
+            endpoint = self._pick()
+            endpoint.in_use = True
+            try:
+                async with self.connect(endpoint.url) as websocket:
+                    logger.info(f"[slot {slot}] Connected to {endpoint.url}")
+                    await self._ping(websocket, endpoint)
+                    primary = self.live == 0
+                    self.live += 1
+                    try:
+                        await self.session(websocket, lambda: self._read(websocket, endpoint), primary)
+                    finally:
+                        self.live -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                endpoint.record_error()
+                logger.error(f"[slot {slot}] Connection to {endpoint.url} lost: {e}")
+            finally:
+                endpoint.in_use = False
+                endpoint.reconnects += 1
+
+            delay = endpoint.backoff()
+            if delay:
+                logger.info(f"[slot {slot}] Reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _ping(self, websocket, endpoint):
+        started_at = time.monotonic()
+        pong = await websocket.ping()
+        await asyncio.wait_for(pong, STALL_TIMEOUT)
+        endpoint.record_latency(time.monotonic() - started_at)
+
+    async def _heartbeat(self, websocket, endpoint):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await self._ping(websocket, endpoint)
+
+    async def _read(self, websocket, endpoint):
+        """Feed frames to the sink until the connection drops or stalls."""
+        heartbeat = asyncio.create_task(self._heartbeat(websocket, endpoint))
+        try:
+            first_frame = True
+            while True:
+                if heartbeat.done():
+                    heartbeat.result()  # Re-raise the ping failure
+                try:
+                    frame = await asyncio.wait_for(websocket.recv(), STALL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise ConnectionError(f"No frames for {STALL_TIMEOUT}s, endpoint stalled")
+                if first_frame:
+                    endpoint.record_success()
+                    first_frame = False
+                    if self.first_frame_at is None:
+                        self.first_frame_at = time.monotonic()
+                        logger.info(f"Time to first frame: {self.first_frame_at - self.started_at:.2f}s")
+                if '"ledgerClosed"' in frame:
+                    ledger_time = json.loads(frame).get("ledger_time")
+                    if ledger_time:
+                        endpoint.record_ledger(ledger_time)
+                self.sink(frame)
+        finally:
+            heartbeat.cancel()
+
+    def status(self):
+        """Per-endpoint health for status reporting."""
+        return [
+            {
+                "url": endpoint.url,
+                "connected": endpoint.in_use,
+                "latency": endpoint.latency,
+                "ledger_lag": endpoint.ledger_lag,
+                "error_rate": endpoint.error_rate,
+                "reconnects": endpoint.reconnects,
+            }
+            for endpoint in self.endpoints
+        ]
@@ -1,6 +1,12 @@
 import os
 import json
+import time
+import shutil
+import sqlite3
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -8,14 +14,23 @@ load_dotenv()
 
 logger = logging.getLogger("BuyBot.DB")
 
+CONFIG_BACKEND = os.getenv('CONFIG_BACKEND', 'sqlite')  # 'sqlite' or 'json'
+CONFIG_DB = os.getenv('CONFIG_DB', 'config.db')
+SAVE_DEBOUNCE = float(os.getenv('CONFIG_SAVE_DEBOUNCE', '0.5'))
+# Telegram state stored alongside the settings; nothing is derived from it, so
+# changing it must not bump the version (and rebuild the routing table)
+CACHE_KEYS = ("MEDIA_FILE_IDS",)
+
 class TokenConfig:
-    def __init__(self) -> None:
+    def __init__(self, read_only=False) -> None:
         self.config_file = 'config.json'
+        self.read_only = read_only  # Keep changes in memory only, e.g. in notifier workers
         self.config = {
             "CHAT_IDS": [],  # Changed from single CHAT_ID to list of CHAT_IDS
             "TOKEN_ISSUER": os.getenv('TOKEN_ISSUER', 'r93hE5FNShDdUqazHzNvwsCxL9mSqwyiru'),
             "TOKEN_CURRENCY": os.getenv('TOKEN_CURRENCY', '52504C5300000000000000000000000000000000'),
             "GROUP_SETTINGS": {},  # New field to store per-group settings
+            "MEDIA_FILE_IDS": {},  # Telegram file_id for each media URL already uploaded
             "DEFAULT_SETTINGS": {
                 "THRESHOLD": os.getenv('THRESHOLD', '100'),
                 "EMOJI_ICON": os.getenv('EMOJI', '💥'),
@@ -23,7 +38,17 @@ class TokenConfig:
                 "TYPE": True  # True for GIF, False for image
             }
         }
+        self.version = 0
+        self._chat_ids = set()
+        self._token_index = None
+        self._dirty = False
+        self._save_handle = None
+        self._save_task = None
+        self._write_lock = threading.Lock()
+        self._snapshots = 0     # sequence number of the last snapshot taken
+        self._written = 0       # ... and of the last one on disk
         self.load_config()
+        self._chat_ids = set(self.config["CHAT_IDS"])
 
     def load_config(self):
         """Load configuration from file or create default."""
@@ -32,6 +57,7 @@ class TokenConfig:
                 with open(self.config_file, 'r', encoding='utf-8') as file:
                     saved_config = json.load(file)
                     self.config.update(saved_config)
+                    self.version += 1
                     logger.info("Configuration loaded successfully")
             else:
                 self.save_config()
@@ -41,23 +67,126 @@ class TokenConfig:
             self.save_config()
 
     def save_config(self):
-        """Save current configuration to file with a backup."""
+        """Save current configuration to file right away."""
+        self._touch()
+        self.flush()
+
+    def flush(self):
+        """Write the configuration now if there are pending changes."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._dirty = False
+        self._write_file(*self._serialize())
+
+    def close(self):
+        """Flush pending writes and release resources."""
+        if self._save_task is not None and not self._save_task.done():
+            # Write the final state here instead; a snapshot already handed to the
+            # thread is older than this flush, and _write_file skips it
+            self._save_task.cancel()
+            self._dirty = True
+        if self._dirty:
+            self.flush()
+
+    def _serialize(self):
+        """Return (sequence number, JSON) of the current configuration."""
+        # Runs on the caller's thread so the snapshot is consistent
+        self._snapshots += 1
+        return self._snapshots, json.dumps(self.config, indent=2, ensure_ascii=False)
+
+    def _write_file(self, sequence, data):
+        """Atomically replace the config file: a valid config.json exists at every instant."""
+        if self.read_only:
+            return
+        tmp_file = f"{self.config_file}.tmp"
+        with self._write_lock:
+            if sequence < self._written:
+                return  # A newer snapshot is already on disk (e.g. the final flush overtook a background write)
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                if os.path.exists(self.config_file):
+                    shutil.copy2(self.config_file, f"{self.config_file}.backup")
+                os.replace(tmp_file, self.config_file)
+                self._fsync_dir()
+                self._written = sequence
+                logger.info("Configuration saved successfully")
+            except Exception as e:
+                logger.error(f"Error saving configuration: {e}")
+
+    def _fsync_dir(self):
+        # Make the rename itself durable; not supported on every platform
         try:
-            if os.path.exists(self.config_file):
-                os.rename(self.config_file, f"{self.config_file}.backup")
-            with open(self.config_file, 'w', encoding='utf-8') as file:
-                json.dump(self.config, file, indent=2, ensure_ascii=False)
-            logger.info("Configuration saved successfully")
-        except Exception as e:
-            logger.error(f"Error saving configuration: {e}")
+            fd = os.open(os.path.dirname(os.path.abspath(self.config_file)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _schedule_save(self, touch=True):
+        """Mark the config dirty and coalesce bursts of changes into one off-loop write."""
+        if touch:
+            self._touch()
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (startup, scripts): write synchronously
+            self.flush()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(SAVE_DEBOUNCE, self._start_save)
+
+    def _start_save(self):
+        self._save_handle = None
+        if self._save_task is not None and not self._save_task.done():
+            # A write is still in flight, try again once the debounce elapses
+            self._save_handle = asyncio.get_running_loop().call_later(SAVE_DEBOUNCE, self._start_save)
+            return
+        self._save_task = asyncio.ensure_future(self._save_async())
+
+    async def _save_async(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        await asyncio.to_thread(self._write_file, *self._serialize())
+
+    def _touch(self):
+        """Invalidate everything derived from the configuration."""
+        self.version += 1
+        self._token_index = None
+
+    def _group_changed(self, chat_id):
+        """Persist a group that was added or whose settings changed."""
+        self._schedule_save()
+
+    def _group_removed(self, chat_id):
+        """Persist the removal of a group."""
+        self._schedule_save()
+
+    def _key_changed(self, key):
+        """Persist a changed top-level configuration value."""
+        self._schedule_save(touch=key not in CACHE_KEYS)
+
+    def has_group(self, chat_id):
+        """Check whether a group is being monitored."""
+        return chat_id in self._chat_ids
 
     def add_group(self, chat_id):
         """Add a new group to the configuration."""
         try:
-            if chat_id not in self.config["CHAT_IDS"]:
+            if not self.has_group(chat_id):
                 self.config["CHAT_IDS"].append(chat_id)
+                self._chat_ids.add(chat_id)
                 self.config["GROUP_SETTINGS"][str(chat_id)] = self.config["DEFAULT_SETTINGS"].copy()
-                self.save_config()
+                self._group_changed(chat_id)
                 logger.info(f"Added new group: {chat_id}")
                 return True
             return False
@@ -68,10 +197,11 @@ class TokenConfig:
     def remove_group(self, chat_id):
         """Remove a group from the configuration."""
         try:
-            if chat_id in self.config["CHAT_IDS"]:
+            if self.has_group(chat_id):
                 self.config["CHAT_IDS"].remove(chat_id)
+                self._chat_ids.discard(chat_id)
                 self.config["GROUP_SETTINGS"].pop(str(chat_id), None)
-                self.save_config()
+                self._group_removed(chat_id)
                 logger.info(f"Removed group: {chat_id}")
                 return True
             return False
@@ -90,13 +220,49 @@ class TokenConfig:
             if chat_id_str not in self.config["GROUP_SETTINGS"]:
                 self.config["GROUP_SETTINGS"][chat_id_str] = self.config["DEFAULT_SETTINGS"].copy()
             self.config["GROUP_SETTINGS"][chat_id_str].update(settings)
-            self.save_config()
+            self._group_changed(chat_id)
             logger.info(f"Updated settings for group: {chat_id}")
             return True
         except Exception as e:
             logger.error(f"Error updating group settings: {e}")
             return False
 
+    def get_group_token(self, chat_id):
+        """Get the (issuer, currency) pair monitored by a specific group."""
+        settings = self.config["GROUP_SETTINGS"].get(str(chat_id), {})
+        return (
+            settings.get("TOKEN_ISSUER", self.config["TOKEN_ISSUER"]),
+            settings.get("TOKEN_CURRENCY", self.config["TOKEN_CURRENCY"])
+        )
+
+    def get_token_index(self):
+        """Map every monitored (issuer, currency) pair to the groups watching it."""
+        if self._token_index is None:
+            index = {}
+            for chat_id in self.config["CHAT_IDS"]:
+                index.setdefault(self.get_group_token(chat_id), []).append(chat_id)
+            self._token_index = index
+        return self._token_index
+
+    def get_issuers(self):
+        """Get every issuer account that needs to be subscribed to."""
+        return sorted({issuer for issuer, _ in self.get_token_index()})
+
+    def get_media_file_id(self, url):
+        """Get the cached Telegram file_id for a media URL, if any."""
+        return self.config["MEDIA_FILE_IDS"].get(url)
+
+    def set_media_file_id(self, url, file_id):
+        """Remember the Telegram file_id returned for a media URL."""
+        if self.config["MEDIA_FILE_IDS"].get(url) != file_id:
+            self.config["MEDIA_FILE_IDS"][url] = file_id
+            self._key_changed("MEDIA_FILE_IDS")
+
+    def drop_media_file_id(self, url):
+        """Forget the cached file_id for a media URL."""
+        if self.config["MEDIA_FILE_IDS"].pop(url, None) is not None:
+            self._key_changed("MEDIA_FILE_IDS")
+
     def get_config(self):
         """Get current configuration."""
         return self.config
@@ -106,7 +272,9 @@ class TokenConfig:
         try:
             if key in self.config:
                 self.config[key] = value
-                self.save_config()
+                if key == "CHAT_IDS":
+                    self._chat_ids = set(value)
+                self._key_changed(key)
                 logger.info(f"Updated {key} configuration")
                 return True
             return False
@@ -134,9 +302,154 @@ class TokenConfig:
         config = self.get_config()
         groups_info = "\n".join([f"- Group {cid}: {self.get_group_settings(cid)}" 
                                for cid in config['CHAT_IDS']])
+        tokens_info = "\n".join([f"- {issuer} {currency}: {len(chat_ids)} group(s)"
+                                 for (issuer, currency), chat_ids in self.get_token_index().items()])
         return (
             "Current Configuration:\n"
             f"- Token Issuer: {config['TOKEN_ISSUER']}\n"
             f"- Token Currency: {config['TOKEN_CURRENCY']}\n"
+            f"- Monitored Tokens:\n{tokens_info}\n"
             f"- Monitored Groups:\n{groups_info}"
-        )
\ No newline at end of file
+        )
+
+class SQLiteTokenConfig(TokenConfig):
+    """TokenConfig stored in SQLite (WAL mode) with one row per group.
+
+    Reads are served from the in-memory mirror; every change writes only the
+    affected row, on a single background thread so the event loop never waits
+    on disk. The first start imports an existing config.json (or its backup).
+    """
+
+    def __init__(self, db_file=CONFIG_DB, read_only=False) -> None:
+        self.db_file = db_file
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config-db")
+        self._conn = None
+        super().__init__(read_only)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS groups ("
+                "chat_id INTEGER PRIMARY KEY, settings TEXT NOT NULL, added_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS groups_added_at ON groups (added_at)")
+        return self._conn
+
+    def load_config(self):
+        """Load configuration from the database, migrating config.json on first start."""
+        try:
+            conn = self._connect()
+            if conn.execute("SELECT 1 FROM settings WHERE key = 'SCHEMA_VERSION'").fetchone() is None:
+                self._migrate_json()
+
+            for key, value in conn.execute("SELECT key, value FROM settings WHERE key != 'SCHEMA_VERSION'"):
+                self.config[key] = json.loads(value)
+            self.config["CHAT_IDS"] = []
+            self.config["GROUP_SETTINGS"] = {}
+            for chat_id, settings in conn.execute("SELECT chat_id, settings FROM groups ORDER BY added_at"):
+                self.config["CHAT_IDS"].append(chat_id)
+                self.config["GROUP_SETTINGS"][str(chat_id)] = json.loads(settings)
+            self._touch()
+            logger.info("Configuration loaded successfully")
+        except Exception as e:
+            logger.error(f"Error loading configuration: {e}")
+
+    def _migrate_json(self):
+        """One-time import of the config.json/backup layout into the database."""
+        saved_config = None
+        for path in (self.config_file, f"{self.config_file}.backup"):
+            try:
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as file:
+                        saved_config = json.load(file)
+                    logger.info(f"Migrating configuration from {path}")
+                    break
+            except Exception as e:
+                logger.error(f"Error reading {path} for migration: {e}")
+
+        if saved_config:
+            self.config.update(saved_config)
+
+        conn = self._connect()
+        with conn:
+            for key, value in self.config.items():
+                if key not in ("CHAT_IDS", "GROUP_SETTINGS"):
+                    conn.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+            now = time.time()
+            for position, chat_id in enumerate(self.config["CHAT_IDS"]):
+                settings = self.config["GROUP_SETTINGS"].get(str(chat_id), self.config["DEFAULT_SETTINGS"])
+                conn.execute(
+                    "INSERT OR REPLACE INTO groups VALUES (?, ?, ?)",
+                    (chat_id, json.dumps(settings, ensure_ascii=False), now + position * 1e-6)
+                )
+            conn.execute("INSERT OR REPLACE INTO settings VALUES ('SCHEMA_VERSION', '1')")
+
+    def save_config(self):
+        """Rewrite the whole configuration in one transaction (changes are normally written per row)."""
+        self._touch()
+        statements = [
+            ("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+            for key, value in self.config.items() if key not in ("CHAT_IDS", "GROUP_SETTINGS")
+        ]
+        statements.append(("DELETE FROM groups", ()))
+        now = time.time()
+        for position, chat_id in enumerate(self.config["CHAT_IDS"]):
+            settings = self.config["GROUP_SETTINGS"].get(str(chat_id), self.config["DEFAULT_SETTINGS"])
+            statements.append((
+                "INSERT INTO groups VALUES (?, ?, ?)",
+                (chat_id, json.dumps(settings, ensure_ascii=False), now + position * 1e-6)
+            ))
+        self._write(*statements)
+
+    def close(self):
+        """Wait for pending writes and close the database."""
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _group_changed(self, chat_id):
+        self._touch()
+        settings = json.dumps(self.config["GROUP_SETTINGS"][str(chat_id)], ensure_ascii=False)
+        self._write((
+            "INSERT INTO groups VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET settings = excluded.settings",
+            (chat_id, settings, time.time())
+        ))
+
+    def _group_removed(self, chat_id):
+        self._touch()
+        self._write(("DELETE FROM groups WHERE chat_id = ?", (chat_id,)))
+
+    def _key_changed(self, key):
+        if key in ("CHAT_IDS", "GROUP_SETTINGS"):
+            return self.save_config()
+        if key not in CACHE_KEYS:
+            self._touch()
+        value = json.dumps(self.config[key], ensure_ascii=False)
+        self._write(("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, value)))
+
+    def _write(self, *statements):
+        if self.read_only:
+            return
+        # Serialised on one worker thread, in submission order
+        self._executor.submit(self._execute, statements)
+
+    def _execute(self, statements):
+        try:
+            conn = self._connect()
+            with conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+        except Exception as e:
+            logger.error(f"Error saving configuration: {e}")
+
+def open_config(read_only=False):
+    """Create the TokenConfig for the configured backend."""
+    if CONFIG_BACKEND == 'sqlite':
+        return SQLiteTokenConfig(read_only=read_only)
+    return TokenConfig(read_only)
@@ -0,0 +1,101 @@
+import logging
+
+logger = logging.getLogger("BuyBot.Deltas")
+
+def _balance_delta(entry, fields, value):
+    """Change of a Balance field between the previous and final state of a node."""
+    new_fields = entry.get("NewFields")
+    if new_fields is not None:
+        return value(new_fields.get("Balance"))
+    previous = entry.get("PreviousFields", {}).get("Balance")
+    if previous is None:
+        return 0.0
+    return value(fields.get("Balance")) - value(previous)
+
+def _drops(balance):
+    return int(balance or 0)
+
+def _iou(balance):
+    return float(balance["value"]) if balance else 0.0
+
+def balance_changes(meta, account, fee=0):
+    """Net XRP and token changes of one account, read from tx metadata in one pass.
+
+    Every ModifiedNode, CreatedNode and DeletedNode of type AccountRoot or
+    RippleState that belongs to the account is counted, so partial fills,
+    multi-hop paths and AMM swaps all come out as what actually arrived in or
+    left the wallet. The fee (in drops) is added back to the XRP change.
+
+    Returns (xrp, tokens) where xrp is in XRP and tokens maps
+    (issuer, currency) to the change in token units.
+    """
+    drops = 0
+    tokens = {}
+    for node in meta.get("AffectedNodes", []):
+        entry = node.get("ModifiedNode") or node.get("CreatedNode") or node.get("DeletedNode")
+        if entry is None:
+            continue
+        entry_type = entry.get("LedgerEntryType")
+        fields = entry.get("FinalFields") or entry.get("NewFields") or {}
+
+        if entry_type == "AccountRoot":
+            if fields.get("Account") == account:
+                drops += _balance_delta(entry, fields, _drops)
+        elif entry_type == "RippleState":
+            low = fields.get("LowLimit", {}).get("issuer")
+            high = fields.get("HighLimit", {}).get("issuer")
+            if account != low and account != high:
+                continue
+            # Balance is kept from the low account's point of view
+            delta = _balance_delta(entry, fields, _iou)
+            if account == high:
+                delta, issuer = -delta, low
+            else:
+                issuer = high
+            if delta:
+                token = (issuer, fields["Balance"]["currency"])
+                tokens[token] = tokens.get(token, 0.0) + delta
+
+    return (drops + int(fee)) / 1000000, tokens
+
+def trust_line_balances(meta):
+    """Final token balance on both sides of every trust line a transaction touched.
+
+    Yields (account, (issuer, currency), balance) where issuer is the other
+    side of the line; a side that owes instead of holds yields 0.
+    """
+    for node in meta.get("AffectedNodes", []):
+        entry = node.get("ModifiedNode") or node.get("CreatedNode") or node.get("DeletedNode")
+        if entry is None or entry.get("LedgerEntryType") != "RippleState":
+            continue
+        fields = entry.get("FinalFields") or entry.get("NewFields") or {}
+        low = fields.get("LowLimit", {}).get("issuer")
+        high = fields.get("HighLimit", {}).get("issuer")
+        balance = fields.get("Balance")
+        if not low or not high or not balance:
+            continue
+        value = 0.0 if "DeletedNode" in node else _iou(balance)
+        yield low, (high, balance["currency"]), max(value, 0.0)
+        yield high, (low, balance["currency"]), max(-value, 0.0)
+
+def transaction_changes(tx, meta):
+    """balance_changes() for the account that sent the transaction."""
+    return balance_changes(meta, tx["Account"], tx.get("Fee", 0))
+
+def ledger_changes(transactions):
+    """transaction_changes() for a batch, e.g. a whole ledger from backfill or replay.
+
+    Takes (tx, meta) pairs and returns the (xrp, tokens) of each sender in the
+    same order; a failed transaction or malformed metadata counts as no change.
+    """
+    changes = []
+    for tx, meta in transactions:
+        if meta.get("TransactionResult", "tesSUCCESS") != "tesSUCCESS":
+            changes.append((0.0, {}))
+            continue
+        try:
+            changes.append(transaction_changes(tx, meta))
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f"Malformed metadata in {tx.get('hash')}: {e}")
+            changes.append((0.0, {}))
+    return changes
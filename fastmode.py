@@ -0,0 +1,55 @@
+import os
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("BuyBot.FastMode")
+
+FAST_MAX_PENDING = int(os.getenv('FAST_MAX_PENDING', '1000'))
+FAST_ALERT_LEDGERS = int(os.getenv('FAST_ALERT_LEDGERS', '20'))  # when a tx has no LastLedgerSequence
+
+class PendingAlert:
+    """Alert posted for a proposed transaction, waiting for its validated result."""
+    __slots__ = ("tx_hash", "last_ledger", "messages", "settled")
+
+    def __init__(self, tx_hash, last_ledger):
+        self.tx_hash = tx_hash
+        self.last_ledger = last_ledger
+        self.messages = {}    # chat_id -> message_id of the posted alert
+        self.settled = False  # validated, failed or expired
+
+class FastAlerts:
+    """Bounded table of pending alerts by tx hash, in arrival order."""
+
+    def __init__(self, max_pending=FAST_MAX_PENDING):
+        self.max_pending = max_pending
+        self._alerts = OrderedDict()
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self._alerts
+
+    def add(self, tx_hash, last_ledger, current_ledger=None):
+        """Track a new alert; returns it and the alert evicted to stay bounded, if any."""
+        if not last_ledger:
+            last_ledger = current_ledger + FAST_ALERT_LEDGERS if current_ledger else None
+        alert = self._alerts[tx_hash] = PendingAlert(tx_hash, last_ledger)
+        evicted = None
+        if len(self._alerts) > self.max_pending:
+            _, evicted = self._alerts.popitem(last=False)
+            evicted.settled = True
+            logger.warning(f"Too many pending fast alerts, giving up on {evicted.tx_hash}")
+        return alert, evicted
+
+    def pop(self, tx_hash):
+        alert = self._alerts.pop(tx_hash, None)
+        if alert is not None:
+            alert.settled = True
+        return alert
+
+    def expire(self, ledger_index):
+        """Remove and return the alerts whose transaction can no longer validate."""
+        expired = [tx_hash for tx_hash, alert in self._alerts.items()
+                   if alert.last_ledger is not None and alert.last_ledger < ledger_index]
+        return [self.pop(tx_hash) for tx_hash in expired]
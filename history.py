@@ -0,0 +1,192 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("BuyBot.History")
+
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.db')
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '2'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '500'))
+BUCKET_SECONDS = 60
+WINDOW_BUCKETS = 24 * 60  # 24h of one-minute buckets
+
+class Bucket:
+    """Aggregates of all buys in one time slot."""
+    __slots__ = ("start", "volume", "tokens", "count", "buyers", "latest", "biggest", "biggest_account")
+
+    def __init__(self, start):
+        self.start = start
+        self.volume = 0.0
+        self.tokens = 0.0
+        self.count = 0
+        self.buyers = set()
+        self.latest = 0  # buyers whose most recent buy is in this bucket
+        self.biggest = 0.0
+        self.biggest_account = None
+
+class RollingStats:
+    """Ring buffer of time buckets for one token, covering the last 24h.
+
+    Adding a buy touches one bucket and queries walk at most WINDOW_BUCKETS
+    buckets, so cost never depends on how much history is stored. Unique
+    buyers are counted in the bucket of each buyer's most recent buy, so a
+    window's count is a sum as well instead of a union of buyer sets.
+    """
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS, buckets=WINDOW_BUCKETS):
+        self.bucket_seconds = bucket_seconds
+        self.ring = [None] * buckets
+        self.latest = {}  # account -> start of the bucket holding its most recent buy
+
+    def add(self, timestamp, account, xrp_spent, tokens):
+        start = int(timestamp // self.bucket_seconds) * self.bucket_seconds
+        slot = (start // self.bucket_seconds) % len(self.ring)
+        bucket = self.ring[slot]
+        if bucket is None or bucket.start < start:
+            if bucket is not None:
+                self._expire(bucket)
+            bucket = self.ring[slot] = Bucket(start)
+        elif bucket.start > start:
+            return  # Older than the window
+
+        bucket.volume += xrp_spent
+        bucket.tokens += tokens
+        bucket.count += 1
+        bucket.buyers.add(account)
+        if xrp_spent > bucket.biggest:
+            bucket.biggest = xrp_spent
+            bucket.biggest_account = account
+
+        previous = self.latest.get(account)
+        if previous is None or previous < start:
+            if previous is not None:
+                self.ring[(previous // self.bucket_seconds) % len(self.ring)].latest -= 1
+            bucket.latest += 1
+            self.latest[account] = start
+
+    def _expire(self, bucket):
+        """Forget the buyers whose most recent buy leaves the window with this bucket."""
+        for account in bucket.buyers:
+            if self.latest.get(account) == bucket.start:
+                del self.latest[account]
+
+    def summary(self, window, now=None):
+        """Volume, buy count, unique buyers and biggest buy over the last `window` seconds."""
+        now = time.time() if now is None else now
+        since = now - window
+        volume = tokens = biggest = 0.0
+        count = buyers = 0
+        biggest_account = None
+        for bucket in self.ring:
+            if bucket is None or bucket.start + self.bucket_seconds <= since or bucket.start > now:
+                continue
+            volume += bucket.volume
+            tokens += bucket.tokens
+            count += bucket.count
+            buyers += bucket.latest
+            if bucket.biggest > biggest:
+                biggest = bucket.biggest
+                biggest_account = bucket.biggest_account
+        return {
+            "volume": volume,
+            "tokens": tokens,
+            "count": count,
+            "buyers": buyers,
+            "biggest": biggest,
+            "biggest_account": biggest_account,
+        }
+
+class TradeHistory:
+    """Append-only store of every classified buy plus rolling per-token aggregates.
+
+    Buys are buffered and inserted in batches on a background thread; the
+    aggregates are rebuilt from the last 24h of rows at startup.
+    """
+
+    def __init__(self, db_file=HISTORY_DB):
+        self.db_file = db_file
+        self.stats = {}
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-db")
+        self._conn = None
+        self._flush_task = None
+        self.load()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS trades ("
+                "hash TEXT PRIMARY KEY, ledger_index INTEGER, ts REAL NOT NULL, "
+                "issuer TEXT NOT NULL, currency TEXT NOT NULL, account TEXT NOT NULL, "
+                "xrp REAL NOT NULL, tokens REAL NOT NULL, price REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS trades_token_ts ON trades (issuer, currency, ts)")
+        return self._conn
+
+    def load(self):
+        """Rebuild the rolling aggregates from the stored history."""
+        try:
+            since = time.time() - BUCKET_SECONDS * WINDOW_BUCKETS
+            rows = self._connect().execute(
+                "SELECT issuer, currency, ts, account, xrp, tokens FROM trades WHERE ts >= ? ORDER BY ts", (since,)
+            )
+            for issuer, currency, ts, account, xrp, tokens in rows:
+                self.get_stats((issuer, currency)).add(ts, account, xrp, tokens)
+        except Exception as e:
+            logger.error(f"Error loading trade history: {e}")
+
+    def get_stats(self, token):
+        """Get the rolling aggregates of an (issuer, currency) pair."""
+        stats = self.stats.get(token)
+        if stats is None:
+            stats = self.stats[token] = RollingStats()
+        return stats
+
+    def record(self, tx_hash, ledger_index, timestamp, token, account, xrp_spent, tokens):
+        """Record a buy: aggregates update immediately, the row is written with the next batch."""
+        self.get_stats(token).add(timestamp, account, xrp_spent, tokens)
+        price = xrp_spent / tokens if tokens else 0.0
+        self._pending.append((tx_hash, ledger_index, timestamp, token[0], token[1], account, xrp_spent, tokens, price))
+        if len(self._pending) >= HISTORY_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered rows to the writer thread."""
+        if self._pending:
+            rows, self._pending = self._pending, []
+            self._executor.submit(self._insert, rows)
+
+    def _insert(self, rows):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except Exception as e:
+            logger.error(f"Error saving trade history: {e}")
+
+    def start(self):
+        """Flush buffered rows periodically in the background."""
+        if not self._flush_task or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Write everything still buffered and close the database."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(HISTORY_FLUSH_INTERVAL)
+            self.flush()
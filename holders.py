@@ -0,0 +1,98 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from deltas import trust_line_balances
+
+logger = logging.getLogger("BuyBot.Holders")
+
+HOLDER_CACHE_SIZE = int(os.getenv('HOLDER_CACHE_SIZE', '50000'))
+HOLDER_CACHE_TTL = float(os.getenv('HOLDER_CACHE_TTL', '900'))
+HOLDER_BUDGET = float(os.getenv('HOLDER_BUDGET', '0.25'))  # seconds a notification waits for a lookup
+
+# Sorts after every transaction of the ledger a lookup was answered from
+LEDGER_END = 1 << 32
+
+class Holdings:
+    """Token balances of buyer wallets in a bounded LRU cache with a TTL.
+
+    Balances are kept current from the RippleState nodes of the metadata we
+    already receive, tagged with (ledger, transaction index) so backfilled
+    frames never overwrite newer state. A wallet missing from the cache costs
+    one account_lines request, shared by everyone asking for it meanwhile.
+    """
+
+    def __init__(self, client, size=HOLDER_CACHE_SIZE, ttl=HOLDER_CACHE_TTL):
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self._balances = OrderedDict()  # (account, issuer, currency) -> (updated_at, version, balance)
+        self._inflight = {}
+        self.cache = {"hit": 0, "miss": 0, "timeout": 0}
+
+    def __len__(self):
+        return len(self._balances)
+
+    def observe(self, meta, ledger_index=None):
+        """Update the balances of every trust line a validated transaction touched."""
+        version = (ledger_index or 0, meta.get("TransactionIndex", 0))
+        for account, token, balance in trust_line_balances(meta):
+            self._store((account, *token), version, balance)
+
+    @staticmethod
+    def holding(meta, account, token, bought):
+        """(balance, new holder) of a buyer right after its transaction, read from the metadata."""
+        for holder, line, balance in trust_line_balances(meta):
+            if holder == account and line == token:
+                return balance, balance <= bought
+        return None
+
+    async def get(self, account, token, timeout=HOLDER_BUDGET):
+        """Current balance of a wallet, or None if it is not known within the timeout.
+
+        A lookup still running at the deadline finishes in the background and
+        fills the cache for the next buy of the same wallet.
+        """
+        key = (account, *token)
+        entry = self._balances.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self._balances.move_to_end(key)
+            self.cache["hit"] += 1
+            return entry[2]
+
+        self.cache["miss"] += 1
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = self._inflight[key] = asyncio.create_task(self._load(key))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.cache["timeout"] += 1
+            return None
+
+    async def _load(self, key):
+        account, issuer, currency = key
+        try:
+            result = await self.client.request(
+                "account_lines", account=account, peer=issuer, ledger_index="validated"
+            )
+            balance = sum(max(float(line["balance"]), 0.0)
+                          for line in result.get("lines", []) if line.get("currency") == currency)
+            self._store(key, (result.get("ledger_index") or 0, LEDGER_END), balance)
+            return self._balances.get(key, (None, None, balance))[2]
+        except Exception as e:
+            logger.warning(f"Error looking up the {currency} balance of {account}: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key, version, balance):
+        entry = self._balances.get(key)
+        if entry is not None:
+            if entry[1] > version:
+                return  # Already newer than this update
+            self._balances.move_to_end(key)
+        self._balances[key] = (time.monotonic(), version, balance)
+        if len(self._balances) > self.size:
+            self._balances.popitem(last=False)
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger("BuyBot.Market")
+
+TOKEN_ACTIVITY_URL = "https://api.firstledger.net/api/token-activity"
+# XRP/USD comes from a stablecoin AMM pool (RLUSD by default)
+XRP_USD_ISSUER = os.getenv('XRP_USD_ISSUER', 'rMxCKbEDwqr76QuheSUMdEGf4B9xJ8m5De')
+XRP_USD_CURRENCY = os.getenv('XRP_USD_CURRENCY', '524C555344000000000000000000000000000000')
+PRICE_REFRESH = float(os.getenv('PRICE_REFRESH', '300'))
+SUPPLY_REFRESH = float(os.getenv('SUPPLY_REFRESH', '3600'))
+
+class MarketCapProvider:
+    """Async market cap lookups backed by a shared TTL cache.
+
+    Concurrent callers share a single in-flight request, an expired value is
+    refreshed in the background while it is still served, and the last known
+    value is served whenever the upstream API is slow or unavailable.
+    """
+
+    def __init__(self, issuer, currency, ttl=30.0, timeout=5.0, url=TOKEN_ACTIVITY_URL):
+        self.issuer = issuer
+        self.currency = currency
+        self.ttl = ttl
+        self.timeout = timeout
+        self.url = url
+        self.value = 0.0
+        self.updated_at = 0.0
+        self._client = None
+        self.cache = {"hit": 0, "stale": 0, "miss": 0}
+        self._inflight = None
+
+    def is_fresh(self):
+        """Return True if the cached value is younger than the TTL."""
+        return bool(self.updated_at) and time.monotonic() - self.updated_at < self.ttl
+
+    async def get(self):
+        """Return the market cap without ever blocking longer than the timeout."""
+        if self.is_fresh():
+            self.cache["hit"] += 1
+            return self.value
+
+        task = self.refresh()
+        if self.updated_at:
+            # Stale but usable: answer now and let the refresh finish in the background
+            self.cache["stale"] += 1
+            return self.value
+
+        self.cache["miss"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            logger.error("Market cap lookup timed out, serving last known value")
+            return self.value
+
+    def peek(self):
+        """Return the cached value (None before the first answer) without waiting, refreshing it when due."""
+        if self.is_fresh():
+            self.cache["hit"] += 1
+            return self.value
+        self.refresh()
+        if self.updated_at:
+            self.cache["stale"] += 1
+            return self.value
+        self.cache["miss"] += 1
+        return None
+
+    def refresh(self):
+        """Start a refresh unless one is already in flight and return its task."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+        return self._inflight
+
+    async def stop(self):
+        """Close the HTTP client."""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+
+        payload = {
+            "issuer": self.issuer,
+            "currency": self.currency,
+            "user_xrp_address": ""
+        }
+
+        try:
+            response = await self._client.post(self.url, json=payload)
+            if response.status_code != 200:
+                logger.error(f"Error fetching token activity: {response.status_code} - {response.text}")
+                return self.value
+
+            market_cap = parse_market_cap(response.json())
+            if market_cap:
+                self.value = market_cap
+                self.updated_at = time.monotonic()
+            else:
+                logger.error("Missing circulating supply or price data in API response.")
+        except Exception as e:
+            logger.error(f"Error calculating market cap: {e}")
+        return self.value
+
+def parse_market_cap(data):
+    """Extract the market cap from a token-activity API response."""
+    # Attempt to get market cap directly from the response
+    price_changes = data.get("Price_Changes", [])
+    if price_changes and "market_cap" in price_changes[0]:
+        return float(price_changes[0]["market_cap"])
+
+    # If market cap is not directly available, calculate it
+    circulating_supply = float(data.get("circulating_supply", 0))
+    price_per_token = float(data.get("price_usd", 0))
+    return circulating_supply * price_per_token
+
+class TokenPrice:
+    """Ledger-derived price state of one token against XRP."""
+
+    def __init__(self, issuer, currency):
+        self.issuer = issuer
+        self.currency = currency
+        self.amm_account = None
+        self.pool_xrp = None        # XRP in the AMM pool
+        self.pool_tokens = None     # tokens in the AMM pool
+        self.pool_ledger = 0
+        self.last_trade_price = None
+        self.supply = None          # issuer obligations
+
+    def price(self):
+        """XRP per token: the AMM spot price, else the last trade."""
+        if self.pool_xrp and self.pool_tokens:
+            return self.pool_xrp / self.pool_tokens
+        return self.last_trade_price
+
+    def market_cap_xrp(self):
+        price = self.price()
+        if self.supply and price:
+            return self.supply * price
+        return None
+
+    def update_pool(self, account, pool_xrp, pool_tokens, ledger_index):
+        # Backfilled or duplicated transactions must not roll the pool back
+        if ledger_index and ledger_index < self.pool_ledger:
+            return
+        self.amm_account = account
+        self.pool_xrp = pool_xrp
+        self.pool_tokens = pool_tokens
+        self.pool_ledger = ledger_index or self.pool_ledger
+
+class PriceEngine:
+    """Price and market cap derived from the ledger instead of an HTTP API.
+
+    AMM pool balances are read from the metadata of transactions we already
+    receive, trade prices from classified buys, and supply (issuer
+    obligations) plus pool snapshots from gateway_balances/amm_info on a slow
+    refresh, so a buy costs no extra requests.
+    """
+
+    def __init__(self):
+        self.tokens = {}
+        self.usd = TokenPrice(XRP_USD_ISSUER, XRP_USD_CURRENCY)
+        self._refresh_task = None
+
+    def track(self, token):
+        """Get the price state of an (issuer, currency) pair, tracking it from now on."""
+        price = self.tokens.get(token)
+        if price is None:
+            price = self.tokens[token] = TokenPrice(*token)
+        return price
+
+    def observe(self, meta, ledger_index=None):
+        """Update AMM pools touched by a transaction from its metadata, in one pass."""
+        amm_balances = {}
+        lines = []
+        for node in meta.get("AffectedNodes", []):
+            entry = node.get("ModifiedNode") or node.get("CreatedNode")
+            if entry is None:
+                continue
+            fields = entry.get("FinalFields") or entry.get("NewFields") or {}
+            if entry.get("LedgerEntryType") == "AccountRoot" and "AMMID" in fields:
+                pool_xrp = int(fields.get("Balance", 0)) / 1000000
+                if pool_xrp > 0:  # Token/token pools hold no XRP and say nothing about our price
+                    amm_balances[fields.get("Account")] = pool_xrp
+            elif entry.get("LedgerEntryType") == "RippleState" and "Balance" in fields:
+                lines.append(fields)
+
+        if not amm_balances:
+            return
+
+        for fields in lines:
+            high = fields.get("HighLimit", {}).get("issuer")
+            low = fields.get("LowLimit", {}).get("issuer")
+            currency = fields["Balance"].get("currency")
+            for amm_account, issuer in ((high, low), (low, high)):
+                if amm_account not in amm_balances:
+                    continue
+                price = self.usd if (issuer, currency) == (self.usd.issuer, self.usd.currency) else self.tokens.get((issuer, currency))
+                # There is one XRP pool per token, once known (amm_info) no other account is it
+                if price is not None and price.amm_account in (None, amm_account):
+                    pool_tokens = abs(float(fields["Balance"].get("value", 0)))
+                    price.update_pool(amm_account, amm_balances[amm_account], pool_tokens, ledger_index)
+
+    def observe_trade(self, token, xrp_spent, tokens):
+        """Remember the price paid by a classified buy."""
+        if xrp_spent and tokens:
+            self.track(token).last_trade_price = xrp_spent / tokens
+
+    def xrp_usd(self):
+        """USD per XRP from the stablecoin pool, if known."""
+        price = self.usd.price()
+        return 1 / price if price else None
+
+    def market_cap_usd(self, token):
+        """Market cap in USD, or None until supply, price and XRP/USD are all known."""
+        price = self.tokens.get(token)
+        market_cap = price.market_cap_xrp() if price else None
+        xrp_usd = self.xrp_usd()
+        if market_cap is None or xrp_usd is None:
+            return None
+        return market_cap * xrp_usd
+
+    def start(self, connect, tokens):
+        """Refresh supply and pool snapshots in the background; tokens() lists what to track."""
+        if not self._refresh_task or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(connect, tokens))
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def _refresh_loop(self, connect, tokens):
+        last_supply_refresh = 0.0
+        while True:
+            refresh_supply = time.monotonic() - last_supply_refresh >= SUPPLY_REFRESH
+            try:
+                await self.refresh(connect, list(tokens()), refresh_supply)
+                if refresh_supply:
+                    last_supply_refresh = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error refreshing ledger prices: {e}")
+            await asyncio.sleep(PRICE_REFRESH)
+
+    async def refresh(self, connect, tokens, refresh_supply=True):
+        """Fetch pool snapshots (amm_info) and, optionally, supply (gateway_balances)."""
+        async with connect() as websocket:
+            async def request(payload):
+                await websocket.send(json.dumps(payload))
+                return json.loads(await websocket.recv()).get("result", {})
+
+            for price in [self.track(token) for token in tokens] + [self.usd]:
+                result = await request({
+                    "command": "amm_info",
+                    "asset": {"currency": "XRP"},
+                    "asset2": {"currency": price.currency, "issuer": price.issuer},
+                    "ledger_index": "validated"
+                })
+                amm = result.get("amm")
+                if amm:
+                    amounts = [amm.get("amount"), amm.get("amount2")]
+                    pool_xrp = next((int(a) / 1000000 for a in amounts if isinstance(a, str)), None)
+                    pool_tokens = next((float(a["value"]) for a in amounts if isinstance(a, dict)), None)
+                    price.update_pool(amm.get("account"), pool_xrp, pool_tokens, result.get("ledger_index"))
+
+                if refresh_supply and price is not self.usd:
+                    result = await request({
+                        "command": "gateway_balances",
+                        "account": price.issuer,
+                        "ledger_index": "validated"
+                    })
+                    obligations = result.get("obligations", {})
+                    if price.currency in obligations:
+                        price.supply = float(obligations[price.currency])
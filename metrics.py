@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+logger = logging.getLogger("BuyBot.Metrics")
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT')  # Optional, e.g. 9108
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+
+# Seconds, from a fast local classify up to a Telegram send stuck in retries
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to observe on every frame."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {self.sum}"
+        yield f"{name}_count{_format_labels(labels)} {self.count}"
+
+class Metrics:
+    """Prometheus text exposition of the bot's state on a local HTTP port.
+
+    Hot paths only bump plain counters and histograms on their own objects;
+    collectors registered here read them when the endpoint is scraped. The
+    event loop lag is measured by a task that oversleeps when the loop is busy.
+    """
+
+    def __init__(self):
+        self.collectors = []
+        self.loop_lag = 0.0
+        self.loop_lag_histogram = Histogram()
+        self._server = None
+        self._lag_task = None
+
+    def register(self, collect):
+        """Add collect(), yielding (name, type, help, [(labels, value), ...]) families."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        families = [("buybot_event_loop_lag_seconds", "histogram", "Event loop scheduling delay",
+                     [({}, self.loop_lag_histogram)])]
+        for collect in self.collectors:
+            try:
+                families.extend(collect())
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {e}")
+
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind == "histogram":
+                    lines.extend(value.lines(name, labels))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def start(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Start the loop lag monitor and, if a port is configured, the HTTP endpoint."""
+        if not self._lag_task or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self._watch_loop(LOOP_LAG_INTERVAL))
+        if port and self._server is None:
+            self._server = await asyncio.start_server(self._handle, host, int(port))
+            logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _watch_loop(self, interval):
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(time.monotonic() - started_at - interval, 0.0)
+            self.loop_lag_histogram.observe(self.loop_lag)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = (await asyncio.wait_for(reader.readline(), 5)).split()
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass  # Headers are not needed
+            if len(request) > 1 and request[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", self.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+class SamplingProfiler:
+    """Sample the event loop thread's stack from a side thread.
+
+    Costs nothing while stopped; while running, the loop thread is only
+    inspected every `interval` seconds, so it can be left on in production for
+    a while to see where the loop spends its time.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.own = Counter()         # samples where the function was executing
+        self.cumulative = Counter()  # samples where the function was on the stack
+        self.samples = 0
+        self.started_at = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start sampling the calling thread (the event loop)."""
+        if self.running:
+            return
+        self.own.clear()
+        self.cumulative.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(),), name="profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, thread_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[self._key(frame)] += 1
+            seen = set()
+            while frame is not None:
+                key = self._key(frame)
+                if key not in seen:
+                    seen.add(key)
+                    self.cumulative[key] += 1
+                frame = frame.f_back
+
+    @staticmethod
+    def _key(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def report(self, limit=15):
+        """Top functions by own time, with their share of the cumulative time."""
+        if not self.samples:
+            return "No samples collected."
+        lines = [f"{self.samples} samples over {time.monotonic() - self.started_at:.1f}s", "own   cum   function"]
+        for key, count in self.own.most_common(limit):
+            lines.append(f"{count / self.samples:5.1%} {self.cumulative[key] / self.samples:5.1%} {key}")
+        return "\n".join(lines)
@@ -0,0 +1,247 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+from collections import Counter, deque
+from dataclasses import replace
+from datetime import timedelta
+from telegram.error import RetryAfter, NetworkError, BadRequest, Forbidden
+from metrics import Histogram
+
+logger = logging.getLogger("BuyBot.Notifier")
+
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))         # messages per second
+CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '20'))             # messages per minute per group
+CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+BIG_BUY_XRP = float(os.getenv('BIG_BUY_XRP', '1000'))
+DIGEST_BACKLOG = int(os.getenv('DIGEST_BACKLOG', '3'))
+MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '3'))
+LATENCY_SAMPLES = int(os.getenv('NOTIFY_LATENCY_SAMPLES', '1000'))
+DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+
+# Priority classes, lower is sent first
+PRIORITY_BIG = 0
+PRIORITY_NORMAL = 1
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self):
+        """Empty the bucket, e.g. after Telegram told us to slow down."""
+        self._refill()
+        self.tokens = 0
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (overlapping pauses do not add up)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class Job:
+    """One pending message for one chat."""
+
+    def __init__(self, send, buy=None):
+        self.send = send
+        self.buy = buy
+        self.attempts = 0
+
+    @property
+    def priority(self):
+        if self.buy is not None and self.buy.xrp_spent >= BIG_BUY_XRP:
+            return PRIORITY_BIG
+        return PRIORITY_NORMAL
+
+def retry_seconds(error):
+    """The flood wait of a RetryAfter in seconds (newer python-telegram-bot gives a timedelta)."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        retry_after = retry_after.total_seconds()
+    return retry_after
+
+def mergeable(job):
+    """A plain buy notification; fast mode alerts and their edits are always sent as they are."""
+    return job.buy is not None and job.buy.alert is None
+
+class Notifier:
+    """Rate-limit aware outbound scheduler for Telegram messages.
+
+    Every chat gets its own priority queue and token bucket, all chats share a
+    global bucket, and Telegram's retry_after is honoured. When a chat falls
+    behind, its pending buys are merged into a single digest message.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self.digest = None
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # frame received -> message sent, seconds
+        self.latency = Histogram()
+        self.by_chat = {"sent": Counter(), "failed": Counter(), "retried": Counter()}
+        self._buckets = {}
+        self._queues = {}
+        self._workers = {}
+        self._seq = 0
+
+    def attach(self, bot, digest):
+        """Use the long-lived Bot of the Application; digest(buy, chat_id) sends a summary."""
+        self.bot = bot
+        self.digest = digest
+
+    def fan_out(self, chat_ids, send, buy=None):
+        """Schedule send(chat_id) for every chat without waiting for delivery."""
+        for chat_id in chat_ids:
+            self.submit(chat_id, Job(send, buy))
+
+    def submit(self, chat_id, job):
+        """Queue a job for one chat and make sure its worker is running."""
+        queue = self._queues.setdefault(chat_id, [])
+        if mergeable(job) and len(queue) >= DIGEST_BACKLOG:
+            job = self._merge_backlog(chat_id, queue, job)
+        self._push(queue, job)
+
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            self._workers[chat_id] = asyncio.create_task(self._run(chat_id))
+
+    async def call(self, send, retries=MAX_RETRIES):
+        """Run send() right away, outside the chat queues (e.g. the pages of a command reply).
+
+        It takes a token from the global bucket like every notification, and a
+        flood wait pauses everything and is waited out instead of failing.
+        """
+        for attempt in range(retries + 1):
+            await self.global_bucket.acquire()
+            try:
+                return await send()
+            except RetryAfter as e:
+                if attempt == retries:
+                    raise
+                retry_after = retry_seconds(e)
+                logger.warning(f"Rate limited replying to a command, retrying in {retry_after}s")
+                self.global_bucket.pause(retry_after)
+                await asyncio.sleep(retry_after)
+
+    def pending(self):
+        """Total number of messages waiting to be sent."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """Wait until every queued message has been sent (or failed), e.g. before shutting down."""
+        deadline = time.monotonic() + timeout
+        while True:
+            workers = [worker for worker in self._workers.values() if not worker.done()]
+            if not workers:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Shutting down with {self.pending()} notifications unsent")
+                return False
+            # Sending can queue more (e.g. a retraction), so look again once these finish
+            await asyncio.wait(workers, timeout=remaining)
+
+    def _push(self, queue, job):
+        self._seq += 1
+        heapq.heappush(queue, (job.priority, self._seq, job))
+
+    def _merge_backlog(self, chat_id, queue, job):
+        """Fold every pending buy for this chat into one digest job."""
+        buys = [entry[2].buy for entry in queue if mergeable(entry[2])]
+        if not buys:
+            return job
+        queue[:] = [entry for entry in queue if not mergeable(entry[2])]
+        heapq.heapify(queue)
+
+        summary = replace(buys[0])
+        for buy in buys[1:] + [job.buy]:
+            summary.merge(buy)
+        logger.warning(f"Group {chat_id} is backed up, merging {summary.count} buys into a digest")
+
+        async def send(chat_id):
+            await self.digest(summary, chat_id)
+
+        return Job(send, summary)
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(CHAT_RATE / 60, CHAT_BURST)
+        return bucket
+
+    async def _run(self, chat_id):
+        queue = self._queues[chat_id]
+        bucket = self._bucket(chat_id)
+        while queue:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            if not queue:
+                break
+            _, _, job = heapq.heappop(queue)
+            await self._send(chat_id, job, bucket)
+        self._queues.pop(chat_id, None)
+
+    async def _send(self, chat_id, job, bucket):
+        while True:
+            job.attempts += 1
+            try:
+                await job.send(chat_id)
+                self.sent += 1
+                self.by_chat["sent"][chat_id] += 1
+                if job.buy is not None:
+                    latency = time.monotonic() - job.buy.received_at
+                    self.latencies.append(latency)
+                    self.latency.observe(latency)
+                return
+            except RetryAfter as e:
+                retry_after = retry_seconds(e)
+                logger.warning(f"Rate limited in group {chat_id}, retrying in {retry_after}s")
+                bucket.drain()
+                # Flood waits are usually bot-wide, so every other chat holds back as well
+                self.global_bucket.pause(retry_after)
+                delay = retry_after
+            except (BadRequest, Forbidden) as e:
+                # Permanent (chat gone, bot removed, bad file_id, ...): retrying only blocks the queue
+                self.failed += 1
+                self.by_chat["failed"][chat_id] += 1
+                logger.error(f"Notification to group {chat_id} was rejected: {e}")
+                return
+            except NetworkError as e:
+                # Timeouts and transport errors (BadRequest is a NetworkError too, handled above)
+                if job.attempts > MAX_RETRIES:
+                    self.failed += 1
+                    self.by_chat["failed"][chat_id] += 1
+                    logger.error(f"Giving up on notification to group {chat_id}: {e}")
+                    return
+                delay = min(2 ** job.attempts, 30) * random.uniform(0.5, 1.5)
+                logger.warning(f"Network error for group {chat_id}, retrying in {delay:.1f}s: {e}")
+            except Exception as e:
+                self.failed += 1
+                self.by_chat["failed"][chat_id] += 1
+                logger.error(f"Error sending notification to group {chat_id}: {e}")
+                return
+            self.retried += 1
+            self.by_chat["retried"][chat_id] += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,209 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from metrics import Histogram
+
+logger = logging.getLogger("BuyBot.Pipeline")
+
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+DISPATCH_QUEUE_SIZE = int(os.getenv('DISPATCH_QUEUE_SIZE', '100'))
+DISPATCH_OVERFLOW = os.getenv('DISPATCH_OVERFLOW', 'coalesce')  # 'coalesce' or 'drop'
+DISPATCH_DROP_BELOW = float(os.getenv('DISPATCH_DROP_BELOW', '0'))
+DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '10'))  # seconds to finish queued work on shutdown
+
+@dataclass
+class Buy:
+    """A classified buy waiting to be dispatched to its groups."""
+    value: float
+    xrp_spent: float
+    tx: dict
+    chat_ids: list
+    token: tuple = None
+    received_at: float = field(default_factory=time.monotonic)
+    count: int = 1
+    proposed: bool = False  # estimated from a proposed tx, not yet validated
+    alert: object = None    # fast mode PendingAlert this buy belongs to
+    holding: tuple = None   # (balance after the buy, new holder) of the buying wallet
+
+    def merge(self, other):
+        """Fold another buy into this one, producing a summary."""
+        self.value += other.value
+        self.xrp_spent += other.xrp_spent
+        self.chat_ids = list(dict.fromkeys(self.chat_ids + other.chat_ids))
+        self.received_at = min(self.received_at, other.received_at)
+        self.count += other.count
+
+class StageMetrics:
+    """Counters and processing lag for one pipeline stage."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.processed = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.latency = Histogram()  # frame received -> stage done
+
+    def observe(self, started_at, count=1):
+        lag = time.monotonic() - started_at
+        self.processed += count
+        self.latency.observe(lag)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self):
+        return {
+            "depth": self.queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+        }
+
+class Pipeline:
+    """Ingest -> classify -> dispatch stages connected by bounded queues.
+
+    Readers only push frames so the websocket never waits on Telegram.
+    classify(frame) returns a Buy or None and dispatch(buy) delivers it; both
+    stages run as long-lived tasks that survive websocket reconnects.
+    classify_batch(transactions) classifies a batch of decoded transactions
+    (backfill, replay) at once and returns its buys.
+    """
+
+    def __init__(self, overflow=DISPATCH_OVERFLOW, drop_below=DISPATCH_DROP_BELOW):
+        self.classify = None
+        self.classify_batch = None
+        self.dispatch = None
+        self.overflow = overflow
+        self.drop_below = drop_below
+        self.ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.dispatch_queue = asyncio.Queue(maxsize=DISPATCH_QUEUE_SIZE)
+        self.ingest = StageMetrics(self.ingest_queue)
+        self.dispatcher = StageMetrics(self.dispatch_queue)
+        self.received = 0
+        self.buys = 0
+        self._summaries = {}
+        self._tasks = []
+
+    def start(self, classify, dispatch, classify_batch=None):
+        """Start the classifier and dispatcher stages."""
+        self.classify = classify
+        self.classify_batch = classify_batch
+        self.dispatch = dispatch
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._classify_loop()),
+                asyncio.create_task(self._dispatch_loop()),
+            ]
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """Wait until every queued frame has been classified and every buy dispatched.
+
+        Called on shutdown before stop(): their tx hashes are already marked as
+        seen, so a buy still queued then would never be notified.
+        """
+        try:
+            await asyncio.wait_for(self._join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutting down with {self.ingest_queue.qsize()} frames and "
+                           f"{self.dispatch_queue.qsize()} buys still queued")
+            return False
+
+    async def _join(self):
+        await self.ingest_queue.join()  # Classifying queues the buys before a frame counts as done
+        await self.dispatch_queue.join()
+
+    async def stop(self):
+        """Cancel the classifier and dispatcher stages."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def push(self, frame):
+        """Hand a received frame to the classifier without ever blocking the reader."""
+        self.received += 1
+        try:
+            self.ingest_queue.put_nowait((frame, time.monotonic()))
+        except asyncio.QueueFull:
+            self.ingest.dropped += 1
+            logger.error("Ingest queue full, dropping frame")
+
+    async def feed(self, frame):
+        """Queue a frame from a non-live source (e.g. backfill), waiting for room."""
+        self.received += 1
+        await self.ingest_queue.put((frame, time.monotonic()))
+
+    async def feed_batch(self, transactions):
+        """Queue decoded transactions (e.g. a ledger or backfill page) for classify_batch."""
+        if not transactions:
+            return
+        self.received += len(transactions)
+        await self.ingest_queue.put((transactions, time.monotonic()))
+
+    def metrics(self):
+        """Return queue depth and lag for every stage."""
+        return {"classify": self.ingest.snapshot(), "dispatch": self.dispatcher.snapshot()}
+
+    async def _classify_loop(self):
+        while True:
+            frame, received_at = await self.ingest_queue.get()
+            batch = isinstance(frame, list)  # Frames are str or bytes
+            try:
+                buys = self.classify_batch(frame) if batch else [self.classify(frame)]
+            except Exception as e:
+                logger.error(f"Error processing transaction: {e}")
+                buys = []
+            self.ingest.observe(received_at, len(frame) if batch else 1)
+            for buy in buys:
+                if buy is None:
+                    continue
+                if buy.chat_ids:
+                    self.buys += 1  # Above at least one threshold, not only collected by windows
+                buy.received_at = received_at
+                await self._enqueue(buy)
+            self.ingest_queue.task_done()
+
+    async def _enqueue(self, buy):
+        try:
+            self.dispatch_queue.put_nowait(buy)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if buy.alert is not None:
+            # A fast mode alert or its validation edit: folding it into a summary would
+            # count a proposed estimate twice or leave the unconfirmed message behind
+            await self.dispatch_queue.put(buy)
+        elif self.overflow == 'coalesce':
+            # Merge the backlog into one summary per token that goes out once the queue drains
+            summary = self._summaries.get(buy.token)
+            if summary is None:
+                self._summaries[buy.token] = buy
+            else:
+                summary.merge(buy)
+        elif buy.xrp_spent < self.drop_below:
+            self.dispatcher.dropped += 1
+            logger.warning(f"Dispatch queue full, dropping {buy.xrp_spent:.2f} XRP buy")
+        else:
+            await self.dispatch_queue.put(buy)
+
+    async def _dispatch_loop(self):
+        while True:
+            buy = await self.dispatch_queue.get()
+            await self._deliver(buy)
+            if self._summaries and self.dispatch_queue.empty():
+                summaries, self._summaries = self._summaries, {}
+                for summary in summaries.values():
+                    await self._deliver(summary)
+            self.dispatch_queue.task_done()
+
+    async def _deliver(self, buy):
+        try:
+            await self.dispatch(buy)
+        except Exception as e:
+            logger.error(f"Error dispatching buy: {e}")
+        self.dispatcher.observe(buy.received_at)
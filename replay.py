@@ -0,0 +1,225 @@
+"""Record raw XRPL stream frames and replay them through the bot offline.
+
+Set XRPL_RECORD_FILE to have the running bot append every received frame to a
+gzip compressed JSONL file, then replay it against a mock Bot:
+
+    python replay.py frames.jsonl.gz                 # real time
+    python replay.py frames.jsonl.gz --speed 10      # 10x faster
+    python replay.py frames.jsonl.gz --speed 0       # as fast as possible
+    python replay.py frames.jsonl.gz --batch         # classify a ledger at a time, like a backfill
+
+Groups, thresholds and media come from the normal config (point CONFIG_DB or
+CONFIG_BACKEND at a copy to replay against other settings). Stream state and
+trade history go to a temporary directory so a replay never touches live data.
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter
+from types import SimpleNamespace
+
+logger = logging.getLogger("BuyBot.Replay")
+
+class FrameRecorder:
+    """Append raw stream frames with their receive time to a gzip JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        # Level 1 keeps compression cheap on the reader's hot path
+        self._file = gzip.open(path, 'at', encoding='utf-8', compresslevel=1)
+
+    def wrap(self, sink):
+        """Return a sink that records each frame before passing it on."""
+        def record(frame):
+            self.write(frame)
+            sink(frame)
+        return record
+
+    def write(self, frame):
+        if isinstance(frame, bytes):
+            frame = frame.decode('utf-8')
+        self._file.write(json.dumps({"t": time.time(), "frame": frame}) + "\n")
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+def read_frames(path):
+    """Yield (received_at, frame) pairs, stopping quietly at a truncated tail."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                yield entry["t"], entry["frame"]
+    except EOFError:
+        logger.warning(f"{path} ends with an incomplete block, replaying what was readable")
+
+async def replay(path, emit, speed=1.0):
+    """Feed recorded frames to emit(frame), keeping their spacing divided by speed (0 = no waiting)."""
+    first_at = started_at = None
+    count = 0
+    for recorded_at, frame in read_frames(path):
+        if first_at is None:
+            first_at, started_at = recorded_at, time.monotonic()
+        elif speed:
+            delay = (recorded_at - first_at) / speed - (time.monotonic() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await emit(frame)
+        count += 1
+    return count
+
+class LedgerBatcher:
+    """Group validated transaction frames by ledger for Pipeline.feed_batch, like a backfill."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.pending = []
+
+    async def emit(self, frame):
+        transaction = json.loads(frame)
+        if transaction.get("type") == "transaction" and transaction.get("validated") and "meta" in transaction:
+            if self.pending and self.pending[-1].get("ledger_index") != transaction.get("ledger_index"):
+                await self.flush()
+            self.pending.append(transaction)
+            return
+        await self.flush()  # Everything else keeps its place in the stream
+        await self.pipeline.feed(frame)
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        await self.pipeline.feed_batch(batch)
+
+class ReplaySocket:
+    """Websocket stand-in that swallows subscribe requests."""
+
+    async def send(self, message):
+        pass
+
+class MockBot:
+    """Stand-in for telegram.Bot that accepts every send/edit/delete after a fixed delay."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = Counter()
+        self._message_id = 0
+
+    def __getattr__(self, name):
+        if not name.startswith(('send_', 'edit_', 'delete_', 'pin_', 'unpin_')):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            self.calls[name] += 1
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            self._message_id += 1
+            return SimpleNamespace(
+                message_id=self._message_id, chat_id=kwargs.get('chat_id'),
+                animation=None, document=None, photo=None
+            )
+        return call
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+async def run(path, speed=0.0, delay=0.0, batch=False):
+    """Replay a recording through the bot until every notification is sent; returns the measurements.
+
+    With batch, the transactions of each ledger are classified together as a backfill does.
+    """
+    import BuyBot as bot
+
+    # No HTTP fallback while replaying, only what the ledger data yields
+    bot.current_market_cap = bot.prices.market_cap_usd
+    mock = MockBot(delay)
+    bot.start_pipeline(mock)
+
+    frames = 0
+
+    async def read():
+        nonlocal frames
+        if batch:
+            batcher = LedgerBatcher(bot.pipeline)
+            frames = await replay(path, batcher.emit, speed)
+            await batcher.flush()
+        else:
+            frames = await replay(path, bot.pipeline.feed, speed)
+
+    started_at = time.monotonic()
+    cpu_started_at = time.process_time()
+    await bot.xrpl_stream(ReplaySocket(), read, False)
+    await bot.pipeline.drain(float("inf"))
+    await bot.notifier.drain(float("inf"))
+    elapsed = time.monotonic() - started_at
+    cpu = time.process_time() - cpu_started_at
+    await bot.pipeline.stop()
+
+    latencies = list(bot.notifier.latencies)
+    return {
+        "frames": frames,
+        "elapsed": elapsed,
+        "cpu": cpu,
+        "pipeline": bot.pipeline.metrics(),
+        "buys": bot.pipeline.buys,
+        "sent": bot.notifier.sent,
+        "failed": bot.notifier.failed,
+        "calls": dict(mock.calls),
+        "latency": {fraction: percentile(latencies, fraction) for fraction in (0.5, 0.95, 0.99)},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def report(stats):
+    frames, elapsed, cpu, metrics = stats["frames"], stats["elapsed"], stats["cpu"], stats["pipeline"]
+    latency = stats["latency"]
+    print(f"Frames:       {frames} in {elapsed:.2f}s ({frames / elapsed if elapsed else 0:,.0f}/s)")
+    print(f"CPU:          {cpu:.2f}s ({cpu / frames * 1e6 if frames else 0:,.1f} us/frame)")
+    print(f"Classified:   {metrics['classify']['processed']} (dropped {metrics['classify']['dropped']})")
+    print(f"Dispatched:   {metrics['dispatch']['processed']} (dropped {metrics['dispatch']['dropped']})")
+    print(f"Buys:         {stats['buys']} ({stats['sent']} messages sent, {stats['failed']} failed)")
+    print(f"Bot calls:    {stats['calls']}")
+    print(f"Notify p50/p95/p99: {latency[0.5] * 1000:.1f} / {latency[0.95] * 1000:.1f} / {latency[0.99] * 1000:.1f} ms")
+    if stats["peak_rss_mb"] is not None:
+        print(f"Peak RSS:     {stats['peak_rss_mb']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded XRPL frames through the bot against a mock Bot.")
+    parser.add_argument("path", help="gzip JSONL file written with XRPL_RECORD_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 for as fast as possible")
+    parser.add_argument("--bot-delay", type=float, default=0.05, help="simulated Telegram round-trip in seconds")
+    parser.add_argument("--unthrottled", action="store_true", help="lift the Telegram rate limits")
+    parser.add_argument("--batch", action="store_true", help="classify a ledger at a time, like a backfill")
+    args = parser.parse_args()
+
+    # Must be in place before BuyBot (and its modules) read the environment
+    state_dir = tempfile.mkdtemp(prefix="buybot-replay-")
+    os.environ.setdefault('STREAM_STATE_FILE', os.path.join(state_dir, 'stream_state.json'))
+    os.environ.setdefault('HISTORY_DB', os.path.join(state_dir, 'history.db'))
+    os.environ.setdefault('OWNER_ID', '0')
+    if args.unthrottled:
+        os.environ['TELEGRAM_GLOBAL_RATE'] = '1000000'
+        os.environ['TELEGRAM_CHAT_RATE'] = '1000000'
+        os.environ['TELEGRAM_CHAT_BURST'] = '1000000'
+
+    report(asyncio.run(run(args.path, args.speed, args.bot_delay, args.batch)))
+
+if __name__ == '__main__':
+    main()
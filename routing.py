@@ -0,0 +1,107 @@
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from telegram import InlineKeyboardButton
+
+logger = logging.getLogger("BuyBot.Routing")
+
+def decode_currency(currency_code):
+    """Convert currency code from hex to string if needed."""
+    try:
+        if len(currency_code) == 40:  # Hex format
+            return bytes.fromhex(currency_code).decode('utf-8').strip('\x00')
+    except ValueError:
+        pass  # Keep original if conversion fails
+    return currency_code
+
+@dataclass(frozen=True)
+class GroupRoute:
+    """Precomputed settings of one group."""
+    chat_id: int
+    threshold: float
+    settings: MappingProxyType
+
+@dataclass(frozen=True)
+class TokenRoute:
+    """Everything needed to route and render a buy of one token."""
+    issuer: str
+    currency: str
+    ticker: str
+    header: str
+    footer: str
+    chart_button: InlineKeyboardButton
+    thresholds: tuple
+    groups: tuple
+    by_chat: MappingProxyType = field(repr=False)
+    windowed: tuple = ()
+
+    def eligible(self, xrp_spent, inclusive=True):
+        """Groups whose threshold is met, found with a single bisect."""
+        find = bisect_right if inclusive else bisect_left
+        return self.groups[:find(self.thresholds, xrp_spent)]
+
+@dataclass(frozen=True)
+class RoutingTable:
+    """Immutable snapshot of all token routes for one config version."""
+    version: int
+    routes: MappingProxyType
+    markers: tuple = ()
+
+    def is_candidate(self, frame):
+        """Cheap substring checks that reject frames no route could match.
+
+        A frame can only classify as a buy if it carries a Payment or OfferCreate
+        and one of our currency codes appears as a JSON string, so anything else
+        is skipped before the full decode.
+        """
+        if '"Payment"' not in frame and '"OfferCreate"' not in frame:
+            return False
+        return any(marker in frame for marker in self.markers)
+
+def build_routing_table(config):
+    """Compile the current TokenConfig into a RoutingTable."""
+    routes = {}
+    for token, chat_ids in config.get_token_index().items():
+        issuer, currency = token
+        ticker = decode_currency(currency)
+
+        groups = []
+        for chat_id in chat_ids:
+            settings = config.get_group_settings(chat_id)
+            try:
+                threshold = float(settings['THRESHOLD'])
+            except (ValueError, TypeError):
+                logger.error(f"Invalid threshold for group {chat_id}: {settings['THRESHOLD']}")
+                continue
+            groups.append(GroupRoute(chat_id, threshold, MappingProxyType(dict(settings))))
+        groups.sort(key=lambda group: group.threshold)
+
+        routes[token] = TokenRoute(
+            issuer=issuer,
+            currency=currency,
+            ticker=ticker,
+            header=f"🚀 <b>New ${ticker} Buy!</b>\n\n",
+            footer=f"🤖 <b>in:</b> {len(chat_ids)} TG group(s)",
+            chart_button=InlineKeyboardButton("Chart", url=f"https://firstledger.net/token/{issuer}/{currency}"),
+            thresholds=tuple(group.threshold for group in groups),
+            groups=tuple(groups),
+            by_chat=MappingProxyType({group.chat_id: group for group in groups}),
+            windowed=tuple(group for group in groups if group.settings.get('AGGREGATE_WINDOW'))
+        )
+    markers = tuple(sorted({f'"{currency}"' for _, currency in routes}))
+    return RoutingTable(config.version, MappingProxyType(routes), markers)
+
+class Router:
+    """Serve the current RoutingTable, rebuilding it only after the config changed."""
+
+    def __init__(self, config):
+        self.config = config
+        self.table = None
+
+    def snapshot(self):
+        table = self.table
+        if table is None or table.version != self.config.version:
+            # Swap in a complete new table so readers never see a half-built one
+            table = self.table = build_routing_table(self.config)
+        return table
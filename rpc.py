@@ -0,0 +1,49 @@
+import os
+import logging
+import httpx
+
+logger = logging.getLogger("BuyBot.RPC")
+
+XRPL_RPC_URL = os.getenv('XRPL_RPC_URL', 'https://xrplcluster.com')
+RPC_MAX_CONNECTIONS = int(os.getenv('RPC_MAX_CONNECTIONS', '20'))
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '5'))
+
+class RpcError(Exception):
+    """The node answered a JSON-RPC request with an error."""
+
+    def __init__(self, method, error, message=None):
+        super().__init__(f"{method} failed: {message or error}")
+        self.error = error
+
+class JsonRpcClient:
+    """Async XRPL JSON-RPC client over a pool of keep-alive connections.
+
+    The HTTP client is created on first use, so importing this module or
+    building the client outside the event loop costs nothing.
+    """
+
+    def __init__(self, url=XRPL_RPC_URL, max_connections=RPC_MAX_CONNECTIONS, timeout=RPC_TIMEOUT):
+        self.url = url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+
+    async def request(self, method, **params):
+        """Send one request and return its result, raising RpcError for node errors."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        response = await self._client.post(self.url, json={"method": method, "params": [params]})
+        response.raise_for_status()
+        result = response.json()["result"]
+        if result.get("status") == "error":
+            raise RpcError(method, result.get("error"), result.get("error_message"))
+        return result
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,193 @@
+import os
+import json
+import random
+import asyncio
+import hashlib
+import logging
+from bisect import bisect
+from collections import deque
+
+try:
+    import redis.asyncio as aioredis  # Optional, only for a Redis broker
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger("BuyBot.Shard")
+
+SHARD_BROKER = os.getenv('SHARD_BROKER', 'unix://buybot.sock')  # redis://host:6379/0 or unix://path
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_VNODES = int(os.getenv('SHARD_VNODES', '64'))
+SHARD_BACKLOG = int(os.getenv('SHARD_BACKLOG', '10000'))  # per shard, while its worker is away
+SHARD_STREAM_MAXLEN = int(os.getenv('SHARD_STREAM_MAXLEN', '100000'))
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), 'big')
+
+class ShardRing:
+    """Consistent hash ring mapping chat ids to shards.
+
+    Each shard owns SHARD_VNODES points on the ring, so changing the number
+    of workers only moves about 1/N of the chats (and their rate-limit state).
+    """
+
+    def __init__(self, shards=SHARD_COUNT, vnodes=SHARD_VNODES):
+        points = sorted((_hash(f"{shard}:{vnode}"), shard) for shard in range(shards) for vnode in range(vnodes))
+        self.shards = shards
+        self._keys = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard(self, chat_id):
+        return self._owners[bisect(self._keys, _hash(chat_id)) % len(self._keys)]
+
+class SocketBroker:
+    """Built-in broker over a Unix socket: the ingest process listens, workers connect.
+
+    Messages for a shard whose worker is not connected wait in a bounded
+    backlog (oldest dropped first) and are flushed when it connects. Delivery
+    is at most once; use Redis for redelivery after a worker crash.
+    """
+
+    def __init__(self, path, backlog=SHARD_BACKLOG):
+        self.path = path
+        self.backlog = backlog
+        self._writers = {}
+        self._pending = {}
+        self._server = None
+        self.dropped = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left over from a previous run
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+        logger.info(f"Shard broker listening on {self.path}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def publish(self, shard, message):
+        line = (json.dumps(message) + "\n").encode('utf-8')
+        writer = self._writers.get(shard)
+        if writer is not None and not writer.is_closing():
+            writer.write(line)
+            return
+        pending = self._pending.setdefault(shard, deque())
+        if len(pending) >= self.backlog:
+            pending.popleft()
+            self.dropped += 1
+        pending.append(line)
+
+    async def _handle(self, reader, writer):
+        shard = None
+        try:
+            shard = json.loads(await reader.readline())["shard"]
+            old = self._writers.get(shard)
+            if old is not None:
+                old.close()
+            self._writers[shard] = writer
+            pending = self._pending.pop(shard, ())
+            writer.writelines(pending)
+            logger.info(f"Worker for shard {shard} connected, {len(pending)} queued messages flushed")
+            while await reader.read(4096):
+                pass  # Workers never send anything else; wait for them to go away
+        except Exception as e:
+            logger.error(f"Shard worker connection failed: {e}")
+        finally:
+            if shard is not None and self._writers.get(shard) is writer:
+                del self._writers[shard]
+                logger.warning(f"Worker for shard {shard} disconnected")
+            writer.close()
+
+    async def consume(self, shard):
+        """Yield the messages of one shard, reconnecting to the ingest process as needed."""
+        failures = 0
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=2 ** 20)
+                writer.write((json.dumps({"shard": shard}) + "\n").encode('utf-8'))
+                await writer.drain()
+                logger.info(f"Consuming shard {shard} from {self.path}")
+                failures = 0
+                async for line in reader:
+                    yield json.loads(line)
+                writer.close()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.error(f"Shard broker unavailable: {e}")
+            failures += 1
+            await asyncio.sleep(random.uniform(0, min(30, 0.5 * 2 ** failures)))
+
+class RedisBroker:
+    """Redis streams broker: one capped stream per shard, read through a consumer group.
+
+    Messages are acknowledged once handed to the notifier, so a restarted
+    worker picks up whatever its predecessor had not taken yet.
+    """
+
+    GROUP = "workers"
+
+    def __init__(self, url, maxlen=SHARD_STREAM_MAXLEN):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for a redis:// SHARD_BROKER")
+        self.redis = aioredis.from_url(url)
+        self.maxlen = maxlen
+        self._tasks = set()
+
+    @staticmethod
+    def stream(shard):
+        return f"buybot:shard:{shard}"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.redis.aclose()
+
+    def publish(self, shard, message):
+        # Fire and forget so the dispatcher never waits on the broker
+        task = asyncio.create_task(self._publish(shard, message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, shard, message):
+        try:
+            await self.redis.xadd(self.stream(shard), {"m": json.dumps(message)}, maxlen=self.maxlen, approximate=True)
+        except Exception as e:
+            logger.error(f"Error publishing to shard {shard}: {e}")
+
+    async def consume(self, shard):
+        stream = self.stream(shard)
+        try:
+            await self.redis.xgroup_create(stream, self.GROUP, id="0", mkstream=True)
+        except Exception:
+            pass  # The group already exists
+        consumer = f"shard-{shard}"
+        start = "0"  # First whatever this consumer left unacknowledged, then new messages
+        while True:
+            try:
+                response = await self.redis.xreadgroup(self.GROUP, consumer, {stream: start}, count=100, block=5000)
+            except Exception as e:
+                logger.error(f"Error reading shard {shard}: {e}")
+                await asyncio.sleep(1)
+                continue
+            entries = response[0][1] if response else []
+            if start == "0" and not entries:
+                start = ">"
+                continue
+            for entry_id, fields in entries:
+                yield json.loads(fields[b"m"])
+                await self.redis.xack(stream, self.GROUP, entry_id)
+
+def open_broker(url=SHARD_BROKER):
+    """Create the broker for a redis:// or unix:// URL."""
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisBroker(url)
+    if url.startswith('unix://'):
+        return SocketBroker(url[len('unix://'):])
+    raise ValueError(f"Unsupported SHARD_BROKER: {url}")
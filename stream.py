@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("BuyBot.Stream")
+
+STATE_FILE = os.getenv('STREAM_STATE_FILE', 'stream_state.json')
+SEEN_HASHES_MAX = int(os.getenv('SEEN_HASHES_MAX', '10000'))
+SEEN_HASHES_TTL = float(os.getenv('SEEN_HASHES_TTL', '86400'))
+BACKFILL_MAX_LEDGERS = int(os.getenv('BACKFILL_MAX_LEDGERS', '1000'))
+BACKFILL_PAGE_LIMIT = int(os.getenv('BACKFILL_PAGE_LIMIT', '200'))
+BACKFILL_PAGE_DELAY = float(os.getenv('BACKFILL_PAGE_DELAY', '0.25'))
+
+class StreamState:
+    """Last fully processed ledger and recently seen tx hashes, persisted across restarts."""
+
+    def __init__(self, path=STATE_FILE, max_hashes=SEEN_HASHES_MAX, ttl=SEEN_HASHES_TTL):
+        self.path = path
+        self.max_hashes = max_hashes
+        self.ttl = ttl
+        self.last_ledger = None
+        self._seen = OrderedDict()
+        self._dirty = False
+        self._flush_task = None
+        self.load()
+
+    def load(self):
+        """Load the saved state, starting empty if there is none."""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    state = json.load(file)
+                self.last_ledger = state.get("LAST_LEDGER")
+                now = time.time()
+                for tx_hash, seen_at in state.get("SEEN", []):
+                    if now - seen_at < self.ttl:
+                        self._seen[tx_hash] = seen_at
+        except Exception as e:
+            logger.error(f"Error loading stream state: {e}")
+
+    def save(self):
+        """Write the state atomically so a crash never leaves a torn file."""
+        state = {"LAST_LEDGER": self.last_ledger, "SEEN": list(self._seen.items())}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error saving stream state: {e}")
+
+    def mark_seen(self, tx_hash):
+        """Record a tx hash, returning False if it was already processed."""
+        now = time.time()
+        seen_at = self._seen.get(tx_hash)
+        if seen_at is not None and now - seen_at < self.ttl:
+            return False
+
+        self._seen[tx_hash] = now
+        self._seen.move_to_end(tx_hash)
+        while len(self._seen) > self.max_hashes:
+            self._seen.popitem(last=False)
+        self._dirty = True
+        return True
+
+    def is_seen(self, tx_hash):
+        """True if the tx hash was processed recently, without recording it."""
+        seen_at = self._seen.get(tx_hash)
+        return seen_at is not None and time.time() - seen_at < self.ttl
+
+    def ledger_closed(self, ledger_index):
+        """A ledgerClosed for N is published before N's transactions, so N - 1 is complete."""
+        if ledger_index and (self.last_ledger is None or ledger_index - 1 > self.last_ledger):
+            self.last_ledger = ledger_index - 1
+            self._dirty = True
+
+    def start(self, interval=10):
+        """Periodically persist the state in the background."""
+        if not self._flush_task or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """Stop the background flush and write the final state."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.save()
+
+    async def _flush_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                self.save()
+
+async def backfill(connect, accounts, since_ledger, emit):
+    """Replay validated issuer transactions from since_ledger onward through emit(transactions).
+
+    Uses its own connection so the live subscription keeps flowing; pages are
+    fetched with account_tx markers and spaced out to stay under node rate limits.
+    Every page is emitted as one batch of decoded transactions in the transaction
+    stream format, duplicates of live frames are dropped by the tx hash dedup.
+    """
+    async with connect() as websocket:
+        await websocket.send(json.dumps({"command": "ledger", "ledger_index": "validated"}))
+        validated = json.loads(await websocket.recv()).get("result", {}).get("ledger_index")
+        if validated:
+            validated = int(validated)
+            if validated - since_ledger > BACKFILL_MAX_LEDGERS:
+                logger.warning(f"Ledger gap of {validated - since_ledger} is too large, backfilling the last {BACKFILL_MAX_LEDGERS}")
+                since_ledger = validated - BACKFILL_MAX_LEDGERS
+        logger.info(f"Backfilling ledgers {since_ledger} to {validated} for issuers: {sorted(accounts)}")
+
+        for account in accounts:
+            marker = None
+            while True:
+                request = {
+                    "command": "account_tx",
+                    "account": account,
+                    "ledger_index_min": since_ledger,
+                    "ledger_index_max": validated or -1,
+                    "forward": True,
+                    "limit": BACKFILL_PAGE_LIMIT
+                }
+                if marker:
+                    request["marker"] = marker
+                await websocket.send(json.dumps(request))
+                response = json.loads(await websocket.recv())
+                if response.get("status") != "success":
+                    logger.error(f"Backfill for {account} failed: {response.get('error')}")
+                    break
+
+                result = response["result"]
+                transactions = []
+                for entry in result.get("transactions", []):
+                    if not entry.get("validated"):
+                        continue
+                    tx = dict(entry.get("tx") or entry.get("tx_json", {}))
+                    tx.setdefault("hash", entry.get("hash"))
+                    transactions.append({
+                        "type": "transaction",
+                        "validated": True,
+                        "ledger_index": tx.get("ledger_index", entry.get("ledger_index")),
+                        "transaction": tx,
+                        "meta": entry.get("meta", {})
+                    })
+                await emit(transactions)
+
+                marker = result.get("marker")
+                if not marker:
+                    break
+                await asyncio.sleep(BACKFILL_PAGE_DELAY)
+
+class SubscriptionManager:
+    """Keep the accounts subscription of every live connection in sync with the monitored issuers."""
+
+    def __init__(self, proposed=False):
+        self.websockets = set()
+        self.accounts = set()
+        self.proposed = proposed  # also stream proposed (not yet validated) transactions
+        self._lock = asyncio.Lock()
+
+    async def attach(self, websocket, accounts):
+        """Subscribe a fresh connection to ledger closes and every issuer account in one request."""
+        async with self._lock:
+            self.websockets.add(websocket)
+            self.accounts = set(accounts)
+            request = {"command": "subscribe", "streams": ["ledger"]}
+            if self.accounts:
+                request["accounts"] = sorted(self.accounts)
+                if self.proposed:
+                    request["accounts_proposed"] = sorted(self.accounts)
+            await websocket.send(json.dumps(request))
+            logger.info(f"Subscribed to transactions for issuers: {sorted(self.accounts)}")
+
+    def detach(self, websocket):
+        """Forget a connection that has been closed."""
+        self.websockets.discard(websocket)
+
+    async def sync(self, accounts):
+        """Subscribe/unsubscribe only the issuers that changed, without reconnecting."""
+        async with self._lock:
+            accounts = set(accounts)
+            added = accounts - self.accounts
+            removed = self.accounts - accounts
+            self.accounts = accounts
+            for websocket in list(self.websockets):
+                try:
+                    if added:
+                        await self._send(websocket, "subscribe", added)
+                    if removed:
+                        await self._send(websocket, "unsubscribe", removed)
+                except Exception as e:
+                    # The reconnect path resubscribes to the full set
+                    logger.error(f"Error updating subscription: {e}")
+            if added:
+                logger.info(f"Subscribed to transactions for issuers: {sorted(added)}")
+            if removed:
+                logger.info(f"Unsubscribed from transactions for issuers: {sorted(removed)}")
+
+    async def _send(self, websocket, command, accounts):
+        request = {"command": command, "accounts": sorted(accounts)}
+        if self.proposed:
+            request["accounts_proposed"] = sorted(accounts)
+        await websocket.send(json.dumps(request))
@@ -0,0 +1,132 @@
+"""Shared test setup.
+
+The bot reads its settings from the environment when it is imported, so the
+scratch directory and variables are set up here, before any test module
+imports it. Nothing a test writes ever lands in the repository.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix="buybot-tests-")
+os.chdir(SCRATCH)  # config.json and its backup are relative to the working directory
+os.environ.update({
+    'TOKEN': '123456:TEST',
+    'OWNER_ID': '1',
+    'CONFIG_DB': os.path.join(SCRATCH, 'config.db'),
+    'STREAM_STATE_FILE': os.path.join(SCRATCH, 'stream_state.json'),
+    'HISTORY_DB': os.path.join(SCRATCH, 'history.db'),
+    # Measure the bot, not Telegram's rate limits (the notifier tests set their own)
+    'TELEGRAM_GLOBAL_RATE': '1000000',
+    'TELEGRAM_CHAT_RATE': '1000000',
+    'TELEGRAM_CHAT_BURST': '1000000',
+})
+
+with open(os.path.join(ROOT, 'amm.json'), encoding='utf-8') as file:
+    AMM_TX = json.load(file)  # validated AMM buy: 5500 NEIRO for 10.940017 XRP
+BUYER = AMM_TX["Account"]
+NEIRO = ("rneirorRCs765VoFgPkocb7rr4BzBoHABs", "4E4549524F000000000000000000000000000000")
+
+def stream_frame(tx=AMM_TX, validated=True):
+    """An account_tx style transaction (like amm.json) as a transaction stream frame."""
+    tx = dict(tx)
+    meta = tx.pop("meta")
+    ledger_index = tx.pop("ledger_index")
+    tx.pop("validated", None)
+    frame = {"type": "transaction", "engine_result": "tesSUCCESS", "validated": validated, "transaction": tx}
+    if validated:
+        frame.update(ledger_index=ledger_index, meta=meta)
+    else:
+        frame["ledger_current_index"] = ledger_index
+    return json.dumps(frame)
+
+def buy_tx(index, ledger_index=None):
+    """amm.json made into a distinct buy: its own buyer account and tx hash."""
+    tx = json.loads(json.dumps(AMM_TX).replace(BUYER, f"rBuyer{index:028d}"))
+    tx["hash"] = f"{index:064X}"
+    if ledger_index is not None:
+        tx["ledger_index"] = ledger_index
+    return tx
+
+def buy_frame(index, ledger_index=None):
+    return stream_frame(buy_tx(index, ledger_index))
+
+OTHER_CURRENCY = "534F4C4F00000000000000000000000000000000"
+
+def recorded_frames(count):
+    """A stream mix: NEIRO buys, buys of an unmonitored token, trust lines and ledger closes."""
+    frames = []
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            frames.append(stream_frame(buy_tx(index)))
+        elif kind == 1:
+            tx = json.loads(json.dumps(buy_tx(index)).replace(NEIRO[1], OTHER_CURRENCY))
+            frames.append(stream_frame(tx))
+        elif kind == 2:
+            tx = {**buy_tx(index), "TransactionType": "TrustSet",
+                  "LimitAmount": {"currency": NEIRO[1], "issuer": NEIRO[0], "value": "1000000"}}
+            frames.append(stream_frame(tx))
+        else:
+            frames.append(json.dumps({"type": "ledgerClosed", "ledger_index": AMM_TX["ledger_index"] + index,
+                                      "txn_count": 12, "fee_base": 10}))
+    return frames
+
+def add_groups(bot, count, **settings):
+    """Monitor NEIRO in `count` new groups; returns their chat ids."""
+    chat_ids = [-1000 - index for index in range(count)]
+    for chat_id in chat_ids:
+        bot.config.add_group(chat_id)
+        bot.config.update_group_settings(chat_id, {
+            "TOKEN_ISSUER": NEIRO[0], "TOKEN_CURRENCY": NEIRO[1], "THRESHOLD": "5", **settings
+        })
+    return chat_ids
+
+async def wait_idle(bot, timeout=10.0):
+    """Wait until every queued frame, buy and Telegram call has been handled."""
+    deadline = time.monotonic() + timeout
+    while (bot.pipeline.ingest_queue.qsize() or bot.pipeline.dispatch_queue.qsize() or bot.notifier.pending()
+           or any(not worker.done() for worker in bot.notifier._workers.values())):
+        if time.monotonic() > deadline:
+            raise TimeoutError("the bot did not go idle")
+        await asyncio.sleep(0.01)
+
+@pytest.fixture
+def bot(monkeypatch, tmp_path):
+    """BuyBot with fresh per-test state: no groups, empty queues, no network lookups."""
+    import BuyBot
+    from pipeline import Pipeline
+    from notifier import Notifier
+    from aggregate import Aggregator
+    from fastmode import FastAlerts
+    from board import Boards
+    from market import PriceEngine
+    from history import TradeHistory
+    from holders import Holdings
+    from stream import StreamState
+
+    # Queues bind to the event loop that first uses them, and every test runs its own
+    history = TradeHistory(str(tmp_path / "history.db"))
+    for name, value in {
+        "pipeline": Pipeline(), "notifier": Notifier(), "aggregator": Aggregator(),
+        "fast_alerts": FastAlerts(), "boards": Boards(), "prices": PriceEngine(), "history": history,
+        "holders": Holdings(BuyBot.rpc), "stream_state": StreamState(str(tmp_path / "stream_state.json")),
+    }.items():
+        monkeypatch.setattr(BuyBot, name, value)
+
+    async def offline_market_cap(token):
+        return BuyBot.prices.market_cap_usd(token) or 0.0
+    monkeypatch.setattr(BuyBot, "get_market_cap", offline_market_cap)
+    monkeypatch.setattr(BuyBot, "current_market_cap", lambda token: BuyBot.prices.market_cap_usd(token))
+
+    for chat_id in list(BuyBot.config.get_config()["CHAT_IDS"]):
+        BuyBot.config.remove_group(chat_id)
+    yield BuyBot
+    asyncio.run(history.stop())
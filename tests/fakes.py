@@ -0,0 +1,245 @@
+"""Local stand-ins for the services the bot talks to."""
+import json
+import time
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+TOKEN = "123456:TEST"
+
+class FakeHTTPServer:
+    """HTTP/1.1 server on a free localhost port, answering from its own threads.
+
+    handler(method, path, body) returns (status, payload) and payload is sent as
+    JSON. Running outside the event loop means even a blocking client in the
+    loop gets its answer, which is what the "before" measurements need.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # Headers and body go out separately, don't wait for an ACK
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server.requests.append((self.command, self.path))
+                status, payload = server.handler(self.command, self.path, decode_body(self.headers, body))
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except ConnectionError:
+                    pass  # The client gave up, e.g. a cancelled long poll
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def decode_body(headers, body):
+    """JSON or form encoded request body as a dict."""
+    if not body:
+        return {}
+    if headers.get("Content-Type", "").startswith("application/json"):
+        return json.loads(body)
+    return {key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+ADMIN_RIGHTS = dict.fromkeys((
+    "can_be_edited", "is_anonymous", "can_manage_chat", "can_delete_messages", "can_manage_video_chats",
+    "can_restrict_members", "can_promote_members", "can_change_info", "can_invite_users",
+    "can_post_stories", "can_edit_stories", "can_delete_stories"
+), False)
+
+def user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+class FakeBotAPI(FakeHTTPServer):
+    """Telegram Bot API stand-in that answers every method after `delay` seconds.
+
+    Chats in `failing` (chat_id -> (delay, description)) get a 400 error
+    instead, chats in `flooded` (chat_id -> (times, retry_after)) a 429 flood
+    wait on their first `times` calls, kept in `flood_waits` as (chat_id, time).
+    Successful calls are kept in `calls` as (method, params, time).
+    getUpdates long-polls the updates queued with push_update(). Every group's
+    creator is user 1 (OWNER_ID in the tests), chats in `admins` (chat_id ->
+    user ids) have those administrators as well.
+    """
+
+    def __init__(self, delay=0.0, failing=None, flooded=None, admins=None):
+        super().__init__(self._answer)
+        self.admins = admins or {}
+        self.delay = delay
+        self.failing = failing or {}
+        self.flooded = dict(flooded or {})
+        self.flood_waits = []
+        self.calls = []
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._updates = []
+        self._updates_ready = threading.Condition()
+        self._closed = False
+
+    def bot(self):
+        """A telegram.Bot talking to this server, pooled like the Application's."""
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+        return Bot(TOKEN, base_url=f"{self.url}/bot", request=HTTPXRequest(connection_pool_size=256))
+
+    def calls_to(self, method):
+        return [params for name, params, _ in self.calls if name == method]
+
+    def push_update(self, update):
+        """Queue an update (with its update_id) for getUpdates."""
+        with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def __exit__(self, *exc_info):
+        with self._updates_ready:
+            self._closed = True
+            self._updates_ready.notify_all()
+        super().__exit__(*exc_info)
+
+    def _get_updates(self, params):
+        """Long polling: wait up to `timeout` seconds for updates from `offset` on."""
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self._updates_ready:
+            while True:
+                updates = [update for update in self._updates if update["update_id"] >= offset]
+                remaining = deadline - time.monotonic()
+                if updates or remaining <= 0 or self._closed:
+                    return updates
+                self._updates_ready.wait(remaining)
+
+    def _answer(self, http_method, path, params):
+        method = path.rsplit("/", 1)[-1]
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        if chat_id in self.failing:
+            delay, description = self.failing[chat_id]
+            time.sleep(delay)
+            return 400, {"ok": False, "error_code": 400, "description": description}
+        with self._lock:
+            times, retry_after = self.flooded.get(chat_id, (0, 0))
+            if times:
+                self.flooded[chat_id] = (times - 1, retry_after)
+                self.flood_waits.append((chat_id, time.monotonic()))
+                return 429, {"ok": False, "error_code": 429, "parameters": {"retry_after": retry_after},
+                             "description": f"Too Many Requests: retry after {retry_after}"}
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append((method, params, time.monotonic()))
+        return 200, {"ok": True, "result": self.result(method, chat_id, params)}
+
+    def result(self, method, chat_id, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "BuyBot", "username": "buybot"}
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "getChat":
+            return {"id": chat_id, "type": "supergroup", "title": f"Buy club {chat_id}",
+                    "accent_color_id": 0, "max_reaction_count": 11,
+                    "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False,
+                                            "unique_gifts": False, "premium_subscription": False,
+                                            "gifts_from_channels": False}}
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False, "user": user(1)}] + [
+                {"status": "administrator", "user": user(user_id), **ADMIN_RIGHTS}
+                for user_id in self.admins.get(chat_id, ())
+            ]
+        if not (method.startswith("send") or method.startswith("edit")):
+            return True
+        message = {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"},
+        }
+        if method == "sendAnimation":
+            message["animation"] = {"file_id": "animation-1", "file_unique_id": "a1",
+                                    "width": 1, "height": 1, "duration": 1}
+        elif method == "sendPhoto":
+            message["photo"] = [{"file_id": "photo-1", "file_unique_id": "p1", "width": 1, "height": 1}]
+        return message
+
+class FakeRippled:
+    """rippled websocket stand-in on a free localhost port, run in the test's event loop.
+
+    Each subscribing connection in turn streams the next batch in `sessions`
+    and is then dropped, except the last one which stays open. account_tx
+    pages through `history` (account_tx entries, oldest first) with markers.
+    """
+
+    def __init__(self, sessions, history, validated):
+        self.sessions = list(sessions)
+        self.history = history
+        self.validated = validated
+        self.requests = []
+        self._server = None
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def __aenter__(self):
+        from websockets.asyncio.server import serve
+        self._server = await serve(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, websocket):
+        async for message in websocket:
+            request = json.loads(message)
+            self.requests.append(request)
+            command = request.get("command")
+            if command == "subscribe":
+                await websocket.send(json.dumps({"type": "response", "status": "success", "result": {}}))
+                frames = self.sessions.pop(0) if self.sessions else []
+                for frame in frames:
+                    await websocket.send(frame)
+                if self.sessions:
+                    return  # Drop the connection, the client has to reconnect
+            elif command == "ledger":
+                await websocket.send(json.dumps(
+                    {"type": "response", "status": "success", "result": {"ledger_index": self.validated}}
+                ))
+            elif command == "account_tx":
+                await websocket.send(json.dumps(self._account_tx(request)))
+
+    def _account_tx(self, request):
+        low, high = request["ledger_index_min"], request["ledger_index_max"]
+        entries = [entry for entry in self.history
+                   if entry["tx"]["ledger_index"] >= low and (high == -1 or entry["tx"]["ledger_index"] <= high)]
+        offset = int(request.get("marker") or 0)
+        limit = request["limit"]
+        result = {"account": request["account"], "transactions": entries[offset:offset + limit]}
+        if offset + limit < len(entries):
+            result["marker"] = str(offset + limit)
+        return {"type": "response", "status": "success", "result": result}
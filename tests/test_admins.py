@@ -0,0 +1,86 @@
+"""Admin checks and /adminstatus against the fake Bot API."""
+import time
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from telegram import Chat, Message, Update, User
+from admins import AdminCache, ChatTitles
+from conftest import add_groups
+from fakes import FakeBotAPI
+
+OWNER_ID = 1  # conftest
+
+@pytest.fixture
+def caches(bot, monkeypatch):
+    monkeypatch.setattr(bot, "admins", AdminCache())
+    monkeypatch.setattr(bot, "chat_titles", ChatTitles())
+
+def command(telegram_bot, text, chat_id=OWNER_ID, user_id=OWNER_ID):
+    """An incoming command message whose replies go through telegram_bot."""
+    message = Message(1, datetime.now(), Chat(chat_id, Chat.PRIVATE if chat_id > 0 else Chat.SUPERGROUP),
+                      from_user=User(user_id, "User", False), text=text)
+    message.set_bot(telegram_bot)
+    return Update(1, message=message), SimpleNamespace(bot=telegram_bot, args=text.split()[1:])
+
+def test_admin_checks_share_one_lookup(bot, caches):
+    chat_id = -1000
+
+    async def run(api):
+        async with api.bot() as telegram_bot:
+            context = SimpleNamespace(bot=telegram_bot)
+            checks = [await bot.is_group_admin(chat_id, user_id, context) for user_id in (1, 2, 3, 1, 2, 3)]
+            bot.admins.member_updated(chat_id, "member", "administrator")  # someone was promoted
+            checks.append(await bot.is_group_admin(chat_id, 3, context))
+            return checks
+
+    with FakeBotAPI(admins={chat_id: [2]}) as api:
+        checks = asyncio.run(run(api))
+
+    assert checks == [True, True, False, True, True, False, False]
+    assert len(api.calls_to("getChatAdministrators")) == 2  # the first check, then after the promotion
+
+def admin_status(bot, api, groups, warm=True):
+    """Run /adminstatus for `groups` groups; returns (seconds to answer, pages sent)."""
+    chat_ids = add_groups(bot, groups)
+
+    async def run():
+        async with api.bot() as telegram_bot:
+            if warm:
+                await bot.chat_titles.get_many(telegram_bot, chat_ids)  # as warm_caches() does at startup
+            started_at = time.monotonic()
+            await bot.admin_status(*command(telegram_bot, "/adminstatus"))
+            return time.monotonic() - started_at
+
+    elapsed = asyncio.run(run())
+    return elapsed, [params["text"] for params in api.calls_to("sendMessage")]
+
+def test_admin_status_for_500_groups(bot, caches):
+    with FakeBotAPI(delay=0.02) as api:  # 10 s one chat at a time
+        elapsed, pages = admin_status(bot, api, 500)
+
+    print(f"\n/adminstatus for 500 groups: {elapsed * 1000:.0f} ms, {len(pages)} messages")
+    assert elapsed < 1.0
+    assert len(api.calls_to("getChat")) == 500  # all of them while warming up, concurrently
+    assert len(pages) > 1 and all(len(page) <= 4096 for page in pages)
+    listing = "".join(pages)
+    assert all(f"Buy club {-1000 - index}" in listing for index in range(500))
+
+def test_cold_admin_status_lists_every_group(bot, caches):
+    # Titles not resolved by the deadline fall back to the chat id
+    with FakeBotAPI(delay=0.02) as api:
+        elapsed, pages = admin_status(bot, api, 200, warm=False)
+
+    print(f"\ncold /adminstatus for 200 groups: {elapsed * 1000:.0f} ms, {len(pages)} messages")
+    listing = "".join(pages)
+    assert all(f"Buy club {chat_id}" in listing or f"Group {chat_id}" in listing
+               for chat_id in range(-1000, -1200, -1))
+
+def test_flood_wait_does_not_lose_pages(bot, caches):
+    with FakeBotAPI(flooded={OWNER_ID: (1, 1)}) as api:
+        elapsed, pages = admin_status(bot, api, 100)
+
+    assert len(api.flood_waits) == 1 and elapsed >= 0.9
+    listing = "".join(pages)
+    assert listing.startswith("<b>🤖 Bot Admin Status</b>")
+    assert all(f"Buy club {-1000 - index}" in listing for index in range(100))
@@ -0,0 +1,62 @@
+"""Aggregation windows: every buy a windowed group should see ends up in its window."""
+import asyncio
+from conftest import add_groups, buy_frame, wait_idle
+from replay import MockBot
+
+WINDOW = {"AGGREGATE_WINDOW": "60", "AGGREGATE_BY": "all"}
+
+def run(bot, work):
+    telegram = MockBot()
+
+    async def main():
+        bot.start_pipeline(telegram)
+        await work()
+        await wait_idle(bot)
+        await bot.pipeline.stop()
+
+    asyncio.run(main())
+    return telegram
+
+def test_big_buy_below_the_threshold_is_collected(bot, monkeypatch):
+    monkeypatch.setattr(bot, "BIG_BUY_XRP", 10)  # amm.json spends 10.94 XRP
+    add_groups(bot, 1, THRESHOLD="5000", **WINDOW)
+
+    telegram = run(bot, lambda: bot.notify_groups(bot.handle_transaction(buy_frame(1))))
+    assert telegram.calls == {}
+    assert bot.aggregator.pending() == 1
+
+def test_big_buy_meeting_the_threshold_skips_the_window(bot, monkeypatch):
+    monkeypatch.setattr(bot, "BIG_BUY_XRP", 10)
+    add_groups(bot, 1, **WINDOW)
+
+    telegram = run(bot, lambda: bot.notify_groups(bot.handle_transaction(buy_frame(1))))
+    assert telegram.calls == {"send_animation": 1}
+    assert bot.aggregator.pending() == 0
+
+def test_coalesced_summary_goes_through_the_windows(bot):
+    [direct] = add_groups(bot, 1)
+    windowed = [-2000]
+    bot.config.add_group(windowed[0])
+    bot.config.update_group_settings(windowed[0], {**bot.config.get_group_settings(direct), **WINDOW})
+
+    async def overflow():
+        summary = bot.handle_transaction(buy_frame(1))
+        summary.merge(bot.handle_transaction(buy_frame(2)))
+        assert sorted(summary.chat_ids) == sorted([direct] + windowed)
+        await bot.dispatch_buy(summary)
+
+    telegram = run(bot, overflow)
+    assert telegram.calls == {"send_message": 1}  # the summary, in the plain group only
+    assert bot.aggregator.pending() == 1
+
+def test_buys_below_every_threshold_are_not_counted(bot):
+    add_groups(bot, 2, THRESHOLD="5000", **WINDOW)
+
+    async def stream():
+        bot.pipeline.push(buy_frame(1))
+
+    telegram = run(bot, stream)
+    assert bot.pipeline.ingest.processed == 1
+    assert bot.pipeline.buys == 0
+    assert bot.aggregator.pending() == 2
+    assert telegram.calls == {}
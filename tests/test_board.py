@@ -0,0 +1,94 @@
+"""/board: switching modes never leaves an old board message pinned behind, or a board without a message."""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram.error import BadRequest
+from conftest import add_groups, buy_frame, wait_idle
+from replay import MockBot
+
+class BoardMediaRejected(MockBot):
+    """Telegram refusing the board's media, while buy notifications still go out."""
+
+    def __getattr__(self, name):
+        call = super().__getattr__(name)
+        if name not in ("send_animation", "send_photo"):
+            return call
+
+        async def send(**kwargs):
+            if "Waiting for the next buy" in kwargs.get("caption", ""):
+                raise BadRequest("Wrong type of the web page content")
+            return await call(**kwargs)
+        return send
+
+@pytest.fixture
+def group(bot, monkeypatch):
+    async def is_admin(chat_id, user_id, context):
+        return True
+    monkeypatch.setattr(bot, "is_group_admin", is_admin)
+    [chat_id] = add_groups(bot, 1)
+    return chat_id
+
+def run_commands(bot, chat_id, *commands, telegram=None, replies=None, then=None):
+    """Send /board with each list of arguments in turn, then a buy if `then`; returns the bot's Telegram calls.
+
+    Replies are collected in `replies` when given, otherwise they must all be successes.
+    """
+    telegram = telegram or MockBot()
+
+    async def reply_text(text, **kwargs):
+        if replies is None:
+            assert text.startswith("✅"), text
+        else:
+            replies.append(text)
+
+    async def main():
+        bot.start_pipeline(telegram)
+        for args in commands:
+            update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=SimpleNamespace(id=1),
+                                     message=SimpleNamespace(reply_text=reply_text))
+            await bot.set_board(update, SimpleNamespace(bot=telegram, args=list(args)))
+            await asyncio.sleep(0.01)  # the redraw
+            await wait_idle(bot)
+        if then:
+            await bot.notify_groups(bot.handle_transaction(buy_frame(1)))
+            await wait_idle(bot)
+        bot.boards.remove(chat_id)
+        await bot.pipeline.stop()
+
+    asyncio.run(main())
+    return telegram.calls
+
+def test_same_kind_of_board_is_reused(bot, group):
+    calls = run_commands(bot, group, ["text"], ["text", "5", "30"])
+    assert calls["send_message"] == 1 and calls["pin_chat_message"] == 1
+    assert calls["edit_message_text"] >= 1
+    assert "unpin_chat_message" not in calls and "delete_message" not in calls
+    assert bot.config.get_group_settings(group)["BOARD_SIZE"] == 5
+
+def test_new_kind_of_board_replaces_the_old_one(bot, group):
+    calls = run_commands(bot, group, ["text"], ["on"])
+    media = calls["send_animation"] + calls["send_photo"]
+    assert calls["send_message"] == 1 and media == 1
+    assert calls["pin_chat_message"] == 2
+    assert calls["unpin_chat_message"] == 1 and calls["delete_message"] == 1
+
+def test_off_unpins_the_board(bot, group):
+    calls = run_commands(bot, group, ["text"], ["off"])
+    assert calls["unpin_chat_message"] == 1 and "delete_message" not in calls
+    assert bot.config.get_group_settings(group).get("BOARD_MESSAGE_ID") is None
+
+def test_failed_board_post_changes_nothing(bot, group):
+    replies = []
+    calls = run_commands(bot, group, ["on"], telegram=BoardMediaRejected(), replies=replies, then=True)
+    assert replies[0].startswith("❌")
+    settings = bot.config.get_group_settings(group)
+    assert not settings.get("BOARD") and not settings.get("BOARD_MESSAGE_ID")
+    assert calls == {"send_animation": 1}  # the buy, posted as usual
+
+def test_failed_switch_keeps_the_old_board(bot, group):
+    replies = []
+    calls = run_commands(bot, group, ["text"], ["on"], telegram=BoardMediaRejected(), replies=replies)
+    assert replies[0].startswith("✅") and replies[1].startswith("❌")
+    settings = bot.config.get_group_settings(group)
+    assert settings["BOARD"] == "text" and settings["BOARD_MESSAGE_ID"]
+    assert "unpin_chat_message" not in calls and "delete_message" not in calls
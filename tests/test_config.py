@@ -0,0 +1,103 @@
+"""TokenConfig backends: persistence and versioning."""
+import os
+import json
+import time
+import pytest
+from db import TokenConfig, SQLiteTokenConfig
+
+@pytest.fixture(params=["json", "sqlite"])
+def config(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    if request.param == "json":
+        config = TokenConfig()
+    else:
+        config = SQLiteTokenConfig(str(tmp_path / "config.db"))
+    yield config
+    config.close()
+
+def reopen(config, tmp_path):
+    config.close()
+    if isinstance(config, SQLiteTokenConfig):
+        return SQLiteTokenConfig(str(tmp_path / "config.db"))
+    return TokenConfig()
+
+def test_media_file_ids_do_not_invalidate_routing(config, tmp_path):
+    config.add_group(-1)
+    version = config.version
+    config.set_media_file_id("https://example.com/buy.gif", "file-1")
+    config.drop_media_file_id("https://example.com/buy.gif")
+    config.set_media_file_id("https://example.com/buy.gif", "file-2")
+    assert config.version == version
+
+    reopened = reopen(config, tmp_path)
+    try:
+        assert reopened.get_media_file_id("https://example.com/buy.gif") == "file-2"
+    finally:
+        reopened.close()
+
+def test_settings_changes_invalidate_routing(config):
+    config.add_group(-1)
+    version = config.version
+    config.update_group_settings(-1, {"THRESHOLD": "50"})
+    assert config.version > version
+
+GROUPS = 10_000
+
+def open_large_config(backend, tmp_path):
+    """A config with GROUPS groups; the SQLite backend gets it through its config.json migration."""
+    path = tmp_path / backend
+    path.mkdir()
+    os.chdir(path)
+    default = TokenConfig().config["DEFAULT_SETTINGS"]
+    chat_ids = [-1000 - index for index in range(GROUPS)]
+    with open("config.json", "w", encoding="utf-8") as file:
+        json.dump({"CHAT_IDS": chat_ids,
+                   "GROUP_SETTINGS": {str(chat_id): dict(default) for chat_id in chat_ids}}, file)
+    config = TokenConfig() if backend == "json" else SQLiteTokenConfig(str(path / "config.db"))
+    assert len(config.get_config()["CHAT_IDS"]) == GROUPS
+    return config
+
+@pytest.fixture(params=["json", "sqlite"])
+def large_config(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # restored afterwards
+    config = open_large_config(request.param, tmp_path)
+    yield config
+    config.close()
+
+def persisted_update(config, chat_id, threshold):
+    """Change one group's threshold and wait until it is on disk."""
+    config.update_group_settings(chat_id, {"THRESHOLD": threshold})
+    if isinstance(config, SQLiteTokenConfig):
+        config._executor.submit(lambda: None).result()
+    # Without a running loop the JSON backend writes synchronously
+
+def test_settings_update_latency(large_config, benchmark):
+    thresholds = iter(range(1, 10 ** 9))
+    benchmark(lambda: persisted_update(large_config, -1000 - GROUPS // 2, str(next(thresholds))))
+    if benchmark.stats:  # None under --benchmark-disable
+        backend = "sqlite" if isinstance(large_config, SQLiteTokenConfig) else "json"
+        print(f"\n{backend}, {GROUPS} groups: {benchmark.stats.stats.median * 1000:.2f} ms per update")
+
+def test_sqlite_updates_one_row_instead_of_the_whole_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    latencies = {}
+    for backend in ("json", "sqlite"):
+        config = open_large_config(backend, tmp_path)
+        try:
+            samples = []
+            for threshold in range(20):
+                started_at = time.perf_counter()
+                persisted_update(config, -1000 - threshold, str(threshold + 1))
+                samples.append(time.perf_counter() - started_at)
+            latencies[backend] = sorted(samples)[len(samples) // 2]
+        finally:
+            config.close()
+
+    reopened = SQLiteTokenConfig(str(tmp_path / "sqlite" / "config.db"))
+    try:
+        assert reopened.get_group_settings(-1019)["THRESHOLD"] == "20"
+    finally:
+        reopened.close()
+    print(f"\nmedian update with {GROUPS} groups: json {latencies['json'] * 1000:.2f} ms, "
+          f"sqlite {latencies['sqlite'] * 1000:.2f} ms")
+    assert latencies["sqlite"] < latencies["json"] / 5
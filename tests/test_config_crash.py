@@ -0,0 +1,117 @@
+"""The JSON config must be valid on disk at every instant, whatever happens mid-write."""
+import sys
+import json
+import random
+import signal
+import asyncio
+import threading
+import subprocess
+import time
+import pytest
+import db
+from conftest import ROOT
+from db import TokenConfig
+
+def saved_threshold(path="config.json"):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["GROUP_SETTINGS"]["-1"]["THRESHOLD"]
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = TokenConfig()
+    config.add_group(-1)
+    config.update_group_settings(-1, {"THRESHOLD": "0"})
+    return config
+
+WRITER = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from db import TokenConfig
+config = TokenConfig()
+config.add_group(-1)
+print("ready", flush=True)
+threshold = 0
+while True:
+    threshold += 1
+    config.update_group_settings(-1, {"THRESHOLD": str(threshold)})
+"""
+
+def test_killed_writer_always_leaves_a_valid_config(tmp_path):
+    rng = random.Random(12)
+    thresholds = []
+    for _ in range(25):
+        writer = subprocess.Popen([sys.executable, "-c", WRITER, ROOT], cwd=tmp_path,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        assert writer.stdout.readline().strip() == "ready"
+        time.sleep(rng.uniform(0.0, 0.05))
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+        writer.stdout.close()
+        thresholds.append(int(saved_threshold(tmp_path / "config.json")))
+    # Every run started over from threshold 1 and got killed mid-loop
+    assert max(thresholds) > 1
+
+def test_readers_never_see_a_missing_or_torn_file(config):
+    stop = threading.Event()
+    reads, errors = [], []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                reads.append(saved_threshold())
+            except (OSError, ValueError, KeyError) as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for threshold in range(1, 200):
+            config.update_group_settings(-1, {"THRESHOLD": str(threshold)})
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
+    assert len(reads) > 0
+
+@pytest.mark.parametrize("step", ["fsync", "backup", "replace"])
+def test_failure_at_any_write_step_keeps_the_previous_config(config, monkeypatch, step):
+    def crash(*args, **kwargs):
+        raise OSError(f"injected failure at {step}")
+
+    target = {"fsync": (db.os, "fsync"), "backup": (db.shutil, "copy2"), "replace": (db.os, "replace")}[step]
+    with monkeypatch.context() as patch:
+        patch.setattr(*target, crash)
+        config.update_group_settings(-1, {"THRESHOLD": "1"})
+
+    assert saved_threshold() == "0"
+    config.update_group_settings(-1, {"THRESHOLD": "2"})
+    assert saved_threshold() == "2"
+
+def test_final_flush_is_not_overwritten_by_a_slower_background_write(config):
+    handed_over = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+    write_file = config._write_file
+
+    def slow_write_file(sequence, data):
+        if threading.current_thread() is not threading.main_thread():
+            handed_over.set()
+            release.wait()
+        write_file(sequence, data)
+        if threading.current_thread() is not threading.main_thread():
+            finished.set()
+    config._write_file = slow_write_file
+
+    async def run():
+        config.update_group_settings(-1, {"THRESHOLD": "1"})
+        config._save_handle.cancel()
+        config._start_save()
+        await asyncio.to_thread(handed_over.wait)  # "1" is being written in the background
+        config.update_group_settings(-1, {"THRESHOLD": "2"})
+        config.close()  # shutdown: the final flush writes "2" right away
+        release.set()
+        await asyncio.to_thread(finished.wait)
+
+    asyncio.run(run())
+    assert saved_threshold() == "2"
@@ -0,0 +1,71 @@
+"""Metadata balance deltas: accuracy on recorded fixtures and throughput."""
+import copy
+import json
+import time
+import pytest
+from conftest import AMM_TX, BUYER, NEIRO, add_groups, recorded_frames, stream_frame
+from deltas import balance_changes, ledger_changes, transaction_changes
+
+POOL = "rLKR6nYny3a2i8TuJYvQE7FxotRvTwrbQL"
+
+def test_amm_swap_amounts():
+    xrp, tokens = transaction_changes(AMM_TX, AMM_TX["meta"])
+    assert xrp == pytest.approx(-10.940017)  # the 12 drop fee is not part of the price
+    assert tokens == {NEIRO: pytest.approx(5500)}
+
+def test_amm_side_of_the_swap():
+    xrp, tokens = balance_changes(AMM_TX["meta"], POOL)
+    assert xrp == pytest.approx(10.940017)
+    assert tokens == {NEIRO: pytest.approx(-5500)}
+
+def test_amm_json_classifies_as_the_buy_that_happened(bot):
+    add_groups(bot, 1)
+    buy = bot.handle_transaction(stream_frame())
+    assert (buy.token, buy.value, buy.xrp_spent) == (NEIRO, pytest.approx(5500), pytest.approx(10.940017))
+    assert buy.tx["Account"] == BUYER
+
+def test_the_pool_side_is_never_a_buy(bot):
+    add_groups(bot, 1)
+    tx = {**AMM_TX, "Account": POOL, "hash": "1" * 64}
+    assert bot.handle_transaction(stream_frame(tx)) is None
+
+def test_first_buy_creating_the_trust_line():
+    meta = copy.deepcopy(AMM_TX["meta"])
+    for node in meta["AffectedNodes"]:
+        entry = node["ModifiedNode"]
+        if entry["LedgerEntryType"] == "RippleState" and BUYER in str(entry["FinalFields"]):
+            fields = entry["FinalFields"]
+            node.clear()
+            # The buyer held nothing before: the whole final balance is new
+            node["CreatedNode"] = {"LedgerEntryType": "RippleState", "NewFields": {
+                "Balance": {**fields["Balance"], "value": "-5500"} if fields["HighLimit"]["issuer"] == BUYER
+                else {**fields["Balance"], "value": "5500"},
+                "HighLimit": fields["HighLimit"], "LowLimit": fields["LowLimit"],
+            }}
+    assert any("CreatedNode" in node for node in meta["AffectedNodes"])
+    assert transaction_changes(AMM_TX, meta)[1] == {NEIRO: pytest.approx(5500)}
+
+def test_ledger_batch_matches_single_transactions():
+    frames = [json.loads(frame) for frame in recorded_frames(40)]
+    batch = [(frame["transaction"], frame["meta"]) for frame in frames if frame["type"] == "transaction"]
+    failed = copy.deepcopy(batch[0][1])
+    failed["TransactionResult"] = "tecPATH_PARTIAL"
+    batch += [(batch[0][0], failed), ({**batch[0][0], "Fee": "not drops"}, batch[0][1])]
+
+    changes = ledger_changes(batch)
+    assert changes[:-2] == [transaction_changes(tx, meta) for tx, meta in batch[:-2]]
+    assert changes[0] == (pytest.approx(-10.940017), {NEIRO: pytest.approx(5500)})
+    assert changes[-2:] == [(0.0, {}), (0.0, {})]  # failed, malformed
+
+def test_delta_throughput(benchmark):
+    meta = AMM_TX["meta"]
+    xrp, tokens = benchmark(transaction_changes, AMM_TX, meta)
+    assert xrp == pytest.approx(-10.940017)
+    # Timed here as well, so the gate holds under --benchmark-disable
+    rounds = 2000
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        transaction_changes(AMM_TX, meta)
+    per_second = rounds / (time.perf_counter() - started_at)
+    print(f"\n{per_second:,.0f} transactions/s")
+    assert per_second > 20_000
@@ -0,0 +1,42 @@
+"""End-to-end delivery latency of one buy fanned out to many groups, against a mock Bot API."""
+import asyncio
+import pytest
+from conftest import add_groups, buy_frame, wait_idle
+from fakes import FakeBotAPI
+from replay import percentile
+
+SEND_DELAY = 0.03  # Bot API round-trip of the fake server
+
+def deliver(bot, api, groups):
+    """Classify one buy, notify every group and return the per-group delivery latencies."""
+    add_groups(bot, groups)
+
+    async def run():
+        async with api.bot() as telegram_bot:
+            bot.notifier.attach(telegram_bot, bot.send_summary)
+            buy = bot.handle_transaction(buy_frame(1))
+            await bot.notify_groups(buy)
+            await wait_idle(bot)
+
+    asyncio.run(run())
+    return list(bot.notifier.latencies)
+
+@pytest.mark.parametrize("groups", [1, 4, 16, 64])
+def test_delivery_latency_by_group_count(bot, groups):
+    with FakeBotAPI(delay=SEND_DELAY) as api:
+        latencies = deliver(bot, api, groups)
+
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    print(f"\n{groups:3d} groups: p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms")
+    assert len(api.calls_to("sendAnimation")) == groups
+    # One group after another would put the last one groups * SEND_DELAY behind
+    assert p99 < max(groups * SEND_DELAY / 2, 0.25)
+
+def test_failing_chat_does_not_delay_the_others(bot):
+    with FakeBotAPI(delay=SEND_DELAY, failing={-1000: (1.0, "Bad Request: chat not found")}) as api:
+        latencies = deliver(bot, api, 16)
+
+    assert len(api.calls_to("sendAnimation")) == 15
+    assert len(latencies) == 15
+    assert max(latencies) < 0.5
+    assert bot.notifier.failed == 1
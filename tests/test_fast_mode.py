@@ -0,0 +1,76 @@
+"""Fast mode alerts are never folded into digests or summaries, and never left behind."""
+import asyncio
+import pytest
+from conftest import add_groups, buy_tx, stream_frame, wait_idle
+from fastmode import PendingAlert
+from notifier import Notifier, Job
+from pipeline import Pipeline, Buy
+from replay import MockBot
+
+def buy(alert=None):
+    return Buy(10.0, 1.0, {"Account": "rBuyer"}, [1], ("rIssuer", "TOKEN"), alert=alert)
+
+def test_alerts_are_not_merged_into_digests():
+    sent, digests = [], []
+
+    async def run():
+        scheduler = Notifier()
+        scheduler.attach(None, lambda summary, chat_id: digests.append(summary.count) or asyncio.sleep(0))
+        for index in range(8):
+            async def send(chat_id, index=index):
+                sent.append(index)
+                await asyncio.sleep(0.01)
+            # Even jobs are alerts (or their validation edits), odd ones plain buys
+            scheduler.submit(1, Job(send, buy(PendingAlert(str(index), None) if index % 2 == 0 else None)))
+        await asyncio.gather(*scheduler._workers.values())
+
+    asyncio.run(run())
+    assert sorted(index for index in sent if index % 2 == 0) == [0, 2, 4, 6]
+    assert sum(digests) + len([index for index in sent if index % 2]) == 4
+
+@pytest.mark.parametrize("overflow", ["coalesce", "drop"])
+def test_alerts_are_not_coalesced_on_overflow(overflow):
+    dispatched = []
+
+    async def run():
+        pipeline = Pipeline(overflow=overflow)
+        pipeline.dispatch_queue = asyncio.Queue(maxsize=1)
+
+        async def dispatch(buy):
+            dispatched.append(buy.count)
+            await asyncio.sleep(0.01)
+
+        pipeline.start(lambda frame: buy(PendingAlert(frame, None)), dispatch)
+        for index in range(10):
+            pipeline.push(str(index))
+        await pipeline.drain(5)
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert dispatched == [1] * 10
+
+def test_alert_is_retracted_when_the_buy_only_reaches_windows(bot):
+    # The proposed OfferCreate allows up to 12.01 XRP, the validated swap spent 10.94
+    [direct] = add_groups(bot, 1, THRESHOLD="11.5")
+    windowed = -2000
+    bot.config.add_group(windowed)
+    bot.config.update_group_settings(windowed, {**bot.config.get_group_settings(direct), "THRESHOLD": "5",
+                                                "AGGREGATE_WINDOW": "60"})
+    telegram = MockBot()
+
+    async def run():
+        bot.start_pipeline(telegram)
+        proposed = bot.handle_transaction(stream_frame(buy_tx(1), validated=False))
+        assert proposed.chat_ids == [direct]
+        await bot.notify_groups(proposed)
+        await wait_idle(bot)
+
+        validated = bot.handle_transaction(stream_frame(buy_tx(1)))
+        assert validated.chat_ids == [windowed] and validated.alert is proposed.alert
+        await bot.notify_groups(validated)
+        await wait_idle(bot)
+        await bot.pipeline.stop()
+
+    asyncio.run(run())
+    assert telegram.calls == {"send_animation": 1, "delete_message": 1}
+    assert bot.aggregator.pending() == 1
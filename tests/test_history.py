@@ -0,0 +1,88 @@
+"""Trade history: what gets recorded and what rolling queries cost."""
+import time
+import random
+import asyncio
+import pytest
+from conftest import AMM_TX, add_groups, buy_frame, wait_idle
+from history import RollingStats
+from replay import MockBot
+
+def stored_trades(history):
+    history.flush()
+    history._executor.submit(lambda: None).result()
+    return history._connect().execute("SELECT hash, ledger_index, account, xrp, tokens FROM trades").fetchall()
+
+def test_stream_buys_are_recorded_with_their_ledger(bot):
+    add_groups(bot, 1)
+    assert bot.handle_transaction(buy_frame(1)) is not None
+
+    [(tx_hash, ledger_index, account, xrp, tokens)] = stored_trades(bot.history)
+    assert tx_hash == f"{1:064X}"
+    assert ledger_index == AMM_TX["ledger_index"]
+    assert (xrp, tokens) == pytest.approx((10.940017, 5500))
+
+@pytest.mark.parametrize("show_volume", [False, True])
+def test_day_summary_only_for_groups_showing_volume(bot, monkeypatch, show_volume):
+    add_groups(bot, 3, SHOW_VOLUME=show_volume)
+    queries = []
+    summary = RollingStats.summary
+    monkeypatch.setattr(RollingStats, "summary", lambda self, window, now=None: queries.append(window)
+                        or summary(self, window, now))
+    telegram = MockBot()
+
+    async def run():
+        bot.notifier.attach(telegram, bot.send_summary)
+        await bot.notify_groups(bot.handle_transaction(buy_frame(1)))
+        await wait_idle(bot)
+
+    asyncio.run(run())
+    assert telegram.calls["send_animation"] == 3
+    assert queries == ([86400] if show_volume else [])
+
+def synthetic_stats(buys, now, seed=13):
+    """RollingStats holding `buys` random buys spread over the last 24h."""
+    rng = random.Random(seed)
+    stats = RollingStats()
+    for index in range(buys):
+        stats.add(now - rng.uniform(0, 86400), f"r{index % 5000}", rng.uniform(1, 500), rng.uniform(1, 1e6))
+    return stats
+
+def test_summary_matches_a_full_scan():
+    now = time.time()
+    rng = random.Random(7)
+    buys = [(now - rng.uniform(0, 2 * 86400), f"r{rng.randrange(300)}", rng.uniform(1, 500)) for _ in range(20_000)]
+    stats = RollingStats()
+    for timestamp, account, xrp_spent in buys:
+        stats.add(timestamp, account, xrp_spent, 1.0)
+
+    for window in (600, 3600, 86400 - 60):
+        # Whole buckets: everything from the bucket holding now - window onwards
+        since = (now - window) // 60 * 60
+        inside = [buy for buy in buys if buy[0] >= since]
+        summary = stats.summary(window, now)
+        assert summary["count"] == len(inside)
+        assert summary["buyers"] == len({account for _, account, _ in inside})
+        assert summary["volume"] == pytest.approx(sum(xrp_spent for *_, xrp_spent in inside))
+
+@pytest.mark.parametrize("buys", [10_000, 1_000_000])
+def test_summary_cost_by_history_size(benchmark, buys):
+    now = time.time()
+    stats = synthetic_stats(buys, now)
+    day = benchmark(stats.summary, 86400, now)
+    assert day["buyers"] == 5000
+
+def test_summary_cost_does_not_grow_with_history():
+    now = time.time()
+
+    def query_time(stats):
+        best = float("inf")
+        for _ in range(20):
+            started_at = time.perf_counter()
+            stats.summary(3600, now)
+            best = min(best, time.perf_counter() - started_at)
+        return best
+
+    small, large = query_time(synthetic_stats(10_000, now)), query_time(synthetic_stats(1_000_000, now))
+    print(f"\n1h summary: {small * 1e3:.2f} ms over 10k buys, {large * 1e3:.2f} ms over 1M buys")
+    # The same number of buckets is summed either way
+    assert large < small * 3
@@ -0,0 +1,152 @@
+"""Market cap lookups must not stall the event loop during a burst of buys."""
+import json
+import time
+import asyncio
+import urllib.request
+import httpx
+import BuyBot
+from conftest import NEIRO, add_groups, buy_frame, wait_idle
+from market import MarketCapProvider, parse_market_cap
+from fakes import FakeHTTPServer
+from replay import MockBot
+
+ONLINE = BuyBot.current_market_cap  # the bot fixture keeps tests offline
+
+ISSUER = "rneirorRCs765VoFgPkocb7rr4BzBoHABs"
+CURRENCY = "4E4549524F000000000000000000000000000000"
+API_DELAY = 0.2  # seconds the fake token-activity API takes to answer
+BURST = 20       # buys arriving at once
+
+def slow_api(method, path, body):
+    time.sleep(API_DELAY)
+    return 200, {"circulating_supply": "1000000", "price_usd": "0.5"}
+
+async def measure(work, tick=0.005):
+    """Run work() and return (worst event loop lag, result) while it ran."""
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            started_at = time.monotonic()
+            await asyncio.sleep(tick)
+            worst = max(worst, time.monotonic() - started_at - tick)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(tick * 2)
+    result = await work()
+    done = True
+    await task
+    return worst, result
+
+def blocking_market_cap(url):
+    """What calculate_market_cap used to do: a blocking POST on the loop thread."""
+    payload = json.dumps({"issuer": ISSUER, "currency": CURRENCY, "user_xrp_address": ""}).encode()
+    request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return parse_market_cap(json.load(response))
+
+def test_burst_before_blocks_the_loop():
+    with FakeHTTPServer(slow_api) as api:
+        async def burst():
+            return [blocking_market_cap(api.url) for _ in range(BURST)]
+
+        lag, values = asyncio.run(measure(burst))
+
+    print(f"\nblocking lookups: {len(api.requests)} API calls, worst loop lag {lag * 1000:.0f} ms")
+    assert values == [500000.0] * BURST
+    assert len(api.requests) == BURST
+    assert lag >= API_DELAY * BURST * 0.9
+
+def test_burst_after_costs_one_call_and_no_lag():
+    with FakeHTTPServer(slow_api) as api:
+        provider = MarketCapProvider(ISSUER, CURRENCY, url=api.url)
+        # Loading the TLS context takes ~0.1s once per client, not per burst
+        provider._client = httpx.AsyncClient(timeout=provider.timeout)
+
+        async def burst():
+            try:
+                return await asyncio.gather(*(provider.get() for _ in range(BURST)))
+            finally:
+                await provider.stop()
+
+        lag, values = asyncio.run(measure(burst))
+
+    print(f"\nasync provider: {len(api.requests)} API call(s), worst loop lag {lag * 1000:.0f} ms")
+    assert values == [500000.0] * BURST
+    assert len(api.requests) == 1
+    assert lag < API_DELAY / 2
+    assert provider.cache == {"hit": 0, "stale": 0, "miss": BURST}
+
+def test_stale_value_is_served_while_refreshing():
+    with FakeHTTPServer(slow_api) as api:
+        provider = MarketCapProvider(ISSUER, CURRENCY, ttl=0.0, url=api.url)
+
+        async def run():
+            try:
+                await provider.get()
+                started_at = time.monotonic()
+                value = await provider.get()  # expired: answered from cache, refreshed behind
+                return value, time.monotonic() - started_at
+            finally:
+                await provider.stop()
+
+        value, elapsed = asyncio.run(run())
+
+    assert value == 500000.0
+    assert elapsed < API_DELAY / 2
+    assert provider.cache["stale"] == 1
+
+def test_last_value_survives_an_upstream_outage():
+    state = {"up": True}
+
+    def flaky_api(method, path, body):
+        if state["up"]:
+            return 200, {"circulating_supply": "1000000", "price_usd": "0.5"}
+        return 503, {"error": "down"}
+
+    with FakeHTTPServer(flaky_api) as api:
+        provider = MarketCapProvider(ISSUER, CURRENCY, ttl=0.0, url=api.url)
+
+        async def run():
+            try:
+                await provider.get()
+                state["up"] = False
+                await provider.refresh()
+                return await provider.get()
+            finally:
+                await provider.stop()
+
+        assert asyncio.run(run()) == 500000.0
+
+def test_first_buy_does_not_wait_for_the_api(bot, monkeypatch):
+    monkeypatch.setattr(bot, "current_market_cap", ONLINE)
+    add_groups(bot, 1)
+    telegram = MockBot()
+
+    with FakeHTTPServer(slow_api) as api:
+        provider = MarketCapProvider(*NEIRO, url=api.url)
+        provider._client = httpx.AsyncClient(timeout=provider.timeout)  # see above
+        monkeypatch.setitem(bot.market_caps, NEIRO, provider)
+
+        async def run():
+            bot.start_pipeline(telegram)
+            try:
+                started_at = time.monotonic()
+                await bot.notify_groups(bot.handle_transaction(buy_frame(1)))
+                await wait_idle(bot)
+                elapsed = time.monotonic() - started_at
+                await provider.refresh()  # the lookup the first buy started
+                return elapsed, bot.current_market_cap(NEIRO)
+            finally:
+                await provider.stop()
+                await bot.pipeline.stop()
+
+        elapsed, market_cap = asyncio.run(run())
+
+    print(f"\nfirst buy notified in {elapsed * 1000:.0f} ms with a {API_DELAY * 1000:.0f} ms API")
+    assert telegram.calls == {"send_animation": 1}
+    assert elapsed < API_DELAY / 2
+    assert market_cap == 500000.0  # the next buys show it
+    assert len(api.requests) == 1
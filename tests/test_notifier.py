@@ -0,0 +1,108 @@
+"""Retry and rate-limit behaviour of the notifier."""
+import time
+import asyncio
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+import notifier
+from notifier import Notifier, Job, TokenBucket
+from fakes import FakeBotAPI
+
+def run_jobs(sends, global_rate=1000.0):
+    """Run one job per chat (chat_id -> send coroutine function) until all are done."""
+    scheduler = Notifier()
+    scheduler.global_bucket = TokenBucket(global_rate, global_rate)
+
+    async def run():
+        for chat_id, send in sends.items():
+            scheduler.submit(chat_id, Job(send))
+        await asyncio.gather(*scheduler._workers.values())
+
+    asyncio.run(run())
+    return scheduler
+
+def failing(error, times=None):
+    """A send raising `error` on every call, or only on the first `times` calls."""
+    calls = []
+
+    async def send(chat_id):
+        calls.append(time.monotonic())
+        if times is None or len(calls) <= times:
+            raise error
+    send.calls = calls
+    return send
+
+def test_permanent_errors_fail_without_retrying():
+    sends = {1: failing(BadRequest("Chat not found")), 2: failing(Forbidden("bot was kicked"))}
+    started_at = time.monotonic()
+    scheduler = run_jobs(sends)
+
+    assert time.monotonic() - started_at < 0.5
+    assert [len(send.calls) for send in sends.values()] == [1, 1]
+    assert scheduler.failed == 2
+    assert scheduler.retried == 0
+
+def test_timeouts_are_retried(monkeypatch):
+    monkeypatch.setattr(notifier.random, "uniform", lambda low, high: 0.01)
+    send = failing(TimedOut(), times=2)
+    scheduler = run_jobs({1: send})
+
+    assert len(send.calls) == 3
+    assert scheduler.sent == 1
+    assert scheduler.retried == 2
+
+def test_flood_wait_holds_back_every_chat():
+    events = []
+
+    async def flooded(chat_id):
+        if not events:
+            events.append(("flood", time.monotonic()))
+            raise RetryAfter(1)
+        events.append(("retry", time.monotonic()))
+
+    async def other(chat_id):
+        events.append(("other", time.monotonic()))
+
+    async def run():
+        scheduler = Notifier()
+        scheduler.global_bucket = TokenBucket(1000.0, 1000.0)
+        scheduler.submit(1, Job(flooded))
+        await asyncio.sleep(0.01)  # chat 1 hit the flood wait, now chat 2 has something to send
+        scheduler.submit(2, Job(other))
+        await asyncio.gather(*scheduler._workers.values())
+
+    asyncio.run(run())
+    times = dict(events)
+    assert times["other"] - times["flood"] >= 0.9
+    assert times["retry"] - times["flood"] >= 0.9
+
+def test_pauses_do_not_add_up():
+    bucket = TokenBucket(10.0, 10.0)
+    bucket.pause(1.0)
+    bucket.pause(1.0)
+    assert -10.5 < bucket.tokens <= -9.9
+
+def test_flood_wait_from_the_bot_api():
+    # A real 429 answer, through python-telegram-bot's request layer
+
+    async def run(api):
+        async with api.bot() as bot:
+            scheduler = Notifier()
+            scheduler.global_bucket = TokenBucket(1000.0, 1000.0)
+
+            async def send(chat_id):
+                await bot.send_message(chat_id=chat_id, text="buy")
+
+            scheduler.submit(1, Job(send))
+            while not api.flood_waits:
+                await asyncio.sleep(0.005)
+            scheduler.submit(2, Job(send))
+            await asyncio.gather(*scheduler._workers.values())
+            return scheduler
+
+    with FakeBotAPI(flooded={1: (1, 1)}) as api:
+        scheduler = asyncio.run(run(api))
+
+    [(_, flooded_at)] = api.flood_waits
+    sent_at = {int(params["chat_id"]): at for method, params, at in api.calls if method == "sendMessage"}
+    assert sent_at[1] - flooded_at >= 0.9  # redelivered once the wait is over
+    assert sent_at[2] - flooded_at >= 0.9  # and the other chat held back as well
+    assert (scheduler.sent, scheduler.retried, scheduler.failed) == (2, 1, 0)
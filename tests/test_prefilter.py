@@ -0,0 +1,71 @@
+"""The frame prefilter must skip work without ever changing which buys are found."""
+import time
+import pytest
+from conftest import NEIRO, add_groups, recorded_frames
+from routing import RoutingTable
+from stream import StreamState
+
+def classify(bot, frames, tmp_path, monkeypatch):
+    """Run the frames through handle_transaction with fresh dedup state, returning the buys."""
+    monkeypatch.setattr(bot, "stream_state", StreamState(str(tmp_path / "prefilter_state.json")))
+    buys = []
+    for frame in frames:
+        buy = bot.handle_transaction(frame)
+        if buy is not None:
+            buys.append((buy.tx["hash"], buy.token, buy.value, buy.xrp_spent, tuple(buy.chat_ids)))
+    return buys
+
+def test_prefilter_finds_the_same_buys(bot, tmp_path, monkeypatch):
+    add_groups(bot, 4)
+    frames = recorded_frames(200)
+
+    filtered = classify(bot, frames, tmp_path, monkeypatch)
+    monkeypatch.setattr(RoutingTable, "is_candidate", lambda self, frame: True)
+    unfiltered = classify(bot, frames, tmp_path, monkeypatch)
+
+    assert len(filtered) == 50
+    assert all(token == NEIRO for _, token, *_ in filtered)
+    assert filtered == unfiltered
+
+@pytest.mark.parametrize("prefilter", [True, False], ids=["prefilter", "full-decode"])
+def test_classify_throughput(bot, benchmark, tmp_path, monkeypatch, prefilter):
+    add_groups(bot, 4)
+    frames = recorded_frames(400)
+    if not prefilter:
+        monkeypatch.setattr(RoutingTable, "is_candidate", lambda self, frame: True)
+
+    cpu = []
+
+    def run():
+        started_at = time.process_time()
+        buys = classify(bot, frames, tmp_path, monkeypatch)
+        cpu.append(time.process_time() - started_at)
+        return buys
+
+    buys = benchmark(run)
+    per_frame = min(cpu) / len(frames)
+    if benchmark.stats:  # None under --benchmark-disable
+        benchmark.extra_info.update(frames_per_second=len(frames) / benchmark.stats.stats.min,
+                                    cpu_per_frame_us=per_frame * 1e6)
+        print(f"\n{len(frames) / benchmark.stats.stats.min:,.0f} frames/s, {per_frame * 1e6:.1f} µs CPU per frame")
+    assert len(buys) == 100
+
+def test_prefilter_saves_cpu_on_unrelated_frames(bot, tmp_path, monkeypatch):
+    add_groups(bot, 4)
+    # Only the unmonitored token and trust lines: all work the prefilter is meant to avoid
+    frames = [frame for index, frame in enumerate(recorded_frames(2000)) if index % 4 in (1, 2)]
+
+    def cpu_per_frame():
+        best = float("inf")
+        for _ in range(3):
+            started_at = time.process_time()
+            assert classify(bot, frames, tmp_path, monkeypatch) == []
+            best = min(best, time.process_time() - started_at)
+        return best / len(frames)
+
+    filtered = cpu_per_frame()
+    monkeypatch.setattr(RoutingTable, "is_candidate", lambda self, frame: True)
+    unfiltered = cpu_per_frame()
+
+    print(f"\nunrelated frames: {filtered * 1e6:.1f} µs CPU with the prefilter, {unfiltered * 1e6:.1f} µs without")
+    assert filtered < unfiltered / 2
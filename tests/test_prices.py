@@ -0,0 +1,58 @@
+"""Price and market cap derived from ledger metadata (amm.json)."""
+import json
+import copy
+import pytest
+from conftest import AMM_TX, NEIRO
+from market import PriceEngine
+
+POOL = "rLKR6nYny3a2i8TuJYvQE7FxotRvTwrbQL"  # the XRP/NEIRO AMM of amm.json
+
+def other_pool(meta, account, drops):
+    """amm.json's metadata with the NEIRO pool nodes moved to another AMM account holding `drops`."""
+    meta = json.loads(json.dumps(meta).replace(POOL, account))
+    for node in meta["AffectedNodes"]:
+        fields = node["ModifiedNode"]["FinalFields"]
+        if "AMMID" in fields:
+            fields["Balance"] = str(drops)
+    return meta
+
+def test_pool_and_market_cap_from_amm_json():
+    prices = PriceEngine()
+    neiro = prices.track(NEIRO)
+    neiro.supply = 1_000_000_000
+    prices.observe(AMM_TX["meta"], AMM_TX["ledger_index"])
+
+    assert neiro.amm_account == POOL
+    assert neiro.pool_xrp == pytest.approx(24793.793623)
+    assert neiro.pool_tokens == pytest.approx(12585220.92644813)
+    assert neiro.price() == pytest.approx(24793.793623 / 12585220.92644813)
+    assert neiro.market_cap_xrp() == pytest.approx(1_000_000_000 * 24793.793623 / 12585220.92644813)
+
+def test_token_token_pool_does_not_overwrite_the_xrp_pool():
+    prices = PriceEngine()
+    neiro = prices.track(NEIRO)
+    meta = copy.deepcopy(AMM_TX["meta"])
+    # A NEIRO/other-token AMM holds no XRP; it used to zero the XRP pool
+    meta["AffectedNodes"] += other_pool(AMM_TX["meta"], "rTokenTokenAMMxxxxxxxxxxxxxxxxxxx", 0)["AffectedNodes"]
+    prices.observe(meta, AMM_TX["ledger_index"])
+
+    assert neiro.amm_account == POOL
+    assert neiro.pool_xrp == pytest.approx(24793.793623)
+
+def test_pool_account_learned_from_amm_info_is_kept():
+    prices = PriceEngine()
+    neiro = prices.track(NEIRO)
+    neiro.update_pool(POOL, 24000.0, 12_000_000.0, AMM_TX["ledger_index"] - 1)
+    prices.observe(other_pool(AMM_TX["meta"], "rSomeOtherAMMxxxxxxxxxxxxxxxxxxxx", 5_000_000), AMM_TX["ledger_index"])
+
+    assert (neiro.amm_account, neiro.pool_xrp) == (POOL, 24000.0)
+    prices.observe(AMM_TX["meta"], AMM_TX["ledger_index"])
+    assert neiro.pool_xrp == pytest.approx(24793.793623)
+
+def test_backfilled_metadata_does_not_roll_the_pool_back():
+    prices = PriceEngine()
+    neiro = prices.track(NEIRO)
+    prices.observe(AMM_TX["meta"], AMM_TX["ledger_index"])
+    older = other_pool(AMM_TX["meta"], POOL, 1_000_000)
+    prices.observe(older, AMM_TX["ledger_index"] - 10)
+    assert neiro.pool_xrp == pytest.approx(24793.793623)
@@ -0,0 +1,105 @@
+"""Reconnects and restarts must neither lose nor repeat a buy."""
+import json
+import time
+import asyncio
+import connection
+import notifier
+import stream
+from conftest import AMM_TX, add_groups, buy_frame, buy_tx, wait_idle
+from connection import ConnectionManager
+from fakes import FakeRippled
+from replay import MockBot
+from stream import SubscriptionManager
+
+FIRST_LEDGER = AMM_TX["ledger_index"]
+GROUPS = 3
+
+def ledger_closed(ledger_index):
+    return json.dumps({"type": "ledgerClosed", "ledger_index": ledger_index, "txn_count": 1})
+
+def live(buys):
+    """Stream frames of one buy per ledger, each ledger announced before its transactions."""
+    frames = []
+    for index in buys:
+        frames += [ledger_closed(FIRST_LEDGER + index), buy_frame(index, FIRST_LEDGER + index)]
+    return frames
+
+def account_tx_entry(index):
+    tx = buy_tx(index, FIRST_LEDGER + index)
+    meta = tx.pop("meta")
+    tx.pop("validated", None)
+    return {"tx": tx, "meta": meta, "validated": True}
+
+def start(bot, monkeypatch, url, telegram):
+    """Run the bot's stream, pipeline and notifier against the fake node and Bot."""
+    dispatched = []
+
+    async def dispatch(buy):
+        dispatched.append(buy.tx["hash"])
+        await bot.dispatch_buy(buy)
+
+    monkeypatch.setattr(bot, "subscriptions", SubscriptionManager())
+    monkeypatch.setattr(bot, "connections", ConnectionManager([url], bot.pipeline.push))
+    monkeypatch.setattr(bot, "ws_task", None)
+    bot.notifier.attach(telegram, bot.send_summary)
+    bot.pipeline.start(bot.handle_transaction, dispatch, bot.classify_ledger)
+    bot.start_stream()
+    return dispatched
+
+async def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not met")
+        await asyncio.sleep(0.01)
+
+def test_reconnect_backfills_the_gap_exactly_once(bot, monkeypatch):
+    monkeypatch.setattr(connection, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(stream, "BACKFILL_PAGE_LIMIT", 2)
+    monkeypatch.setattr(stream, "BACKFILL_PAGE_DELAY", 0.0)
+    add_groups(bot, GROUPS)
+    telegram = MockBot()
+
+    # Buys 5-7 are validated while the connection is down, 4 and 8-10 arrive both live and backfilled
+    sessions = [live(range(1, 5)), live(range(8, 11))]
+    history = [account_tx_entry(index) for index in range(1, 11)]
+
+    async def run():
+        async with FakeRippled(sessions, history, validated=FIRST_LEDGER + 10) as node:
+            dispatched = start(bot, monkeypatch, node.url, telegram)
+            # Ledgers 4-10 hold 7 buys, 2 per page
+            pages = lambda: [request for request in node.requests if request["command"] == "account_tx"]
+            await wait_for(lambda: len(set(dispatched)) == 10 and len(pages()) == 4)
+            await wait_idle(bot)
+            await bot.post_stop(None)
+            await bot.pipeline.stop()
+            return dispatched, node.requests
+
+    dispatched, requests = asyncio.run(run())
+
+    assert sorted(dispatched) == sorted(buy_tx(index)["hash"] for index in range(1, 11))
+    assert telegram.calls["send_animation"] == 10 * GROUPS
+    assert [request["command"] for request in requests].count("subscribe") == 2
+    # Backfill resumes after the last complete ledger (3) and pages with markers
+    pages = [request for request in requests if request["command"] == "account_tx"]
+    assert pages[0]["ledger_index_min"] == FIRST_LEDGER + 4
+    assert len(pages) == 4
+
+def test_shutdown_delivers_buys_already_marked_seen(bot, monkeypatch):
+    monkeypatch.setattr(notifier, "DIGEST_BACKLOG", 100)  # one message per buy, however slow Telegram is
+    add_groups(bot, GROUPS)
+    telegram = MockBot(delay=0.05)
+
+    async def run():
+        bot.notifier.attach(telegram, bot.send_summary)
+        bot.pipeline.start(bot.handle_transaction, bot.dispatch_buy)
+        for index in range(1, 6):
+            bot.pipeline.push(buy_frame(index))
+        await bot.post_stop(None)
+        await bot.pipeline.stop()
+
+    asyncio.run(run())
+
+    assert all(bot.stream_state.is_seen(buy_tx(index)["hash"]) for index in range(1, 6))
+    assert telegram.calls["send_animation"] == 5 * GROUPS
+    assert bot.notifier.pending() == 0
@@ -0,0 +1,96 @@
+"""Replay benchmarks: recorded frames through the whole bot against a mock Bot.
+
+The thresholds are regression gates with plenty of headroom, not targets.
+"""
+import gzip
+import json
+import asyncio
+import tracemalloc
+import pytest
+import replay
+from aggregate import Aggregator
+from board import Boards
+from conftest import NEIRO, add_groups, recorded_frames
+from notifier import Notifier
+from pipeline import Pipeline
+from stream import StreamState
+
+FRAMES = 2000
+BUYS = FRAMES // 4  # recorded_frames() has a NEIRO buy every 4th frame
+
+def write_recording(path, frames, interval=0.0):
+    """A recording as XRPL_RECORD_FILE writes it, one frame every `interval` seconds."""
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        for index, frame in enumerate(frames):
+            file.write(json.dumps({"t": 1_700_000_000 + index * interval, "frame": frame}) + "\n")
+    return str(path)
+
+@pytest.fixture
+def recording(tmp_path):
+    return write_recording(tmp_path / "frames.jsonl.gz", recorded_frames(FRAMES))
+
+def fresh_run_state(bot, monkeypatch, tmp_path):
+    """Empty queues and dedup state, so every round replays the same buys."""
+    for name, value in {"pipeline": Pipeline(), "notifier": Notifier(), "aggregator": Aggregator(),
+                        "boards": Boards(), "stream_state": StreamState(str(tmp_path / "replay_state.json"))}.items():
+        monkeypatch.setattr(bot, name, value)
+
+def assert_delivered(stats, groups):
+    """Every buy was classified and every group notified, one by one or (a burst) in a summary."""
+    assert stats["buys"] == BUYS
+    assert stats["pipeline"]["dispatch"]["dropped"] == 0
+    assert stats["failed"] == 0
+    assert stats["sent"] == sum(stats["calls"].values()) >= groups
+
+def test_replay_throughput(bot, benchmark, monkeypatch, tmp_path, recording):
+    add_groups(bot, 16)
+    stats = benchmark.pedantic(lambda: asyncio.run(replay.run(recording)), rounds=3,
+                               setup=lambda: fresh_run_state(bot, monkeypatch, tmp_path))
+
+    frames_per_second = stats["frames"] / stats["elapsed"]
+    cpu_per_frame = stats["cpu"] / stats["frames"]
+    benchmark.extra_info.update(frames_per_second=frames_per_second, cpu_per_frame_us=cpu_per_frame * 1e6)
+    print(f"\n{frames_per_second:,.0f} frames/s, {cpu_per_frame * 1e6:.0f} µs CPU per frame")
+    assert stats["frames"] == FRAMES
+    assert stats["pipeline"]["classify"]["processed"] == FRAMES
+    assert_delivered(stats, 16)
+    assert frames_per_second > 500
+    assert cpu_per_frame < 0.002
+
+@pytest.mark.parametrize("groups", [1, 16, 128])
+def test_notification_latency_by_group_count(bot, tmp_path, groups):
+    add_groups(bot, groups)
+    # One buy every 40 ms, answered by "Telegram" in 20 ms
+    path = write_recording(tmp_path / "paced.jsonl.gz", recorded_frames(120), interval=0.01)
+    stats = asyncio.run(replay.run(path, speed=1.0, delay=0.02))
+
+    latency = stats["latency"]
+    print(f"\n{groups:3d} groups: p50 {latency[0.5] * 1000:.0f} ms, p95 {latency[0.95] * 1000:.0f} ms, "
+          f"p99 {latency[0.99] * 1000:.0f} ms")
+    assert stats["calls"] == {"send_animation": 30 * groups}
+    assert latency[0.99] < 0.1
+
+def test_batch_replay_finds_the_same_buys(bot, monkeypatch, tmp_path, recording):
+    add_groups(bot, 4)
+    recorded = lambda: bot.history.get_stats(NEIRO).summary(10 ** 9)["count"]
+    for batch in (False, True):
+        with monkeypatch.context() as patch:
+            fresh_run_state(bot, patch, tmp_path)
+            before = recorded()
+            stats = asyncio.run(replay.run(recording, batch=batch))
+        assert stats["pipeline"]["classify"]["processed"] == FRAMES
+        assert_delivered(stats, 4)
+        assert recorded() - before == BUYS
+
+def test_replay_memory(bot, recording):
+    add_groups(bot, 16)
+    tracemalloc.start()
+    try:
+        stats = asyncio.run(replay.run(recording))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    print(f"\npeak traced memory replaying {FRAMES} frames: {peak / 2 ** 20:.1f} MB")
+    assert_delivered(stats, 16)
+    assert peak < 32 * 2 ** 20
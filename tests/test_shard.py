@@ -0,0 +1,90 @@
+"""Sharded deployment end to end: this process ingests, two BuyBot.py workers send.
+
+The ingest side publishes over the built-in Unix socket broker; each worker
+consumes its shard of the hash ring and talks to the fake Bot API.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import subprocess
+import httpx
+from conftest import ROOT, add_groups, buy_frame, wait_idle
+from fakes import FakeBotAPI
+from replay import MockBot
+from shard import ShardRing, SocketBroker
+
+GROUPS = 20
+SHARDS = 2
+
+def port_free(port):
+    with socket.socket() as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+def free_ports(count):
+    """A free port with the `count` ports after it free as well."""
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            base = sock.getsockname()[1]
+        if base + count < 65536 and all(port_free(base + offset) for offset in range(1, count + 1)):
+            return base
+
+def start_worker(shard, api, broker, metrics_port):
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "BuyBot.py")], env={
+        **os.environ, "BOT_ROLE": "worker", "SHARD_ID": str(shard), "SHARD_COUNT": str(SHARDS),
+        "SHARD_BROKER": f"unix://{broker.path}", "TELEGRAM_API_URL": f"{api.url}/bot",
+        "METRICS_PORT": str(metrics_port),
+    })
+
+async def notified(api, count, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while len(api.calls_to("sendAnimation")) < count:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{len(api.calls_to('sendAnimation'))} of {count} groups notified")
+        await asyncio.sleep(0.05)
+
+def test_each_group_is_notified_once_across_workers(bot, monkeypatch, tmp_path):
+    chat_ids = add_groups(bot, GROUPS)
+    ring = ShardRing(SHARDS)
+    assert {ring.shard(chat_id) for chat_id in chat_ids} == set(range(SHARDS))
+    broker = SocketBroker(str(tmp_path / "broker.sock"))
+    monkeypatch.setattr(bot, "broker", broker)
+    monkeypatch.setattr(bot, "shard_ring", ring)
+    metrics_port = free_ports(SHARDS)
+
+    async def run(api):
+        await broker.start()
+        workers = [start_worker(shard, api, broker, metrics_port) for shard in range(SHARDS)]
+        try:
+            bot.start_pipeline(MockBot())
+            await bot.pipeline.feed(buy_frame(1))
+            await wait_idle(bot)
+            await notified(api, GROUPS)
+            await asyncio.sleep(0.5)  # Room for any duplicate to show up
+            # Both workers serve metrics, each on its own port after the ingest one
+            async with httpx.AsyncClient() as client:
+                return [(await client.get(f"http://127.0.0.1:{metrics_port + shard + 1}/metrics")).status_code
+                        for shard in range(SHARDS)]
+        finally:
+            for worker in workers:
+                worker.send_signal(signal.SIGINT)
+            for worker in workers:
+                try:
+                    await asyncio.to_thread(worker.wait, 10)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+            await bot.pipeline.stop()
+            await broker.close()
+
+    with FakeBotAPI() as api:
+        assert asyncio.run(run(api)) == [200] * SHARDS
+    sent = [int(params["chat_id"]) for params in api.calls_to("sendAnimation")]
+    assert sorted(sent) == sorted(chat_ids)
+    assert broker.dropped == 0
@@ -0,0 +1,120 @@
+"""Command round trips: an update reaching the bot by webhook and by long polling.
+
+Both run the real Application against the fake Bot API; a round trip lasts
+from the update being available to the bot's reply reaching "Telegram".
+"""
+import time
+import json
+import socket
+import asyncio
+import statistics
+import httpx
+import pytest
+from fakes import FakeBotAPI
+
+pytest.importorskip("tornado")  # the webhooks extra of python-telegram-bot
+
+COMMANDS = 20
+CHAT_ID = 42
+SECRET = "webhook-secret"
+ALLOWED = ["message", "chat_member", "my_chat_member"]
+
+def help_command(update_id):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": "/help",
+        "chat": {"id": CHAT_ID, "type": "private"},
+        "from": {"id": CHAT_ID, "is_bot": False, "first_name": "User"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+    }}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def replied(api, count, timeout=5.0):
+    """Wait for the count-th reply; returns the time it reached the fake API."""
+    deadline = time.monotonic() + timeout
+    while True:
+        replies = [at for method, _, at in api.calls if method == "sendMessage"]
+        if len(replies) >= count:
+            return replies[count - 1]
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"no reply to command {count}")
+        await asyncio.sleep(0.001)
+
+async def post(client, port, update, secret=SECRET):
+    return await client.post(f"http://127.0.0.1:{port}/telegram", json=update,
+                             headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+async def run_bot(bot, api, webhook, work):
+    """Run the bot's Application like main() does, by webhook or polling, around work(port)."""
+    application = bot.build_application()
+    port = free_port()
+    async with application:
+        if webhook:
+            await application.updater.start_webhook(
+                listen="127.0.0.1", port=port, url_path="telegram", webhook_url="https://bot.example.com/telegram",
+                secret_token=SECRET, allowed_updates=bot.ALLOWED_UPDATES
+            )
+        else:
+            await application.updater.start_polling(allowed_updates=bot.ALLOWED_UPDATES)
+        await application.start()
+        try:
+            return await work(port)
+        finally:
+            await application.updater.stop()
+            await application.stop()
+
+def round_trips(bot, api, webhook):
+    """Send COMMANDS /help commands one after another; returns their round trip times."""
+    async def work(port):
+        times = []
+        async with httpx.AsyncClient() as client:
+            for update_id in range(1, COMMANDS + 1):
+                started_at = time.monotonic()
+                if webhook:
+                    assert (await post(client, port, help_command(update_id))).status_code == 200
+                else:
+                    api.push_update(help_command(update_id))
+                times.append(await replied(api, update_id) - started_at)
+        return times
+
+    return asyncio.run(run_bot(bot, api, webhook, work))
+
+def report(mode, times):
+    print(f"\n{mode}: p50 {statistics.median(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms")
+
+@pytest.fixture
+def api(bot, monkeypatch):
+    with FakeBotAPI() as api:
+        monkeypatch.setattr(bot, "TELEGRAM_API_URL", f"{api.url}/bot")
+        yield api
+
+def test_webhook_round_trip(bot, api):
+    times = round_trips(bot, api, webhook=True)
+
+    report("webhook", times)
+    [webhook] = api.calls_to("setWebhook")
+    assert webhook["secret_token"] == SECRET
+    assert json.loads(webhook["allowed_updates"]) == ALLOWED
+    assert not api.calls_to("getUpdates")
+    assert statistics.median(times) < 0.5
+
+def test_polling_round_trip(bot, api):
+    times = round_trips(bot, api, webhook=False)
+
+    report("polling", times)
+    polls = [params for params in api.calls_to("getUpdates") if "allowed_updates" in params]
+    assert polls and all(json.loads(params["allowed_updates"]) == ALLOWED for params in polls)
+    assert statistics.median(times) < 0.5
+
+def test_webhook_rejects_a_wrong_secret(bot, api):
+    async def forged(port):
+        async with httpx.AsyncClient() as client:
+            response = await post(client, port, help_command(1), secret="guess")
+        await asyncio.sleep(0.1)
+        return response.status_code
+
+    assert asyncio.run(run_bot(bot, api, True, forged)) == 403
+    assert not api.calls_to("sendMessage")